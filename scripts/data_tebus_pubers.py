@@ -1,13 +1,13 @@
 import os
-import io
 import json
 import pandas as pd
-import gspread
-import re
-import time
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
+from drive_download import download_folder_files
+from excel_snapshot import read_excel_snapshot
+from nik_cleaner import clean_nik_series, print_nik_report
+from rate_limiter import print_rate_limit_report
+from incremental_sheet import write_sheet_incremental
 from datetime import datetime
 import traceback
 import smtplib
@@ -68,29 +68,7 @@ credentials = Credentials.from_service_account_info(
     ],
 )
 
-gc = gspread.authorize(credentials)
-drive_service = build("drive", "v3", credentials=credentials)
-
-# ============================
-# FUNGSI BERSIHKAN NIK
-# ============================
-def clean_nik(nik_value):
-    """
-    Membersihkan NIK dari karakter non-angka seperti ', `, spasi, dll.
-    Hanya mengambil angka saja.
-    """
-    if pd.isna(nik_value) or nik_value is None:
-        return None
-
-    # Convert ke string dan hilangkan semua karakter non-digit
-    nik_str = str(nik_value)
-    cleaned_nik = re.sub(r'\D', '', nik_str)  # \D = non-digit
-
-    # Validasi panjang NIK (biasanya 16 digit)
-    if len(cleaned_nik) != 16:
-        print(f"⚠️  NIK tidak standar: {nik_value} -> {cleaned_nik} (panjang: {len(cleaned_nik)})")
-
-    return cleaned_nik if cleaned_nik else None
+sheets_service = build('sheets', 'v4', credentials=credentials, cache_discovery=False)
 
 # ============================
 # FUNGSI KONVERSI TANGGAL
@@ -117,27 +95,69 @@ def parse_tanggal_tebus(tanggal_str):
                 print(f"⚠️  Format tanggal tidak dikenali: {tanggal_str}")
                 return None
 
+# ============================
+# FUNGSI KONVERSI TANGGAL PER KOLOM
+# ============================
+def parse_kolom_tanggal_tebus(tanggal_series):
+    """
+    Mengonversi seluruh kolom TGL TEBUS menjadi datetime sekaligus.
+    Setiap nilai unik cukup diparse satu kali (tanggal tebus sangat berulang).
+    """
+    tanggal_unik = pd.unique(tanggal_series)
+    hasil_parse = {tanggal: parse_tanggal_tebus(tanggal) for tanggal in tanggal_unik if not pd.isna(tanggal)}
+    return pd.to_datetime(tanggal_series.map(hasil_parse))
+
 # ============================
 # FUNGSI URUTKAN DATA BERDASARKAN BULAN DAN TANGGAL
 # ============================
-def urutkan_data_per_nik(group):
+def urutkan_data_per_nik(data):
     """
-    Mengurutkan data dalam group NIK berdasarkan bulan (Jan-Des) dan tanggal
+    Mengurutkan seluruh data berdasarkan NIK lalu tanggal tebus (Jan-Des).
+    Data dengan tanggal tidak valid dibuang, urutan file dipertahankan untuk tanggal yang sama.
     """
-    # Tambahkan kolom bulan dan datetime untuk sorting
-    group = group.copy()
-    group['TGL_TEBS_DATETIME'] = group['TGL TEBUS'].apply(parse_tanggal_tebus)
-    
+    data = data.copy()
+    data['TGL_TEBS_DATETIME'] = parse_kolom_tanggal_tebus(data['TGL TEBUS'])
+
     # Hapus data dengan tanggal tidak valid
-    group = group[group['TGL_TEBS_DATETIME'].notna()]
-    
-    if len(group) == 0:
-        return group
-    
-    # Urutkan berdasarkan datetime
-    group = group.sort_values('TGL_TEBS_DATETIME')
-    
-    return group
+    data = data[data['TGL_TEBS_DATETIME'].notna()]
+
+    return data.sort_values(['NIK', 'TGL_TEBS_DATETIME'], kind='mergesort')
+
+# ============================
+# FUNGSI REKAP PER NIK
+# ============================
+def kolom_teks(series):
+    """Kolom sebagai teks seperti hasil f-string (NaN -> 'nan')"""
+    return series.fillna('nan').astype(str)
+
+def buat_rekap_per_nik(combined):
+    """
+    Membuat rekap teks transaksi per NIK (kolom NIK, Nama, Data).
+    Baris teks dibentuk per kolom lalu digabung per NIK dengan satu groupby.
+    """
+    semua_nik = combined.groupby("NIK").size().index
+    data = urutkan_data_per_nik(combined)
+
+    nomor = data.groupby("NIK").cumcount() + 1
+    text = (
+        nomor.astype(str) + ") " + kolom_teks(data['NAMA PETANI']) + " Tgl Tebus " + kolom_teks(data['TGL TEBUS'])
+        + " No Transaksi " + kolom_teks(data['NO TRANSAKSI']) + " Kios " + kolom_teks(data['NAMA KIOS'])
+        + ", Kecamatan " + kolom_teks(data['KECAMATAN'])
+        + ", Urea " + kolom_teks(data['UREA']) + " kg, NPK " + kolom_teks(data['NPK'])
+        + " kg, SP36 " + kolom_teks(data['SP36']) + " kg, ZA " + kolom_teks(data['ZA'])
+        + " kg, NPK Formula " + kolom_teks(data['NPK FORMULA'])
+        + " kg, Organik " + kolom_teks(data['ORGANIK']) + " kg, Organik Cair " + kolom_teks(data['ORGANIK CAIR'])
+        + " kg, Status " + kolom_teks(data['STATUS'])
+    )
+
+    data_per_nik = text.groupby(data['NIK']).agg("\n".join).reindex(semua_nik, fill_value="")
+    nama_per_nik = data.drop_duplicates("NIK").set_index("NIK")['NAMA PETANI'].reindex(semua_nik, fill_value="")
+
+    return pd.DataFrame({
+        "NIK": semua_nik.tolist(),
+        "Nama": nama_per_nik.tolist(),
+        "Data": data_per_nik.tolist()
+    }, columns=["NIK", "Nama", "Data"])
 
 # ============================
 # FUNGSI KIRIM EMAIL
@@ -198,86 +218,28 @@ def send_email_notification(subject, message, is_success=True):
 # DOWNLOAD FILE EXCEL DARI DRIVE
 # ============================
 def download_excel_files(folder_id, save_folder=SAVE_FOLDER):
-    os.makedirs(save_folder, exist_ok=True)
-    query = f"'{folder_id}' in parents and (mimeType='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet' or mimeType='application/vnd.ms-excel')"
-    results = drive_service.files().list(q=query, fields="files(id, name)").execute()
-    files = results.get("files", [])
+    files = download_folder_files(credentials, folder_id, save_folder)
 
     if not files:
         raise ValueError("Tidak ada file Excel di folder Google Drive.")
 
-    paths = []
-    for f in files:
-        request = drive_service.files().get_media(fileId=f["id"])
-        fh = io.FileIO(os.path.join(save_folder, f["name"]), "wb")
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while not done:
-            _, done = downloader.next_chunk()
-        paths.append(os.path.join(save_folder, f["name"]))
-    return paths
+    return [file_info['path'] for file_info in files]
 
 # ============================
 # FUNGSI UNTUK MENULIS DATA KE GOOGLE SHEETS (DIPERBAIKI)
 # ============================
-def write_to_google_sheet(worksheet, dataframe):
+def write_to_google_sheet(spreadsheet_id, sheet_name, dataframe):
     """
-    Menulis DataFrame ke Google Sheets dengan metode chunking untuk menghindari error API
+    Menulis DataFrame ke Google Sheets secara inkremental: hanya baris NIK yang
+    berubah/baru/hilang sejak publish sebelumnya yang ditulis (lihat incremental_sheet.py)
     """
     try:
         print(f"📤 Menulis {len(dataframe)} baris data ke Google Sheets...")
+        print(f"📦 Ukuran data: {len(dataframe) + 1} baris x {len(dataframe.columns)} kolom")
         
-        # 1. Clear worksheet terlebih dahulu
-        print("🧹 Membersihkan data lama di sheet...")
-        worksheet.clear()
-        
-        # 2. Konversi DataFrame menjadi list of lists (format API)
-        data_to_update = [dataframe.columns.values.tolist()] + dataframe.values.tolist()
-        total_rows_to_write = len(data_to_update)
-        
-        print(f"📦 Ukuran data: {total_rows_to_write} baris x {len(dataframe.columns)} kolom")
-        
-        # 3. Tentukan ukuran chunk yang aman (10,000 baris per request)
-        CHUNK_SIZE = 10000
-        chunk_count = (total_rows_to_write + CHUNK_SIZE - 1) // CHUNK_SIZE  # Pembulatan ke atas
-        
-        print(f"🔀 Membagi data menjadi {chunk_count} chunk...")
-        
-        # 4. Tulis data per chunk dengan jeda antar chunk
-        for chunk_index in range(chunk_count):
-            start_row = chunk_index * CHUNK_SIZE
-            end_row = min(start_row + CHUNK_SIZE, total_rows_to_write)
-            
-            # Ambil potongan data untuk chunk ini
-            current_chunk = data_to_update[start_row:end_row]
-            
-            # Tentukan sel awal untuk chunk ini (A1, A10001, A20001, dst.)
-            start_cell = f'A{start_row + 1}'
-            
-            print(f"   📄 Menulis chunk {chunk_index + 1}/{chunk_count}: baris {start_row + 1}-{end_row}...")
-            
-            try:
-                # Gunakan update sederhana dengan value_input_option
-                worksheet.update(start_cell, current_chunk, value_input_option='USER_ENTERED')
-                
-                # Tambahkan jeda singkat ANTAR CHUNK untuk menghindari beban API berlebihan
-                if chunk_index < chunk_count - 1:  # Jangan tunggu di chunk terakhir
-                    time.sleep(2)  # Jeda 2 detik antara chunk
-                    
-            except Exception as chunk_error:
-                print(f"❌ Error pada chunk {chunk_index + 1}: {str(chunk_error)}")
-                print("🔄 Mencoba lagi dengan jeda yang lebih lama...")
-                
-                # Coba sekali lagi dengan jeda lebih lama
-                time.sleep(5)
-                try:
-                    worksheet.update(start_cell, current_chunk, value_input_option='USER_ENTERED')
-                    print(f"✅ Chunk {chunk_index + 1} berhasil pada percobaan kedua")
-                except Exception as retry_error:
-                    print(f"❌ Gagal lagi pada chunk {chunk_index + 1}: {str(retry_error)}")
-                    raise retry_error
+        write_sheet_incremental(sheets_service, spreadsheet_id, sheet_name, dataframe, key_columns=['NIK'])
         
-        print(f"✅ Semua data berhasil ditulis! Total {total_rows_to_write} baris.")
+        print(f"✅ Semua data berhasil ditulis! Total {len(dataframe) + 1} baris.")
         return True
         
     except Exception as e:
@@ -314,7 +276,7 @@ def main():
             print(f"🔄 Memproses file {file_count}/{len(excel_files)}: {filename}")
             
             try:
-                df = pd.read_excel(fpath, dtype=str)
+                df = read_excel_snapshot(fpath, dtype=str)
             except Exception as e:
                 print(f"   ❌ Gagal membaca file: {str(e)}")
                 log.append(f"- {filename}: GAGAL DIBACA - {str(e)}")
@@ -329,12 +291,14 @@ def main():
             # Simpan original dan bersihkan NIK
             original_nik_count = len(df)
             df['NIK_ORIGINAL'] = df['NIK']
-            df['NIK'] = df['NIK'].apply(clean_nik)
+            df['NIK'], nik_report = clean_nik_series(df['NIK'])
+            print_nik_report(nik_report)
 
             # Log NIK yang dibersihkan
             cleaned_niks = df[df['NIK_ORIGINAL'] != df['NIK']][['NIK_ORIGINAL', 'NIK']]
-            for _, row in cleaned_niks.iterrows():
-                nik_cleaning_log.append(f"'{row['NIK_ORIGINAL']}' -> {row['NIK']}")
+            nik_cleaning_log.extend(
+                f"'{original}' -> {nik}" for original, nik in zip(cleaned_niks['NIK_ORIGINAL'], cleaned_niks['NIK'])
+            )
 
             # Hapus baris dengan NIK kosong
             df = df[df['NIK'].notna()]
@@ -371,33 +335,8 @@ def main():
 
         # 5. Rekap per NIK dengan urutan bulan dan tanggal
         print("🔄 Membuat rekap per NIK...")
-        output_rows = []
-        
-        unique_nik_count = 0
-        for nik, group in combined.groupby("NIK"):
-            unique_nik_count += 1
-            
-            # Urutkan data dalam group
-            group_sorted = urutkan_data_per_nik(group)
-            
-            list_info = []
-            for i, (_, row) in enumerate(group_sorted.iterrows(), start=1):
-                tgl_tebus = row['TGL TEBUS']
-                
-                text = (
-                    f"{i}) {row['NAMA PETANI']} Tgl Tebus {tgl_tebus} "
-                    f"No Transaksi {row['NO TRANSAKSI']} Kios {row['NAMA KIOS']}, Kecamatan {row['KECAMATAN']}, "
-                    f"Urea {row['UREA']} kg, NPK {row['NPK']} kg, SP36 {row['SP36']} kg, "
-                    f"ZA {row['ZA']} kg, NPK Formula {row['NPK FORMULA']} kg, "
-                    f"Organik {row['ORGANIK']} kg, Organik Cair {row['ORGANIK CAIR']} kg, "
-                    f"Status {row['STATUS']}"
-                )
-                list_info.append(text)
-            
-            nama_petani = group_sorted['NAMA PETANI'].iloc[0] if len(group_sorted) > 0 else ""
-            output_rows.append([nik, nama_petani, "\n".join(list_info)])
-
-        out_df = pd.DataFrame(output_rows, columns=["NIK", "Nama", "Data"])
+        out_df = buat_rekap_per_nik(combined)
+        unique_nik_count = len(out_df)
         print(f"✅ Rekap selesai: {unique_nik_count} NIK unik ditemukan")
 
         # 6. Tulis ke Google Sheet (DENGAN FUNGSI BARU)
@@ -406,23 +345,9 @@ def main():
         print("📤 MENULIS DATA KE GOOGLE SHEETS")
         print("=" * 60)
         
-        sh = gc.open_by_key(SPREADSHEET_ID)
-        
-        # Cek atau buat worksheet
-        try:
-            ws = sh.worksheet(SHEET_NAME)
-            print(f"✅ Sheet '{SHEET_NAME}' ditemukan")
-        except gspread.exceptions.WorksheetNotFound:
-            print(f"⚠️  Sheet '{SHEET_NAME}' tidak ditemukan, membuat baru...")
-            ws = sh.add_worksheet(
-                title=SHEET_NAME, 
-                rows=max(1000, len(out_df) + 100), 
-                cols=len(out_df.columns)
-            )
-            print(f"✅ Sheet '{SHEET_NAME}' berhasil dibuat")
-        
-        # Tulis data dengan fungsi yang sudah diperbaiki
-        write_to_google_sheet(ws, out_df)
+        # Sheet dibuat otomatis jika belum ada
+        write_to_google_sheet(SPREADSHEET_ID, SHEET_NAME, out_df)
+        print_rate_limit_report()
 
         # 7. Buat laporan sukses
         print()
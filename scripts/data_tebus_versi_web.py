@@ -10,18 +10,17 @@ import os
 import sys
 import pandas as pd
 import gspread
-import re
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
+from drive_download import download_folder_files
+from excel_snapshot import read_excel_snapshot
+from nik_cleaner import clean_nik_series, print_nik_report
 from gspread_dataframe import set_with_dataframe
 from datetime import datetime
 import traceback
 import json
-import io
 
 # ============================
 # KONFIGURASI
@@ -68,27 +67,6 @@ def load_email_config():
         "recipient_emails": recipient_list
     }
 
-# ============================
-# FUNGSI BERSIHKAN NIK
-# ============================
-def clean_nik(nik_value):
-    """
-    Membersihkan NIK dari karakter non-angka seperti ', `, spasi, dll.
-    Hanya mengambil angka saja.
-    """
-    if pd.isna(nik_value) or nik_value is None:
-        return None
-    
-    # Convert ke string dan hilangkan semua karakter non-digit
-    nik_str = str(nik_value)
-    cleaned_nik = re.sub(r'\D', '', nik_str)  # \D = non-digit
-    
-    # Validasi panjang NIK (biasanya 16 digit)
-    if len(cleaned_nik) != 16:
-        print(f"⚠️  NIK tidak standar: {nik_value} -> {cleaned_nik} (panjang: {len(cleaned_nik)})")
-    
-    return cleaned_nik if cleaned_nik else None
-
 # ============================
 # FUNGSI KIRIM EMAIL
 # ============================
@@ -168,32 +146,10 @@ def download_excel_files(folder_id, save_folder="data_web"):
         scopes=["https://www.googleapis.com/auth/drive"]
     )
     
-    drive_service = build('drive', 'v3', credentials=credentials)
-    
-    # Query untuk mencari file Excel
-    query = f"'{folder_id}' in parents and (mimeType='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet' or mimeType='application/vnd.ms-excel')"
-    results = drive_service.files().list(q=query, fields="files(id, name)").execute()
-    files = results.get("files", [])
+    paths = download_folder_files(credentials, folder_id, save_folder)
 
-    if not files:
+    if not paths:
         raise ValueError("❌ Tidak ada file Excel di folder Google Drive.")
-
-    paths = []
-    for f in files:
-        print(f"📥 Downloading: {f['name']}")
-        request = drive_service.files().get_media(fileId=f["id"])
-        file_path = os.path.join(save_folder, f["name"])
-        
-        with io.FileIO(file_path, 'wb') as fh:
-            downloader = MediaIoBaseDownload(fh, request)
-            done = False
-            while not done:
-                _, done = downloader.next_chunk()
-        
-        paths.append({
-            'path': file_path,
-            'name': f['name']
-        })
     
     print(f"✅ Berhasil download {len(paths)} file Excel")
     return paths
@@ -251,17 +207,19 @@ def process_data_for_web():
             print(f"\n📖 Memproses: {filename}")
             
             try:
-                df = pd.read_excel(fpath, dtype=str)  # pastikan NIK terbaca full string
+                df = read_excel_snapshot(fpath, dtype=str)  # pastikan NIK terbaca full string
                 
                 # PROSES BERSIHKAN NIK
                 original_nik_count = len(df)
                 df['NIK_ORIGINAL'] = df['NIK']  # Simpan nilai asli untuk logging
-                df['NIK'] = df['NIK'].apply(clean_nik)
+                df['NIK'], nik_report = clean_nik_series(df['NIK'])
+                print_nik_report(nik_report)
                 
                 # Log NIK yang dibersihkan
                 cleaned_niks = df[df['NIK_ORIGINAL'] != df['NIK']][['NIK_ORIGINAL', 'NIK']]
-                for _, row in cleaned_niks.iterrows():
-                    nik_cleaning_log.append(f"'{row['NIK_ORIGINAL']}' -> {row['NIK']}")
+                nik_cleaning_log.extend(
+                    f"'{original}' -> {nik}" for original, nik in zip(cleaned_niks['NIK_ORIGINAL'], cleaned_niks['NIK'])
+                )
                 
                 # Hapus baris dengan NIK kosong setelah cleaning
                 df = df[df['NIK'].notna()]
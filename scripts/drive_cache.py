@@ -0,0 +1,175 @@
+"""
+drive_cache.py
+Cache lokal persisten untuk file Google Drive.
+File disimpan berdasarkan md5Checksum (atau id + modifiedTime untuk Google
+Sheets), sehingga file yang tidak berubah cukup dicek lewat files().list
+tanpa download ulang. Cache dibatasi ukuran dan umur (LRU) dan foldernya
+dapat di-restore antar run GitHub Actions (actions/cache).
+
+Lokasi: verval-pupuk2/scripts/drive_cache.py
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+# ============================
+# KONFIGURASI
+# ============================
+DEFAULT_CACHE_DIR = os.path.normpath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".drive_cache")
+)
+CACHE_DIR = os.getenv("DRIVE_CACHE_DIR", DEFAULT_CACHE_DIR)
+CACHE_MAX_BYTES = int(float(os.getenv("DRIVE_CACHE_MAX_MB", "1024")) * 1024 * 1024)
+CACHE_MAX_AGE_DAYS = float(os.getenv("DRIVE_CACHE_MAX_AGE_DAYS", "14"))
+CACHE_ENABLED = os.getenv("DRIVE_CACHE_DISABLED", "").lower() not in ("1", "true", "yes")
+
+INDEX_FILENAME = "index.json"
+BLOB_FOLDER = "files"
+
+# Index dipakai bersama oleh thread download
+_index_lock = threading.Lock()
+
+
+# ============================
+# FUNGSI INDEX
+# ============================
+def get_cache_key(file):
+    """Key cache dari metadata Drive, None jika file tidak bisa di-cache"""
+    if file.get('md5Checksum'):
+        return file['md5Checksum']
+    if file.get('id') and file.get('modifiedTime'):
+        raw_key = f"{file['id']}:{file['modifiedTime']}"
+        return hashlib.sha1(raw_key.encode('utf-8')).hexdigest()
+    return None
+
+
+def _index_path():
+    return os.path.join(CACHE_DIR, INDEX_FILENAME)
+
+
+def _blob_path(cache_key):
+    return os.path.join(CACHE_DIR, BLOB_FOLDER, cache_key)
+
+
+def _load_index():
+    try:
+        with open(_index_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_index(index):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = _index_path() + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp_path, _index_path())
+
+
+# ============================
+# FUNGSI CACHE
+# ============================
+def cache_lookup(file):
+    """Path file di cache jika versi yang sama sudah ada, selain itu None"""
+    cache_key = get_cache_key(file) if CACHE_ENABLED else None
+    if not cache_key:
+        return None
+
+    with _index_lock:
+        index = _load_index()
+        entry = index.get(cache_key)
+        blob_path = _blob_path(cache_key)
+
+        if not entry or not os.path.exists(blob_path) or os.path.getsize(blob_path) != entry.get('size'):
+            return None
+
+        entry['last_used'] = time.time()
+        _save_index(index)
+
+    return blob_path
+
+
+def cache_store(file, source_path=None, data=None):
+    """Simpan file hasil download (dari path atau bytes) ke cache"""
+    cache_key = get_cache_key(file) if CACHE_ENABLED else None
+    if not cache_key:
+        return None
+
+    try:
+        blob_path = _blob_path(cache_key)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+
+        tmp_path = f"{blob_path}.{threading.get_ident()}.tmp"
+        if data is not None:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+        else:
+            shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, blob_path)
+
+        with _index_lock:
+            index = _load_index()
+            index[cache_key] = {
+                'name': file.get('name', ''),
+                'id': file.get('id', ''),
+                'size': os.path.getsize(blob_path),
+                'last_used': time.time()
+            }
+            _save_index(index)
+
+        return blob_path
+
+    except OSError as e:
+        print(f"      ⚠️  Gagal menyimpan {file.get('name', '')} ke cache: {str(e)}")
+        return None
+
+
+def prune_cache(max_bytes=None, max_age_days=None):
+    """Hapus entry cache yang kedaluwarsa, lalu yang paling lama tidak dipakai sampai di bawah batas ukuran"""
+    if not CACHE_ENABLED or not os.path.isdir(CACHE_DIR):
+        return
+
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    max_age_days = CACHE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    oldest_allowed = time.time() - max_age_days * 86400
+
+    with _index_lock:
+        index = _load_index()
+
+        # Entry tanpa file atau terlalu lama tidak dipakai
+        evicted = [key for key, entry in index.items()
+                   if not os.path.exists(_blob_path(key)) or entry.get('last_used', 0) < oldest_allowed]
+
+        # LRU sampai total ukuran di bawah batas
+        remaining = sorted((key for key in index if key not in evicted),
+                           key=lambda key: index[key].get('last_used', 0))
+        total_size = sum(index[key].get('size', 0) for key in remaining)
+        for key in remaining:
+            if total_size <= max_bytes:
+                break
+            evicted.append(key)
+            total_size -= index[key].get('size', 0)
+
+        for key in evicted:
+            entry = index.pop(key)
+            blob_path = _blob_path(key)
+            if os.path.exists(blob_path):
+                os.remove(blob_path)
+            print(f"   🗑️  Cache dihapus: {entry.get('name', key)}")
+
+        # File yatim (tidak tercatat di index)
+        blob_folder = os.path.join(CACHE_DIR, BLOB_FOLDER)
+        if os.path.isdir(blob_folder):
+            for filename in os.listdir(blob_folder):
+                if filename not in index:
+                    os.remove(os.path.join(blob_folder, filename))
+
+        _save_index(index)
+
+    if evicted:
+        print(f"   ✅ Cache: {len(index)} file, {total_size / (1024 * 1024):.1f} MB")
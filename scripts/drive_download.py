@@ -0,0 +1,229 @@
+"""
+drive_download.py
+Modul bersama untuk download file Excel dari folder Google Drive.
+File diunduh paralel memakai thread pool terbatas, dengan retry per file
+dan progress per file, sehingga waktu download mengikuti file terbesar
+dan bukan jumlah semua file. File yang tidak berubah diambil dari cache
+lokal (lihat drive_cache.py).
+
+Lokasi: verval-pupuk2/scripts/drive_download.py
+"""
+
+import os
+import io
+import time
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from googleapiclient.discovery import build
+from googleapiclient.http import MediaIoBaseDownload
+
+from drive_cache import cache_lookup, cache_store, prune_cache
+from rate_limiter import acquire, rate_limited_call, retry_after_seconds
+
+# ============================
+# KONFIGURASI
+# ============================
+DOWNLOAD_WORKERS = int(os.getenv("DRIVE_DOWNLOAD_WORKERS", "4"))
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_RETRY_DELAY = 5
+
+XLSX_MIME_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+XLS_MIME_TYPE = 'application/vnd.ms-excel'
+GOOGLE_SHEET_MIME_TYPE = 'application/vnd.google-apps.spreadsheet'
+
+LIST_FIELDS = "nextPageToken, files(id, name, mimeType, modifiedTime, md5Checksum, size)"
+
+# Service Drive per thread (objek httplib2 tidak thread-safe)
+_thread_local = threading.local()
+
+
+# ============================
+# FUNGSI BANTU
+# ============================
+def get_drive_service(credentials):
+    """Ambil service Drive milik thread saat ini, buat baru jika belum ada"""
+    service = getattr(_thread_local, 'drive_service', None)
+    if service is None or getattr(_thread_local, 'credentials', None) is not credentials:
+        service = build('drive', 'v3', credentials=credentials, cache_discovery=False)
+        _thread_local.drive_service = service
+        _thread_local.credentials = credentials
+    return service
+
+
+def make_safe_filename(name):
+    """Nama file yang aman untuk disimpan di runner"""
+    return "".join(c for c in name if c.isalnum() or c in (' ', '-', '_', '.')).rstrip()
+
+
+def list_excel_files(credentials, folder_id, include_google_sheets=False):
+    """Daftar file Excel di folder Google Drive (semua halaman hasil)"""
+    drive_service = get_drive_service(credentials)
+
+    mime_types = [XLSX_MIME_TYPE, XLS_MIME_TYPE]
+    if include_google_sheets:
+        mime_types.append(GOOGLE_SHEET_MIME_TYPE)
+    mime_query = " or ".join(f"mimeType='{mime}'" for mime in mime_types)
+    query = f"'{folder_id}' in parents and ({mime_query}) and trashed = false"
+
+    files = []
+    page_token = None
+    while True:
+        results = rate_limited_call(drive_service.files().list(
+            q=query,
+            fields=LIST_FIELDS,
+            pageSize=200,
+            pageToken=page_token
+        ).execute, bucket='drive')
+        files.extend(results.get("files", []))
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            break
+
+    return files
+
+
+def build_target_paths(files, save_folder):
+    """Tentukan path lokal unik untuk setiap file (urutan sama dengan daftar file)"""
+    used_names = set()
+    target_paths = []
+
+    for file in files:
+        safe_filename = make_safe_filename(file['name']) or file['id']
+
+        # Google Sheets diexport ke xlsx, file lain diberi ekstensi sesuai mimeType
+        if not safe_filename.lower().endswith(('.xlsx', '.xls')):
+            safe_filename += '.xls' if file.get('mimeType') == XLS_MIME_TYPE else '.xlsx'
+
+        # Hindari dua file dengan nama sama saling menimpa saat download paralel
+        if safe_filename.lower() in used_names:
+            safe_filename = f"{file['id']}_{safe_filename}"
+        used_names.add(safe_filename.lower())
+
+        target_paths.append(os.path.join(save_folder, safe_filename))
+
+    return target_paths
+
+
+def download_single_file(credentials, file, file_path, retries=DOWNLOAD_RETRIES):
+    """
+    Download satu file dengan retry, ditulis ke file sementara lalu di-rename.
+    Mengembalikan (path, dari_cache).
+    """
+    cached_path = cache_lookup(file)
+    if cached_path:
+        shutil.copyfile(cached_path, file_path)
+        return file_path, True
+
+    last_error = None
+
+    for attempt in range(1, retries + 1):
+        partial_path = file_path + ".part"
+        try:
+            drive_service = get_drive_service(credentials)
+            acquire('drive')
+
+            if file.get('mimeType') == GOOGLE_SHEET_MIME_TYPE:
+                request = drive_service.files().export_media(fileId=file["id"], mimeType=XLSX_MIME_TYPE)
+            else:
+                request = drive_service.files().get_media(fileId=file["id"])
+
+            with io.FileIO(partial_path, 'wb') as fh:
+                downloader = MediaIoBaseDownload(fh, request)
+                done = False
+                last_progress = -1
+                while not done:
+                    status, done = downloader.next_chunk()
+                    if status and not done:
+                        progress = int(status.progress() * 100)
+                        if progress // 25 > last_progress // 25:
+                            print(f"      ⏳ {file['name']}: {progress}%")
+                        last_progress = progress
+
+            os.replace(partial_path, file_path)
+            cache_store(file, source_path=file_path)
+            return file_path, False
+
+        except Exception as e:
+            last_error = e
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            if attempt < retries:
+                # Ikuti Retry-After jika Drive membatasi quota
+                delay = retry_after_seconds(e) or DOWNLOAD_RETRY_DELAY * attempt
+                print(f"      ⚠️  Gagal download {file['name']} (percobaan {attempt}/{retries}): {str(e)}")
+                print(f"      ⏳ Mencoba lagi dalam {delay} detik...")
+                time.sleep(delay)
+
+    raise last_error
+
+
+# ============================
+# FUNGSI UTAMA DOWNLOAD FOLDER
+# ============================
+def download_folder_files(credentials, folder_id, save_folder, label="",
+                          include_google_sheets=False, max_workers=None,
+                          skip_failed=False):
+    """
+    Download semua file Excel di folder Drive secara paralel.
+    Mengembalikan list record {'path','name','id','mime_type','modified_time','md5_checksum'}
+    dengan urutan sama seperti hasil files().list.
+    """
+    label = label or folder_id
+    max_workers = max_workers or DOWNLOAD_WORKERS
+    os.makedirs(save_folder, exist_ok=True)
+
+    files = list_excel_files(credentials, folder_id, include_google_sheets=include_google_sheets)
+    if not files:
+        return []
+
+    target_paths = build_target_paths(files, save_folder)
+    workers = max(1, min(max_workers, len(files)))
+    print(f"📥 Download {len(files)} file dari {label} ({workers} paralel)")
+
+    start_time = time.time()
+    downloaded = [None] * len(files)
+    failed = []
+    cache_hits = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(download_single_file, credentials, file, path): index
+            for index, (file, path) in enumerate(zip(files, target_paths))
+        }
+
+        for completed, future in enumerate(as_completed(futures), 1):
+            index = futures[future]
+            file = files[index]
+            try:
+                file_path, from_cache = future.result()
+                downloaded[index] = {
+                    'path': file_path,
+                    'name': file['name'],
+                    'id': file['id'],
+                    'mime_type': file.get('mimeType'),
+                    'modified_time': file.get('modifiedTime'),
+                    'md5_checksum': file.get('md5Checksum')
+                }
+                if from_cache:
+                    cache_hits += 1
+                    print(f"   ♻️  [{completed}/{len(files)}] {file['name']} (cache, tidak berubah)")
+                else:
+                    print(f"   ✅ [{completed}/{len(files)}] {file['name']}")
+            except Exception as e:
+                failed.append((file['name'], str(e)))
+                print(f"   ❌ [{completed}/{len(files)}] Gagal download {file['name']}: {str(e)}")
+
+    elapsed = time.time() - start_time
+    records = [record for record in downloaded if record is not None]
+    print(f"✅ Berhasil download {len(records)}/{len(files)} file dari {label} dalam {elapsed:.1f} detik"
+          f" ({cache_hits} dari cache)")
+
+    prune_cache()
+
+    if failed and not skip_failed:
+        failed_names = ", ".join(name for name, _ in failed)
+        raise RuntimeError(f"❌ Gagal download {len(failed)} file dari {label}: {failed_names}")
+
+    return records
@@ -1,13 +1,13 @@
 import os
-import io
 import json
 import pandas as pd
-import gspread
-import re
-import time
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
+from drive_download import download_folder_files
+from excel_snapshot import read_excel_snapshot
+from nik_cleaner import clean_nik_series, print_nik_report
+from rate_limiter import print_rate_limit_report
+from incremental_sheet import write_sheet_incremental
 from datetime import datetime
 import traceback
 import smtplib
@@ -67,27 +67,7 @@ credentials = Credentials.from_service_account_info(
     ],
 )
 
-gc = gspread.authorize(credentials)
-drive_service = build("drive", "v3", credentials=credentials)
-
-# ============================
-# FUNGSI BERSIHKAN NIK
-# ============================
-def clean_nik(nik_value):
-    """
-    Membersihkan NIK dari karakter non-angka seperti ', `, spasi, dll.
-    Hanya mengambil angka saja.
-    """
-    if pd.isna(nik_value) or nik_value is None:
-        return None
-
-    nik_str = str(nik_value)
-    cleaned_nik = re.sub(r'\D', '', nik_str)
-
-    if len(cleaned_nik) != 16:
-        print(f"⚠️  NIK tidak standar: {nik_value} -> {cleaned_nik} (panjang: {len(cleaned_nik)})")
-
-    return cleaned_nik if cleaned_nik else None
+sheets_service = build('sheets', 'v4', credentials=credentials, cache_discovery=False)
 
 # ============================
 # FUNGSI STANDARDISASI KOLOM
@@ -230,9 +210,51 @@ def convert_to_numeric(value):
     except:
         return 0
 
+def convert_to_numeric_series(series):
+    """
+    Versi vektor convert_to_numeric untuk satu kolom (aturan koma/titik yang sama)
+    """
+    result = pd.Series(0.0, index=series.index)
+    notna = series.notna()
+    if not notna.any():
+        return result
+    
+    # Hapus koma dan spasi, titik hanya dipertahankan jika tepat satu (desimal)
+    value_str = series[notna].astype(str).str.strip()
+    value_str = value_str.str.replace(',', '', regex=False).str.replace(' ', '', regex=False)
+    multi_dot = value_str.str.count(r'\.') != 1
+    value_str = value_str.where(~multi_dot, value_str.str.replace('.', '', regex=False))
+    
+    numbers = pd.to_numeric(value_str, errors='coerce').astype(float)
+    
+    # Teks yang ditolak pd.to_numeric tapi mungkin diterima float() (mis. '1_000')
+    retry = numbers.isna() & (value_str != '')
+    if retry.any():
+        numbers[retry] = [float(convert_to_numeric(value)) for value in value_str[retry]]
+    
+    result[notna] = numbers.fillna(0)
+    return result
+
 # ============================
 # FUNGSI PROSES DATA PIVOT
 # ============================
+# Kolom teks per key (kolom output -> kolom sumber), diambil dari baris pertama
+PIVOT_TEXT_COLUMNS = {
+    'KTP': 'KTP',
+    'Nama Petani': 'Nama Petani',
+    'Nama Poktan': 'Nama Poktan',
+    'Desa': 'Nama Desa',
+    'Kecamatan': 'Gapoktan',  # Gunakan Gapoktan untuk Kecamatan
+    'Nama Kios Pengecer': 'Nama Kios Pengecer',
+}
+PIVOT_KOMODITAS_COLUMNS = ['Komoditas MT1', 'Komoditas MT2', 'Komoditas MT3']
+PIVOT_LUAS_COLUMNS = ['Luas Lahan (Ha) MT1', 'Luas Lahan (Ha) MT2', 'Luas Lahan (Ha) MT3']
+PIVOT_PUPUK_COLUMNS = [
+    f'Pupuk {pupuk} (Kg) {mt}'
+    for mt in ['MT1', 'MT2', 'MT3']
+    for pupuk in ['Urea', 'NPK', 'NPK Formula', 'Organik', 'ZA']
+]
+
 def proses_data_pivot(dataframes_list):
     """
     Membuat pivot data ERDKK sesuai dengan format yang diminta
@@ -240,9 +262,6 @@ def proses_data_pivot(dataframes_list):
     if not dataframes_list:
         return []
     
-    # Dictionary untuk menyimpan data pivot per key (KTP + Poktan)
-    pivot_dict = {}
-    
     # Header output sesuai permintaan - TANPA kolom luas lahan per MT
     output_header = [
         'KTP',
@@ -253,159 +272,66 @@ def proses_data_pivot(dataframes_list):
         'Nama Kios Pengecer',
         'Komoditas',  # Kolom 7: Komoditas saja
         'Rencana Tanam 1 Tahun (Ha)',  # Kolom 8: Total luas lahan
-        # MT1 - Pupuk saja
-        'Pupuk Urea (Kg) MT1',
-        'Pupuk NPK (Kg) MT1',
-        'Pupuk NPK Formula (Kg) MT1',
-        'Pupuk Organik (Kg) MT1',
-        'Pupuk ZA (Kg) MT1',
-        # MT2 - Pupuk saja (TANPA luas lahan)
-        'Pupuk Urea (Kg) MT2',
-        'Pupuk NPK (Kg) MT2',
-        'Pupuk NPK Formula (Kg) MT2',
-        'Pupuk Organik (Kg) MT2',
-        'Pupuk ZA (Kg) MT2',
-        # MT3 - Pupuk saja (TANPA luas lahan)
-        'Pupuk Urea (Kg) MT3',
-        'Pupuk NPK (Kg) MT3',
-        'Pupuk NPK Formula (Kg) MT3',
-        'Pupuk Organik (Kg) MT3',
-        'Pupuk ZA (Kg) MT3'
-    ]
+    ] + PIVOT_PUPUK_COLUMNS  # MT1, MT2, MT3 - Pupuk saja (TANPA luas lahan)
     
     hasil_rows = [output_header]
     
-    total_rows_processed = 0
-    
+    # Gabungkan semua dataframe, hanya kolom yang dipakai pivot
+    source_columns = (list(dict.fromkeys(PIVOT_TEXT_COLUMNS.values())) + PIVOT_KOMODITAS_COLUMNS +
+                      PIVOT_LUAS_COLUMNS + PIVOT_PUPUK_COLUMNS)
+    frames = []
     for df_idx, df in enumerate(dataframes_list):
         if df.empty:
             print(f"   ⚠️  Dataframe {df_idx} kosong, dilewati")
             continue
         
         print(f"   📊 Processing dataframe {df_idx + 1}: {len(df)} rows")
-        
-        for i in range(len(df)):
-            row = df.iloc[i]
-            
-            # Buat key unik berdasarkan KTP dan Nama Poktan
-            ktp_value = row.get('KTP', '') if not pd.isna(row.get('KTP')) else ''
-            poktan_value = row.get('Nama Poktan', '') if not pd.isna(row.get('Nama Poktan')) else ''
-            
-            key = f"{ktp_value}|{poktan_value}"
-            
-            if key not in pivot_dict:
-                # Data baru
-                pivot_dict[key] = {
-                    'KTP': ktp_value,
-                    'Nama Petani': row.get('Nama Petani', '') if not pd.isna(row.get('Nama Petani')) else '',
-                    'Nama Poktan': poktan_value,
-                    'Desa': row.get('Nama Desa', '') if not pd.isna(row.get('Nama Desa')) else '',
-                    'Kecamatan': row.get('Gapoktan', '') if not pd.isna(row.get('Gapoktan')) else '',  # Gunakan Gapoktan untuk Kecamatan
-                    'Nama Kios Pengecer': row.get('Nama Kios Pengecer', '') if not pd.isna(row.get('Nama Kios Pengecer')) else '',
-                    
-                    # Komoditas
-                    'komoditas_set': set(),
-                    
-                    # Luas lahan total (MT1 + MT2 + MT3)
-                    'luas_total': 0,
-                    
-                    # MT1 - Pupuk
-                    'urea_mt1': 0,
-                    'npk_mt1': 0,
-                    'npk_formula_mt1': 0,
-                    'organik_mt1': 0,
-                    'za_mt1': 0,
-                    
-                    # MT2 - Pupuk
-                    'urea_mt2': 0,
-                    'npk_mt2': 0,
-                    'npk_formula_mt2': 0,
-                    'organik_mt2': 0,
-                    'za_mt2': 0,
-                    
-                    # MT3 - Pupuk
-                    'urea_mt3': 0,
-                    'npk_mt3': 0,
-                    'npk_formula_mt3': 0,
-                    'organik_mt3': 0,
-                    'za_mt3': 0,
-                }
-            
-            # Tambahkan komoditas ke set
-            for mt_col in ['Komoditas MT1', 'Komoditas MT2', 'Komoditas MT3']:
-                komoditas_value = row.get(mt_col, '')
-                if not pd.isna(komoditas_value) and komoditas_value:
-                    pivot_dict[key]['komoditas_set'].add(str(komoditas_value).strip())
-            
-            # Konversi dan jumlahkan luas lahan TOTAL (MT1 + MT2 + MT3)
-            luas_mt1 = convert_to_numeric(row.get('Luas Lahan (Ha) MT1', 0))
-            luas_mt2 = convert_to_numeric(row.get('Luas Lahan (Ha) MT2', 0))
-            luas_mt3 = convert_to_numeric(row.get('Luas Lahan (Ha) MT3', 0))
-            
-            pivot_dict[key]['luas_total'] += (luas_mt1 + luas_mt2 + luas_mt3)
-            
-            # Jumlahkan pupuk MT1
-            pivot_dict[key]['urea_mt1'] += convert_to_numeric(row.get('Pupuk Urea (Kg) MT1', 0))
-            pivot_dict[key]['npk_mt1'] += convert_to_numeric(row.get('Pupuk NPK (Kg) MT1', 0))
-            pivot_dict[key]['npk_formula_mt1'] += convert_to_numeric(row.get('Pupuk NPK Formula (Kg) MT1', 0))
-            pivot_dict[key]['organik_mt1'] += convert_to_numeric(row.get('Pupuk Organik (Kg) MT1', 0))
-            pivot_dict[key]['za_mt1'] += convert_to_numeric(row.get('Pupuk ZA (Kg) MT1', 0))
-            
-            # Jumlahkan pupuk MT2
-            pivot_dict[key]['urea_mt2'] += convert_to_numeric(row.get('Pupuk Urea (Kg) MT2', 0))
-            pivot_dict[key]['npk_mt2'] += convert_to_numeric(row.get('Pupuk NPK (Kg) MT2', 0))
-            pivot_dict[key]['npk_formula_mt2'] += convert_to_numeric(row.get('Pupuk NPK Formula (Kg) MT2', 0))
-            pivot_dict[key]['organik_mt2'] += convert_to_numeric(row.get('Pupuk Organik (Kg) MT2', 0))
-            pivot_dict[key]['za_mt2'] += convert_to_numeric(row.get('Pupuk ZA (Kg) MT2', 0))
-            
-            # Jumlahkan pupuk MT3
-            pivot_dict[key]['urea_mt3'] += convert_to_numeric(row.get('Pupuk Urea (Kg) MT3', 0))
-            pivot_dict[key]['npk_mt3'] += convert_to_numeric(row.get('Pupuk NPK (Kg) MT3', 0))
-            pivot_dict[key]['npk_formula_mt3'] += convert_to_numeric(row.get('Pupuk NPK Formula (Kg) MT3', 0))
-            pivot_dict[key]['organik_mt3'] += convert_to_numeric(row.get('Pupuk Organik (Kg) MT3', 0))
-            pivot_dict[key]['za_mt3'] += convert_to_numeric(row.get('Pupuk ZA (Kg) MT3', 0))
-            
-            total_rows_processed += 1
+        frames.append(df.reindex(columns=source_columns))
+    
+    if not frames:
+        print(f"   📊 Data diproses: 0 baris")
+        print(f"   🎯 Unique keys: 0")
+        return hasil_rows
+    
+    data = pd.concat(frames, ignore_index=True)
+    total_rows_processed = len(data)
+    
+    # Buat key unik berdasarkan KTP dan Nama Poktan
+    for source_col in PIVOT_TEXT_COLUMNS.values():
+        data[source_col] = data[source_col].fillna('')
+    data['_key'] = data['KTP'].astype(str) + '|' + data['Nama Poktan'].astype(str)
+    
+    # Kolom numerik: luas lahan TOTAL (MT1 + MT2 + MT3) dan pupuk per MT
+    numeric = pd.DataFrame({'_key': data['_key']})
+    luas = [convert_to_numeric_series(data[col]) for col in PIVOT_LUAS_COLUMNS]
+    numeric['luas_total'] = luas[0] + luas[1] + luas[2]
+    for col in PIVOT_PUPUK_COLUMNS:
+        numeric[col] = convert_to_numeric_series(data[col])
+    
+    # Urutan key sesuai kemunculan pertama, data teks dari baris pertama key
+    grouped_text = data.groupby('_key', sort=False)[list(dict.fromkeys(PIVOT_TEXT_COLUMNS.values()))].first()
+    grouped_numeric = numeric.groupby('_key', sort=False).sum()
+    
+    # Gabungan komoditas MT1-MT3 per key (unik, terurut)
+    komoditas = data.melt(id_vars='_key', value_vars=PIVOT_KOMODITAS_COLUMNS, value_name='komoditas')
+    komoditas = komoditas[komoditas['komoditas'].notna() & (komoditas['komoditas'] != '')]
+    komoditas['komoditas'] = komoditas['komoditas'].astype(str).str.strip()
+    komoditas_str = (komoditas.drop_duplicates(['_key', 'komoditas'])
+                     .sort_values('komoditas', kind='stable')
+                     .groupby('_key', sort=False)['komoditas']
+                     .agg(', '.join))
+    komoditas_str = komoditas_str.reindex(grouped_text.index, fill_value='')
     
     print(f"   📊 Data diproses: {total_rows_processed} baris")
-    print(f"   🎯 Unique keys: {len(pivot_dict)}")
+    print(f"   🎯 Unique keys: {len(grouped_text)}")
     
-    # Konversi dictionary ke list untuk output
-    for key, data in pivot_dict.items():
-        # Format komoditas
-        komoditas_str = ", ".join(sorted(data['komoditas_set'])) if data['komoditas_set'] else ""
-        
-        # Buat row output
-        output_row = [
-            data['KTP'],
-            data['Nama Petani'],
-            data['Nama Poktan'],
-            data['Desa'],
-            data['Kecamatan'],
-            data['Nama Kios Pengecer'],
-            komoditas_str,  # Kolom 7: Komoditas
-            round(data['luas_total'], 2),  # Kolom 8: Rencana Tanam 1 Tahun
-            # MT1 - Pupuk saja
-            round(data['urea_mt1'], 2),
-            round(data['npk_mt1'], 2),
-            round(data['npk_formula_mt1'], 2),
-            round(data['organik_mt1'], 2),
-            round(data['za_mt1'], 2),
-            # MT2 - Pupuk saja (TANPA luas lahan)
-            round(data['urea_mt2'], 2),
-            round(data['npk_mt2'], 2),
-            round(data['npk_formula_mt2'], 2),
-            round(data['organik_mt2'], 2),
-            round(data['za_mt2'], 2),
-            # MT3 - Pupuk saja (TANPA luas lahan)
-            round(data['urea_mt3'], 2),
-            round(data['npk_mt3'], 2),
-            round(data['npk_formula_mt3'], 2),
-            round(data['organik_mt3'], 2),
-            round(data['za_mt3'], 2),
-        ]
-        
-        hasil_rows.append(output_row)
+    # Konversi ke list untuk output
+    output_columns = [grouped_text[source_col].tolist() for source_col in PIVOT_TEXT_COLUMNS.values()]
+    output_columns.append(komoditas_str.tolist())
+    for col in ['luas_total'] + PIVOT_PUPUK_COLUMNS:
+        output_columns.append([round(value, 2) for value in grouped_numeric[col].tolist()])
+    
+    hasil_rows.extend([list(row) for row in zip(*output_columns)])
     
     return hasil_rows
 
@@ -413,32 +339,22 @@ def proses_data_pivot(dataframes_list):
 # DOWNLOAD FILE EXCEL DARI DRIVE
 # ============================
 def download_excel_files(folder_id, save_folder=SAVE_FOLDER):
-    os.makedirs(save_folder, exist_ok=True)
-    query = f"'{folder_id}' in parents and (mimeType='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet' or mimeType='application/vnd.ms-excel')"
-    results = drive_service.files().list(q=query, fields="files(id, name)").execute()
-    files = results.get("files", [])
+    files = download_folder_files(credentials, folder_id, save_folder)
 
     if not files:
         raise ValueError("Tidak ada file Excel di folder Google Drive.")
 
-    paths = []
-    for f in files:
-        request = drive_service.files().get_media(fileId=f["id"])
-        fh = io.FileIO(os.path.join(save_folder, f["name"]), "wb")
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while not done:
-            _, done = downloader.next_chunk()
-        paths.append(os.path.join(save_folder, f["name"]))
-    return paths
+    return [file_info['path'] for file_info in files]
 
 # ============================
 # FUNGSI UNTUK MENULIS DATA KE GOOGLE SHEETS (TANPA LIMIT 200K BARIS)
 # ============================
-def write_to_google_sheet(worksheet, data_rows):
+def write_to_google_sheet(spreadsheet_id, sheet_name, data_rows):
     """
     Menulis data ke Google Sheets TANPA limit 200,000 baris
-    Hanya batasan 10 juta cells total per spreadsheet
+    Hanya batasan 10 juta cells total per spreadsheet.
+    Penulisan inkremental per KTP-Poktan: hanya baris yang berubah/baru/hilang sejak
+    publish sebelumnya yang ditulis (lihat incremental_sheet.py)
     """
     try:
         print(f"📤 Menulis {len(data_rows)} baris data ke Google Sheets...")
@@ -449,121 +365,12 @@ def write_to_google_sheet(worksheet, data_rows):
         print(f"📊 Ukuran data: {total_rows_to_write} baris x {total_columns} kolom")
         print(f"💾 Total cells: {total_rows_to_write * total_columns:,}")
         
-        # 1. CLEAR SEMUA DATA DI WORKSHEET TERLEBIH DAHULU
-        print("🧹 Membersihkan SEMUA data lama di worksheet...")
-        try:
-            # Clear seluruh worksheet untuk mengosongkan cells
-            worksheet.clear()
-            print("✅ Worksheet berhasil dibersihkan")
-        except Exception as clear_error:
-            print(f"⚠️  Gagal clear worksheet: {str(clear_error)}")
-            # Tetap lanjut, mungkin sudah kosong
-        
-        # 2. RESIZE WORKSHEET JIKA PERLU UNTUK DATA YANG BESAR
-        current_rows = worksheet.row_count
-        current_cols = worksheet.col_count
-        
-        # Hitung cells saat ini
-        current_cells = current_rows * current_cols
-        required_cells = total_rows_to_write * total_columns
-        
-        print(f"📊 Cells saat ini: {current_cells:,}")
-        print(f"📊 Cells diperlukan: {required_cells:,}")
-        
-        # Resize jika cells tidak cukup (tidak ada limit 200k baris)
-        if required_cells > current_cells:
-            print(f"🔄 Resize worksheet untuk menampung data besar...")
-            
-            # Hitung ukuran baru (beri buffer 20%)
-            new_rows = max(total_rows_to_write + 1000, int(total_rows_to_write * 1.2))
-            new_cols = max(total_columns + 10, int(total_columns * 1.2))
-            
-            # Hitung cells baru
-            new_cells = new_rows * new_cols
-            print(f"📏 Ukuran baru: {new_rows} baris x {new_cols} kolom = {new_cells:,} cells")
-            
-            # Cek apakah masih dalam batas 10 juta cells
-            if new_cells > 10000000:
-                print("⚠️  PERINGATAN: Ukuran worksheet mendekati limit 10 juta cells")
-                # Tetap resize, biarkan Google Sheets yang menolak jika benar-benar melebihi
-                
-            try:
-                worksheet.resize(rows=new_rows, cols=new_cols)
-                print(f"✅ Worksheet di-resize menjadi {new_rows} baris x {new_cols} kolom")
-            except Exception as resize_error:
-                error_msg = str(resize_error)
-                if "exceeds grid limits" in error_msg or "10000000" in error_msg:
-                    print("❌ Gagal resize: Mencapai limit 10 juta cells per spreadsheet")
-                    print("💡 Coba dengan ukuran yang lebih kecil...")
-                    # Coba resize dengan ukuran yang pas tanpa buffer
-                    try:
-                        worksheet.resize(rows=total_rows_to_write + 100, cols=total_columns + 5)
-                        print(f"✅ Worksheet di-resize menjadi {total_rows_to_write + 100} baris x {total_columns + 5} kolom")
-                    except:
-                        print("⚠️  Gagal resize ulang, melanjutkan dengan ukuran saat ini")
-                else:
-                    print(f"⚠️  Gagal resize worksheet: {str(resize_error)}")
+        # Grid sheet disesuaikan persis dengan ukuran data oleh penulis inkremental
+        if total_rows_to_write * total_columns > 10000000:
+            print("⚠️  PERINGATAN: Ukuran data melebihi limit 10 juta cells per spreadsheet")
         
-        # 3. TULIS DATA DENGAN CHUNKING UNTUK DATA BESAR
-        CHUNK_SIZE = 10000  # 10,000 baris per chunk
-        chunk_count = (total_rows_to_write + CHUNK_SIZE - 1) // CHUNK_SIZE
-        
-        print(f"🔀 Membagi data menjadi {chunk_count} chunk...")
-        
-        for chunk_index in range(chunk_count):
-            start_row = chunk_index * CHUNK_SIZE
-            end_row = min(start_row + CHUNK_SIZE, total_rows_to_write)
-            
-            current_chunk = data_rows[start_row:end_row]
-            start_cell = f'A{start_row + 1}'
-            
-            print(f"   📄 Menulis chunk {chunk_index + 1}/{chunk_count}: baris {start_row + 1}-{end_row}...")
-            
-            try:
-                worksheet.update(start_cell, current_chunk, value_input_option='USER_ENTERED')
-                
-                # Jeda antar chunk untuk menghindari rate limit
-                if chunk_index < chunk_count - 1:
-                    time.sleep(2)
-                    
-            except Exception as chunk_error:
-                error_msg = str(chunk_error)
-                print(f"❌ Error pada chunk {chunk_index + 1}: {error_msg}")
-                
-                # Coba lagi dengan jeda lebih lama
-                print("🔄 Mencoba lagi dengan jeda 5 detik...")
-                time.sleep(5)
-                
-                try:
-                    worksheet.update(start_cell, current_chunk, value_input_option='USER_ENTERED')
-                    print(f"✅ Chunk {chunk_index + 1} berhasil pada percobaan kedua")
-                except Exception as retry_error:
-                    print(f"❌ Gagal lagi: {str(retry_error)}")
-                    
-                    # Coba dengan chunk yang lebih kecil
-                    print("🔄 Mencoba dengan chunk lebih kecil (5,000 baris)...")
-                    smaller_chunk_size = 5000
-                    
-                    # Bagi chunk saat ini menjadi sub-chunks
-                    sub_start_row = start_row
-                    sub_chunks = []
-                    while sub_start_row < end_row:
-                        sub_end_row = min(sub_start_row + smaller_chunk_size, end_row)
-                        sub_chunks.append((sub_start_row, sub_end_row))
-                        sub_start_row = sub_end_row
-                    
-                    for sub_idx, (sub_start, sub_end) in enumerate(sub_chunks):
-                        sub_chunk = data_rows[sub_start:sub_end]
-                        sub_cell = f'A{sub_start + 1}'
-                        
-                        print(f"     📝 Sub-chunk {sub_idx + 1}/{len(sub_chunks)}: baris {sub_start + 1}-{sub_end}...")
-                        
-                        try:
-                            worksheet.update(sub_cell, sub_chunk, value_input_option='USER_ENTERED')
-                            time.sleep(1)
-                        except Exception as sub_error:
-                            print(f"     ❌ Gagal sub-chunk: {str(sub_error)}")
-                            raise sub_error
+        data_df = pd.DataFrame(data_rows[1:], columns=data_rows[0])
+        write_sheet_incremental(sheets_service, spreadsheet_id, sheet_name, data_df, key_columns=['KTP', 'Nama Poktan'])
         
         print(f"✅ Semua data berhasil ditulis! Total {total_rows_to_write} baris.")
         return True
@@ -657,7 +464,7 @@ def main():
             
             try:
                 # Baca file Excel
-                df = pd.read_excel(fpath, dtype=str)
+                df = read_excel_snapshot(fpath, dtype=str)
                 print(f"   📊 Kolom yang ditemukan: {list(df.columns)}")
                 
             except Exception as e:
@@ -682,14 +489,16 @@ def main():
                 df['KTP_ORIGINAL'] = df['KTP'].copy()
                 
                 # Bersihkan NIK/KTP
-                df['KTP'] = df['KTP'].apply(clean_nik)
+                df['KTP'], nik_report = clean_nik_series(df['KTP'])
+                print_nik_report(nik_report)
                 
                 # Log perubahan NIK
                 mask = df['KTP_ORIGINAL'] != df['KTP']
                 if mask.any():
                     cleaned_ktp = df[mask][['KTP_ORIGINAL', 'KTP']].head(5)  # Ambil 5 contoh saja
-                    for _, row in cleaned_ktp.iterrows():
-                        nik_cleaning_log.append(f"'{row['KTP_ORIGINAL']}' -> {row['KTP']}")
+                    nik_cleaning_log.extend(
+                        f"'{original}' -> {ktp}" for original, ktp in zip(cleaned_ktp['KTP_ORIGINAL'], cleaned_ktp['KTP'])
+                    )
                 
                 # Hapus baris dengan NIK kosong
                 before_clean = len(df)
@@ -742,36 +551,9 @@ def main():
         print("📤 MENULIS DATA KE GOOGLE SHEETS")
         print("=" * 60)
         
-        # Buka spreadsheet
-        try:
-            sh = gc.open_by_key(SPREADSHEET_ID)
-            print(f"✅ Spreadsheet ditemukan: {SPREADSHEET_ID}")
-        except Exception as e:
-            raise ValueError(f"❌ Gagal membuka spreadsheet: {str(e)}")
-        
-        # Cek atau buat worksheet
-        try:
-            ws = sh.worksheet(SHEET_NAME)
-            print(f"✅ Sheet '{SHEET_NAME}' ditemukan")
-            
-        except gspread.exceptions.WorksheetNotFound:
-            print(f"⚠️  Sheet '{SHEET_NAME}' tidak ditemukan, membuat baru...")
-            
-            # Hitung ukuran yang dibutuhkan untuk data besar
-            required_rows = max(1000, len(hasil_pivot) + 1000)  # Buffer lebih besar
-            required_cols = max(26, len(hasil_pivot[0]) + 10)   # Buffer lebih besar
-            
-            ws = sh.add_worksheet(
-                title=SHEET_NAME, 
-                rows=required_rows, 
-                cols=required_cols
-            )
-            print(f"✅ Sheet '{SHEET_NAME}' berhasil dibuat ({required_rows} baris x {required_cols} kolom)")
-        except Exception as e:
-            raise ValueError(f"❌ Gagal mengakses worksheet: {str(e)}")
-        
-        # Tulis data
-        success = write_to_google_sheet(ws, hasil_pivot)
+        # Sheet dibuat otomatis jika belum ada
+        success = write_to_google_sheet(SPREADSHEET_ID, SHEET_NAME, hasil_pivot)
+        print_rate_limit_report()
         
         if not success:
             raise ValueError("❌ Gagal menulis data ke Google Sheets")
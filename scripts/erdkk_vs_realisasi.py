@@ -7,7 +7,9 @@ Lokasi: verval-pupuk2/scripts/erdkk_vs_realisasi_fixed_v6.py
 """
 
 import os
+import io
 import sys
+import contextlib
 import pandas as pd
 import gspread
 import re
@@ -19,10 +21,14 @@ from datetime import datetime, date
 import traceback
 import json
 import time
-from googleapiclient.errors import HttpError
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
-import io
+from concurrent.futures import ProcessPoolExecutor
+from drive_download import download_folder_files
+from excel_snapshot import read_excel_sheet, pick_sheet_name
+from excel_stream import open_excel_batches
+from status_classifier import classify_status
+from nik_cleaner import clean_nik, clean_nik_series, print_nik_report
+from sheet_publisher import publish_sheets, cell_format_request, freeze_rows_request, grid_range
+from rate_limiter import rate_limited_call, print_rate_limit_report, get_throttled_seconds
 import tempfile
 
 # ============================
@@ -31,12 +37,46 @@ import tempfile
 ERDKK_FOLDER_ID = "1BBgVsgq7EMGs0TLaO_4GEtUppznm1v5J"  # Folder ERDKK
 REALISASI_FOLDER_ID = "1-7LZB_kvL8zAAsG8w5yIQmdNRoIahz8m"  # Folder realisasi
 OUTPUT_SHEET_URL = "https://docs.google.com/spreadsheets/d/1FVi3xpzlq636wkv-J0d685WHmSGaYeo9O9ScRx1YlhQ/edit"
+REALISASI_SHEET_CANDIDATES = ["Worksheet"]  # Sheet realisasi, fallback sheet pertama
 
 # OPTIMIZED RATE LIMITING
 MAX_RETRIES = 5
-INITIAL_RETRY_DELAY = 30
-WRITE_DELAY = 5
-BATCH_DELAY = 10
+
+# Jumlah proses untuk parsing file ERDKK/realisasi (default = jumlah CPU, 1 = serial)
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0")) or os.cpu_count() or 1
+
+# Kolom hasil process_erdkk_file
+ERDKK_RESULT_COLUMNS = [
+    'NIK', 'NAMA_PETANI', 'KECAMATAN', 'KODE_KIOS', 'NAMA_KIOS',
+    'TOTAL_UREA', 'TOTAL_NPK', 'TOTAL_SP36', 'TOTAL_ZA',
+    'TOTAL_NPK_FORMULA', 'TOTAL_ORGANIK', 'TOTAL_ORGANIK_CAIR', 'FILE_SOURCE'
+]
+
+# Kata kunci kolom wilayah ERDKK (urut prioritas) dan pola kolom pupuk
+ERDKK_KECAMATAN_PATTERNS = ['KECAMATAN', 'KEC', 'WILAYAH KECAMATAN']
+ERDKK_GAPOKTAN_PATTERNS = ['GAPOKTAN', 'GABUNGAN KELOMPOK TANI', 'GAPOKTAN/NAMA KELOMPOK']
+ERDKK_WILAYAH_PATTERNS = ['DESA', 'KELURAHAN', 'DUSUN', 'KAMPUNG', 'NAMA DESA', 'DESA/KELURAHAN']
+ERDKK_POKTAN_PATTERNS = ['POKTAN', 'KELOMPOK TANI', 'NAMA POKTAN']
+ERDKK_PUPUK_PATTERNS = {
+    'UREA': [r'UREA', r'UERA'],
+    'NPK': [r'NPK(?!.*FORMULA)', r'NPK\s+[^F]'],  # NPK tapi bukan NPK FORMULA
+    'SP36': [r'SP36', r'SP-36'],
+    'ZA': [r'ZA'],
+    'NPK_FORMULA': [r'NPK.*FORMULA', r'FORMULA.*NPK'],
+    'ORGANIK': [r'ORGANIK(?!.*CAIR)', r'ORGANIK\s+[^C]'],  # ORGANIK tapi bukan ORGANIK CAIR
+    'ORGANIK_CAIR': [r'ORGANIK.*CAIR', r'CAIR.*ORGANIK']
+}
+
+# Kolom hasil realisasi per jenis pupuk
+REALISASI_PUPUK_KEYS = {
+    'UREA': 'REALISASI_UREA',
+    'NPK': 'REALISASI_NPK',
+    'SP36': 'REALISASI_SP36',
+    'ZA': 'REALISASI_ZA',
+    'NPK_FORMULA': 'REALISASI_NPK_FORMULA',
+    'ORGANIK': 'REALISASI_ORGANIK',
+    'ORGANIK_CAIR': 'REALISASI_ORGANIK_CAIR'
+}
 
 # ============================
 # LOAD EMAIL CONFIGURATION FROM SECRETS
@@ -199,10 +239,79 @@ def print_status_analysis(df, status_column='STATUS'):
 # ============================
 # FUNGSI BANTU UNTUK TANGGAL INPUT
 # ============================
+# Cache tanggal input terbaru per file realisasi: path -> (kolom tanggal, tanggal terbaru)
+LATEST_INPUT_DATE_CACHE = {}
+
+def is_tgl_input_column(col_name):
+    """Cek apakah nama kolom adalah kolom TGL INPUT/TANGGAL INPUT"""
+    col_upper = str(col_name).upper()
+    return 'TGL INPUT' in col_upper or 'TANGGAL INPUT' in col_upper
+
+def parse_tanggal_input(values):
+    """Parsing kolom tanggal input (hasil baca biasa maupun dtype=str)"""
+    if not pd.api.types.is_datetime64_any_dtype(values):
+        # Sel tanggal Excel yang dibaca dengan dtype=str menjadi teks ISO 'YYYY-MM-DD HH:MM:SS'
+        iso_mask = values.notna() & values.astype(str).str.match(r'^\d{4}-\d{2}-\d{2}')
+        if iso_mask.any():
+            result = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+            result[iso_mask] = pd.to_datetime(values[iso_mask].astype(str), errors='coerce', format='ISO8601')
+            if (~iso_mask).any():
+                result[~iso_mask] = parse_tanggal_teks(values[~iso_mask])
+            return result
+    
+    return parse_tanggal_teks(values)
+
+def parse_tanggal_teks(values):
+    """Parsing tanggal dengan berbagai format"""
+    try:
+        # Coba format dengan dayfirst=True (untuk format DD/MM/YYYY)
+        return pd.to_datetime(values, errors='coerce', dayfirst=True)
+    except:
+        pass
+    
+    # Coba format spesifik
+    for date_format in ['%d/%m/%Y %H:%M:%S', '%d-%m-%Y %H:%M:%S', '%d/%m/%Y', '%d-%m-%Y']:
+        try:
+            return pd.to_datetime(values, errors='coerce', format=date_format)
+        except:
+            continue
+    
+    # Fallback ke parsing otomatis
+    return pd.to_datetime(values, errors='coerce')
+
+def find_latest_input_date(df):
+    """
+    Cari kolom TGL INPUT/TANGGAL INPUT (nama kolom sudah dibersihkan) dan tanggal terbarunya.
+    Mengembalikan (kolom, tanggal terbaru); (None, None) jika kolom tidak ada.
+    """
+    tgl_input_cols = [col for col in df.columns if is_tgl_input_column(col)]
+    if not tgl_input_cols:
+        return None, None
+    
+    tgl_col = tgl_input_cols[0]
+    valid_datetimes = parse_tanggal_input(df[tgl_col]).dropna()
+    
+    if valid_datetimes.empty:
+        return tgl_col, None
+    return tgl_col, valid_datetimes.max()
+
+def read_input_date_column(file_path):
+    """Baca hanya kolom tanggal input dari file (jika file belum diparse oleh proses utama)"""
+    usecols = lambda col: is_tgl_input_column(clean_column_name(col))
+    
+    # Sheet 'Worksheet' (atau sheet pertama), workbook hanya dibuka sekali
+    with pd.ExcelFile(file_path) as xls:
+        sheet_name = pick_sheet_name(xls.sheet_names, REALISASI_SHEET_CANDIDATES)
+        df = xls.parse(sheet_name=sheet_name, usecols=usecols)
+    
+    df.columns = [clean_column_name(col) for col in df.columns]
+    return df
+
 def extract_latest_input_date_from_files(excel_files):
     """
-    Ekstrak tanggal input terbaru dari semua file realisasi
-    Mirip dengan fungsi di pivot_klaster_status.py
+    Ekstrak tanggal input terbaru dari semua file realisasi.
+    Memakai hasil yang sudah dihitung process_realisasi_file; file yang belum
+    diproses hanya dibaca kolom tanggalnya saja.
     """
     latest_datetime = None
     found_in_files = 0
@@ -214,54 +323,16 @@ def extract_latest_input_date_from_files(excel_files):
         file_name = file_info['name']
         
         try:
-            # Coba sheet 'Worksheet' terlebih dahulu (seperti di script lain)
-            try:
-                df = pd.read_excel(file_path, sheet_name='Worksheet')
-            except:
-                # Coba sheet pertama
-                xls = pd.ExcelFile(file_path)
-                sheet_name = xls.sheet_names[0]
-                df = pd.read_excel(file_path, sheet_name=sheet_name)
-            
-            # Bersihkan nama kolom
-            df.columns = [clean_column_name(col) for col in df.columns]
+            if file_path not in LATEST_INPUT_DATE_CACHE:
+                LATEST_INPUT_DATE_CACHE[file_path] = find_latest_input_date(read_input_date_column(file_path))
+            tgl_col, file_latest_datetime = LATEST_INPUT_DATE_CACHE[file_path]
             
-            # Cari kolom TGL INPUT atau TANGGAL INPUT
-            tgl_input_cols = [col for col in df.columns if 'TGL INPUT' in col.upper() or 'TANGGAL INPUT' in col.upper()]
-            
-            if tgl_input_cols:
-                tgl_col = tgl_input_cols[0]
+            if tgl_col:
                 found_in_files += 1
                 
                 print(f"   🔍 File: {file_name} - Kolom tanggal: '{tgl_col}'")
                 
-                # Coba parsing tanggal dengan berbagai format
-                try:
-                    # Coba format dengan dayfirst=True (untuk format DD/MM/YYYY)
-                    df[tgl_col] = pd.to_datetime(df[tgl_col], errors='coerce', dayfirst=True)
-                except:
-                    try:
-                        # Coba format spesifik
-                        df[tgl_col] = pd.to_datetime(df[tgl_col], errors='coerce', format='%d/%m/%Y %H:%M:%S')
-                    except:
-                        try:
-                            df[tgl_col] = pd.to_datetime(df[tgl_col], errors='coerce', format='%d-%m-%Y %H:%M:%S')
-                        except:
-                            try:
-                                df[tgl_col] = pd.to_datetime(df[tgl_col], errors='coerce', format='%d/%m/%Y')
-                            except:
-                                try:
-                                    df[tgl_col] = pd.to_datetime(df[tgl_col], errors='coerce', format='%d-%m-%Y')
-                                except:
-                                    # Fallback ke parsing otomatis
-                                    df[tgl_col] = pd.to_datetime(df[tgl_col], errors='coerce')
-                
-                # Cari tanggal yang valid
-                valid_datetimes = df[tgl_col].dropna()
-                
-                if not valid_datetimes.empty:
-                    file_latest_datetime = valid_datetimes.max()
-                    
+                if file_latest_datetime is not None:
                     if latest_datetime is None or file_latest_datetime > latest_datetime:
                         latest_datetime = file_latest_datetime
                     
@@ -339,28 +410,25 @@ def write_update_date_to_sheet(gc, spreadsheet_url, latest_datetime):
                 worksheet = spreadsheet.add_worksheet(title="Sheet1", rows="100", cols="20")
         
         # Update kolom E (E1, E2, E3)
-        worksheet.update('E1', [['Update per tanggal input']])
-        time.sleep(WRITE_DELAY)
+        safe_google_api_operation(worksheet.update, 'E1', [['Update per tanggal input']])
         
         if latest_datetime:
             date_formatted = format_date_indonesian(latest_datetime)
         else:
             date_formatted = "Tanggal tidak tersedia"
         
-        worksheet.update('E2', [[date_formatted]])
-        time.sleep(WRITE_DELAY)
+        safe_google_api_operation(worksheet.update, 'E2', [[date_formatted]])
         
         if latest_datetime:
             time_formatted = latest_datetime.strftime('%H:%M:%S')
         else:
             time_formatted = "Waktu tidak tersedia"
         
-        worksheet.update('E3', [[time_formatted]])
-        time.sleep(WRITE_DELAY)
+        safe_google_api_operation(worksheet.update, 'E3', [[time_formatted]])
         
         # Format kolom E dengan warna kuning muda
         try:
-            worksheet.format('E1:E3', {
+            safe_google_api_operation(worksheet.format, 'E1:E3', {
                 "backgroundColor": {
                     "red": 1.0,
                     "green": 1.0,
@@ -391,64 +459,40 @@ def write_update_date_to_sheet(gc, spreadsheet_url, latest_datetime):
 # ============================
 # FUNGSI BANTU UNTUK GOOGLE API
 # ============================
-def exponential_backoff(attempt):
-    base_delay = INITIAL_RETRY_DELAY * (2 ** (attempt - 1))
-    jitter = base_delay * 0.1
-    return base_delay + jitter
-
 def safe_google_api_operation(operation, *args, **kwargs):
-    """Safe operation dengan exponential backoff"""
-    last_exception = None
+    """Panggilan Google API lewat rate limiter bersama (retry 429/5xx, mengikuti Retry-After)"""
+    return rate_limited_call(operation, *args, max_retries=MAX_RETRIES, **kwargs)
+
+def parse_pupuk_series(value_series):
+    """Konversi satu kolom nilai pupuk (string) menjadi float, nilai kosong/gagal = 0"""
+    value_str = value_series.astype(str)
+    clean_str = value_str.str.replace(r'[^\d.-]', '', regex=True)
+    numbers = pd.to_numeric(clean_str, errors='coerce')
     
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            result = operation(*args, **kwargs)
-            if attempt > 1:
-                print(f"   ✅ Berhasil pada percobaan ke-{attempt}")
-            return result
-            
-        except HttpError as e:
-            last_exception = e
-            if e.resp.status == 429:
-                if attempt < MAX_RETRIES:
-                    wait_time = exponential_backoff(attempt)
-                    print(f"⏳ Quota exceeded, menunggu {wait_time:.1f} detik... (Percobaan {attempt}/{MAX_RETRIES})")
-                    time.sleep(wait_time)
-                else:
-                    print(f"❌ Gagal setelah {MAX_RETRIES} percobaan")
-                    raise e
-            elif e.resp.status in [500, 502, 503, 504]:
-                if attempt < MAX_RETRIES:
-                    wait_time = exponential_backoff(attempt)
-                    print(f"⏳ Server error {e.resp.status}, menunggu {wait_time:.1f} detik... (Percobaan {attempt}/{MAX_RETRIES})")
-                    time.sleep(wait_time)
-                else:
-                    raise e
-            else:
-                raise e
-        except Exception as e:
-            last_exception = e
-            if attempt < MAX_RETRIES:
-                wait_time = exponential_backoff(attempt)
-                print(f"⏳ Error {type(e).__name__}, menunggu {wait_time:.1f} detik... (Percobaan {attempt}/{MAX_RETRIES})")
-                time.sleep(wait_time)
-            else:
-                raise e
+    # Jika tidak bisa dikonversi, ambil angka pertama dalam string
+    fallback = pd.to_numeric(value_str.str.extract(r'(\d+\.?\d*)', expand=False), errors='coerce')
+    numbers = numbers.fillna(fallback).fillna(0.0)
     
-    raise last_exception
+    numbers[clean_str == ''] = 0.0
+    numbers[value_series.isna()] = 0.0
+    return numbers.astype(float)
 
-def clean_nik(nik_value):
-    """Membersihkan NIK dari karakter non-angka"""
-    if pd.isna(nik_value) or nik_value is None:
-        return None
-    nik_str = str(nik_value)
-    cleaned_nik = re.sub(r'\D', '', nik_str)
-    if len(cleaned_nik) != 16:
-        # Tidak selalu error, bisa jadi data valid dengan leading zeros hilang
-        if len(cleaned_nik) < 16:
-            # Tambahkan leading zeros
-            cleaned_nik = cleaned_nik.zfill(16)
-    return cleaned_nik if cleaned_nik else None
+def parse_realisasi_series(value_series):
+    """
+    Konversi satu kolom nilai pupuk realisasi menjadi float dengan aturan lama
+    realisasi: buang karakter selain angka, titik, minus; gagal/kosong = 0
+    (tanpa fallback angka pertama seperti parse_pupuk_series)
+    """
+    clean_str = value_series.astype(str).str.replace(r'[^\d.-]', '', regex=True)
+    numbers = pd.to_numeric(clean_str, errors='coerce').fillna(0.0)
+    numbers[value_series.isna()] = 0.0
+    return numbers.astype(float)
+
+def text_column(df, col_name):
+    """Ambil kolom teks yang sudah di-strip, kosong jika kolom tidak ada"""
+    if not col_name:
+        return pd.Series('', index=df.index)
+    return df[col_name].fillna('').astype(str).str.strip()
 
 def clean_column_name(col_name):
     """Bersihkan nama kolom"""
@@ -463,75 +507,29 @@ def clean_column_name(col_name):
 # FUNGSI DOWNLOAD FILE
 # ============================
 def download_excel_files_from_drive(credentials, folder_id, folder_name):
-    """Download file Excel dari Google Drive"""
+    """Download file Excel dari Google Drive (paralel)"""
     print(f"\n📥 Download file dari folder: {folder_name}")
     print(f"   🔍 Folder ID: {folder_id}")
     
     # Buat temporary folder
     temp_dir = tempfile.gettempdir()
     save_folder = os.path.join(temp_dir, f"data_{folder_name}_{int(time.time())}")
-    os.makedirs(save_folder, exist_ok=True)
     
     try:
-        drive_service = build('drive', 'v3', credentials=credentials)
-
-        # Query untuk mencari file Excel
-        query = f"'{folder_id}' in parents and (mimeType='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet' or mimeType='application/vnd.ms-excel' or mimeType='application/vnd.google-apps.spreadsheet')"
-        
-        results = drive_service.files().list(q=query, fields="files(id, name, mimeType, modifiedTime)").execute()
-        files = results.get("files", [])
+        file_paths = download_folder_files(
+            credentials, folder_id, save_folder,
+            label=folder_name,
+            include_google_sheets=True,
+            skip_failed=True
+        )
 
-        if not files:
+        if not file_paths:
             print(f"⚠️  Tidak ada file Excel di folder {folder_name}")
             return []
 
-        file_paths = []
-        for file in files:
-            print(f"   📥 Downloading: {file['name']} ({file['mimeType']})")
-            
-            try:
-                # Handle Google Sheets vs regular Excel
-                if file['mimeType'] == 'application/vnd.google-apps.spreadsheet':
-                    # Export Google Sheets ke Excel
-                    request = drive_service.files().export_media(
-                        fileId=file["id"],
-                        mimeType='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-                    )
-                    ext = '.xlsx'
-                else:
-                    # Regular Excel file
-                    request = drive_service.files().get_media(fileId=file["id"])
-                    ext = '.xlsx' if file['name'].lower().endswith('.xlsx') else '.xls'
-                
-                # Gunakan nama file yang aman
-                safe_filename = "".join(c for c in file['name'] if c.isalnum() or c in (' ', '-', '_', '.')).rstrip()
-                if not safe_filename.lower().endswith(('.xlsx', '.xls')):
-                    safe_filename += ext
-                    
-                file_path = os.path.join(save_folder, safe_filename)
-
-                with io.FileIO(file_path, 'wb') as fh:
-                    downloader = MediaIoBaseDownload(fh, request)
-                    done = False
-                    while not done:
-                        status, done = downloader.next_chunk()
-                        if status:
-                            print(f"      Progress: {int(status.progress() * 100)}%")
-
-                file_paths.append({
-                    'path': file_path,
-                    'name': file['name'],
-                    'temp_folder': save_folder,
-                    'mime_type': file['mimeType'],
-                    'modified_time': file.get('modifiedTime')
-                })
-                print(f"      ✅ Berhasil download: {safe_filename}")
-
-            except Exception as e:
-                print(f"      ❌ Gagal download {file['name']}: {str(e)}")
-                continue
+        for file_info in file_paths:
+            file_info['temp_folder'] = save_folder
 
-        print(f"✅ Berhasil download {len(file_paths)} file Excel dari {folder_name}")
         return file_paths
 
     except Exception as e:
@@ -539,16 +537,50 @@ def download_excel_files_from_drive(credentials, folder_id, folder_name):
         traceback.print_exc()
         return []
 
+
 # ============================
 # FUNGSI PROSES DATA ERDKK
 # ============================
+def select_erdkk_columns(columns):
+    """
+    Pilih kolom ERDKK yang mungkin dipakai process_erdkk_file hanya dari header.
+    Mengembalikan None (baca semua kolom) jika kolom KTP/NIK tidak bisa dikenali
+    dari namanya, karena pencarian cadangannya memeriksa isi kolom.
+    """
+    names = [str(col).strip().upper() for col in columns]
+    
+    ktp_cols = [name for name in names if 'KTP' in name or 'NIK' in name]
+    if not ktp_cols:
+        return None
+    
+    nama_cols = ([name for name in names if 'NAMA' in name and 'PETANI' in name]
+                 or [name for name in names if 'NAMA' in name])
+    nama_col = nama_cols[0] if nama_cols else ''
+    
+    # Kolom cadangan Kecamatan: kolom pertama yang bukan KTP/NIK atau Nama
+    default_kec_col = next((name for name in names if name != ktp_cols[0] and name != nama_col), None)
+    
+    wilayah_patterns = (ERDKK_KECAMATAN_PATTERNS + ERDKK_GAPOKTAN_PATTERNS +
+                        ERDKK_WILAYAH_PATTERNS + ERDKK_POKTAN_PATTERNS)
+    pupuk_patterns = [pattern for patterns in ERDKK_PUPUK_PATTERNS.values() for pattern in patterns]
+    
+    selected = []
+    for col, name in zip(columns, names):
+        if ('KTP' in name or 'NIK' in name or 'NAMA' in name
+                or ('KODE' in name and 'KIOS' in name)
+                or name == default_kec_col
+                or any(pattern in name for pattern in wilayah_patterns)
+                or any(re.search(pattern, name, re.IGNORECASE) for pattern in pupuk_patterns)):
+            selected.append(col)
+    return selected
+
 def process_erdkk_file(file_path, file_name):
     """Proses satu file ERDKK - DIPERBAIKI DENGAN MENCARI KECAMATAN DARI GAPOKTAN"""
     try:
         print(f"\n   📖 Memproses ERDKK: {file_name}")
 
-        # Baca file Excel
-        df = pd.read_excel(file_path, dtype=str)
+        # Baca file Excel (header dulu, lalu hanya kolom yang dipakai)
+        df, _, _ = read_excel_sheet(file_path, select_columns=select_erdkk_columns, dtype=str)
         
         # Standardize column names
         df.columns = df.columns.astype(str).str.strip().str.upper()
@@ -620,7 +652,7 @@ def process_erdkk_file(file_path, file_name):
         kec_col = ''
         
         # 1. Cari kolom KECAMATAN langsung (prioritas tinggi)
-        kec_patterns_primary = ['KECAMATAN', 'KEC', 'WILAYAH KECAMATAN']
+        kec_patterns_primary = ERDKK_KECAMATAN_PATTERNS
         for col in df.columns:
             col_upper = col.upper()
             for pattern in kec_patterns_primary:
@@ -638,7 +670,7 @@ def process_erdkk_file(file_path, file_name):
         
         # 2. Jika tidak ada, cari kolom GAPOKTAN (case insensitive)
         if not kec_col:
-            gapoktan_patterns = ['GAPOKTAN', 'GABUNGAN KELOMPOK TANI', 'GAPOKTAN/NAMA KELOMPOK']
+            gapoktan_patterns = ERDKK_GAPOKTAN_PATTERNS
             for col in df.columns:
                 col_upper = col.upper()
                 for pattern in gapoktan_patterns:
@@ -656,7 +688,7 @@ def process_erdkk_file(file_path, file_name):
         
         # 3. Jika tidak ada GAPOKTAN, cari kolom lain yang mungkin berisi info wilayah
         if not kec_col:
-            wilayah_patterns = ['DESA', 'KELURAHAN', 'DUSUN', 'KAMPUNG', 'NAMA DESA', 'DESA/KELURAHAN']
+            wilayah_patterns = ERDKK_WILAYAH_PATTERNS
             for col in df.columns:
                 col_upper = col.upper()
                 for pattern in wilayah_patterns:
@@ -669,7 +701,7 @@ def process_erdkk_file(file_path, file_name):
         
         # 4. Jika masih tidak ditemukan, gunakan kolom POKTAN
         if not kec_col:
-            poktan_patterns = ['POKTAN', 'KELOMPOK TANI', 'NAMA POKTAN']
+            poktan_patterns = ERDKK_POKTAN_PATTERNS
             for col in df.columns:
                 col_upper = col.upper()
                 for pattern in poktan_patterns:
@@ -707,15 +739,7 @@ def process_erdkk_file(file_path, file_name):
         }
         
         # Pattern untuk setiap jenis pupuk
-        pupuk_patterns = {
-            'UREA': [r'UREA', r'UERA'],
-            'NPK': [r'NPK(?!.*FORMULA)', r'NPK\s+[^F]'],  # NPK tapi bukan NPK FORMULA
-            'SP36': [r'SP36', r'SP-36'],
-            'ZA': [r'ZA'],
-            'NPK_FORMULA': [r'NPK.*FORMULA', r'FORMULA.*NPK'],
-            'ORGANIK': [r'ORGANIK(?!.*CAIR)', r'ORGANIK\s+[^C]'],  # ORGANIK tapi bukan ORGANIK CAIR
-            'ORGANIK_CAIR': [r'ORGANIK.*CAIR', r'CAIR.*ORGANIK']
-        }
+        pupuk_patterns = ERDKK_PUPUK_PATTERNS
         
         # Cari semua kolom yang mengandung kata kunci pupuk
         for col in df.columns:
@@ -740,127 +764,57 @@ def process_erdkk_file(file_path, file_name):
                 print(f"   ⚠️  {pupuk_type}: Tidak ditemukan kolom")
         
         # ============================================
-        # PROSES SETIAP BARIS
+        # PROSES SEMUA BARIS SEKALIGUS (VEKTORISASI)
         # ============================================
-        results = []
-        skipped_rows = 0
+        total_rows = len(df)
         
-        for idx, row in df.iterrows():
-            try:
-                # Clean NIK
-                nik_value = row.get(ktp_col, '')
-                nik = clean_nik(nik_value)
-                if not nik or len(nik) != 16:
-                    skipped_rows += 1
-                    if idx < 3:
-                        print(f"   ⚠️  Baris {idx}: NIK '{nik_value}' tidak valid -> '{nik}'")
-                    continue
-                
-                # Ambil nilai kecamatan dari kolom yang telah ditentukan
-                kecamatan_value = row.get(kec_col, '') if kec_col else ''
-                if pd.isna(kecamatan_value):
-                    kecamatan_value = ''
-                
-                result = {
-                    'NIK': nik,
-                    'NAMA_PETANI': str(row.get(nama_col, '')).strip() if nama_col and pd.notna(row.get(nama_col)) else '',
-                    'KECAMATAN': str(kecamatan_value).strip().upper(),
-                    'KODE_KIOS': str(row.get(kode_kios_col, '')).strip().upper() if kode_kios_col and pd.notna(row.get(kode_kios_col)) else '',
-                    'NAMA_KIOS': str(row.get(nama_kios_col, '')).strip() if nama_kios_col and pd.notna(row.get(nama_kios_col)) else '',
-                    'TOTAL_UREA': 0,
-                    'TOTAL_NPK': 0,
-                    'TOTAL_SP36': 0,
-                    'TOTAL_ZA': 0,
-                    'TOTAL_NPK_FORMULA': 0,
-                    'TOTAL_ORGANIK': 0,
-                    'TOTAL_ORGANIK_CAIR': 0,
-                    'FILE_SOURCE': file_name
-                }
-                
-                # Hitung total per jenis pupuk dari semua kolom yang ditemukan
-                for pupuk_type, cols in pupuk_columns.items():
-                    if not cols:
-                        continue
-                    
-                    total = 0
-                    for col in cols:
-                        value = row.get(col)
-                        if pd.notna(value):
-                            try:
-                                # Coba konversi ke float
-                                if isinstance(value, (int, float)):
-                                    num_value = float(value)
-                                elif isinstance(value, str):
-                                    # Bersihkan string dari karakter non-numeric
-                                    clean_str = re.sub(r'[^\d.-]', '', value)
-                                    if clean_str:
-                                        num_value = float(clean_str)
-                                    else:
-                                        num_value = 0
-                                else:
-                                    num_value = 0
-                                
-                                total += num_value
-                            except (ValueError, TypeError):
-                                # Jika tidak bisa dikonversi, coba parsing string
-                                if isinstance(value, str):
-                                    # Cari angka dalam string
-                                    numbers = re.findall(r'\d+\.?\d*', value)
-                                    if numbers:
-                                        try:
-                                            num_value = float(numbers[0])
-                                            total += num_value
-                                        except:
-                                            pass
-                    
-                    # Simpan total per jenis pupuk
-                    if pupuk_type == 'UREA':
-                        result['TOTAL_UREA'] = total
-                    elif pupuk_type == 'NPK':
-                        result['TOTAL_NPK'] = total
-                    elif pupuk_type == 'SP36':
-                        result['TOTAL_SP36'] = total
-                    elif pupuk_type == 'ZA':
-                        result['TOTAL_ZA'] = total
-                    elif pupuk_type == 'NPK_FORMULA':
-                        result['TOTAL_NPK_FORMULA'] = total
-                    elif pupuk_type == 'ORGANIK':
-                        result['TOTAL_ORGANIK'] = total
-                    elif pupuk_type == 'ORGANIK_CAIR':
-                        result['TOTAL_ORGANIK_CAIR'] = total
-                
-                # Cek apakah ada data pupuk
-                has_pupuk_data = any([
-                    result['TOTAL_UREA'] > 0,
-                    result['TOTAL_NPK'] > 0,
-                    result['TOTAL_SP36'] > 0,
-                    result['TOTAL_ZA'] > 0,
-                    result['TOTAL_NPK_FORMULA'] > 0,
-                    result['TOTAL_ORGANIK'] > 0,
-                    result['TOTAL_ORGANIK_CAIR'] > 0
-                ])
-                
-                if has_pupuk_data:
-                    results.append(result)
-                else:
-                    skipped_rows += 1
-                    if idx < 3:
-                        print(f"   ⚠️  Baris {idx}: Tidak ada data pupuk")
-                
-            except Exception as e:
-                if idx < 3:
-                    print(f"   ⚠️  Error processing row {idx}: {e}")
-                skipped_rows += 1
-                continue
+        # Clean NIK per kolom (leading zero dilengkapi), hanya NIK 16 digit yang dipakai
+        nik_series, nik_report = clean_nik_series(df[ktp_col], zfill=True)
+        print_nik_report(nik_report, file_name)
+        
+        # Perilaku lama ERDKK dipertahankan: KTP terisi tanpa angka (mis. '-')
+        # menjadi 0000000000000000 dan tetap dihitung di total kecamatan/kios
+        nik_series = nik_series.where(nik_series.notna() | df[ktp_col].isna(), '0' * 16)
+        valid_nik_mask = nik_series.str.len() == 16
+        
+        invalid_preview = df.index[~valid_nik_mask & (df.index < 3)]
+        for idx in invalid_preview:
+            print(f"   ⚠️  Baris {idx}: NIK '{df.at[idx, ktp_col]}' tidak valid -> '{nik_series.at[idx]}'")
+        
+        result_df = pd.DataFrame({'NIK': nik_series}, index=df.index)
+        result_df['NAMA_PETANI'] = text_column(df, nama_col)
+        result_df['KECAMATAN'] = text_column(df, kec_col).str.upper()
+        result_df['KODE_KIOS'] = text_column(df, kode_kios_col).str.upper()
+        result_df['NAMA_KIOS'] = text_column(df, nama_kios_col)
+        
+        # Hitung total per jenis pupuk dari semua kolom yang ditemukan
+        for pupuk_type, cols in pupuk_columns.items():
+            total = pd.Series(0.0, index=df.index)
+            for col in cols:
+                total = total + parse_pupuk_series(df[col])
+            result_df[f'TOTAL_{pupuk_type}'] = total
+        
+        result_df['FILE_SOURCE'] = file_name
+        
+        # Cek apakah ada data pupuk
+        total_cols = [f'TOTAL_{pupuk_type}' for pupuk_type in pupuk_columns]
+        has_pupuk_mask = (result_df[total_cols] > 0).any(axis=1)
+        
+        no_pupuk_preview = df.index[valid_nik_mask & ~has_pupuk_mask & (df.index < 3)]
+        for idx in no_pupuk_preview:
+            print(f"   ⚠️  Baris {idx}: Tidak ada data pupuk")
+        
+        results = result_df[valid_nik_mask & has_pupuk_mask].reset_index(drop=True)
+        skipped_rows = total_rows - len(results)
         
         print(f"   ✅ Berhasil diproses: {len(results)} baris data")
         if skipped_rows > 0:
             print(f"   ⚠️  Dilewati: {skipped_rows} baris (NIK tidak valid/tidak ada data pupuk)")
         
         # Tampilkan sample dengan detail
-        if results:
+        if not results.empty:
             print(f"\n   🔍 Sample data (baris pertama):")
-            sample = results[0]
+            sample = results.iloc[0]
             print(f"     NIK: {sample['NIK']}")
             print(f"     NAMA: {sample['NAMA_PETANI'][:30]}{'...' if len(sample['NAMA_PETANI']) > 30 else ''}")
             print(f"     KECAMATAN: {sample['KECAMATAN']}")
@@ -869,8 +823,8 @@ def process_erdkk_file(file_path, file_name):
             print(f"     NPK: {sample['TOTAL_NPK']:.2f} Kg")
             
             # Hitung total untuk verifikasi
-            total_urea = sum(r['TOTAL_UREA'] for r in results)
-            total_npk = sum(r['TOTAL_NPK'] for r in results)
+            total_urea = results['TOTAL_UREA'].sum()
+            total_npk = results['TOTAL_NPK'].sum()
             print(f"\n   📊 Total dalam file ini:")
             print(f"     Total UREA: {total_urea:.2f} Kg")
             print(f"     Total NPK: {total_npk:.2f} Kg")
@@ -880,16 +834,16 @@ def process_erdkk_file(file_path, file_name):
     except Exception as e:
         print(f"   ❌ Error memproses ERDKK {file_name}: {str(e)}")
         traceback.print_exc()
-        return []
+        return pd.DataFrame(columns=ERDKK_RESULT_COLUMNS)
 
-def aggregate_erdkk_by_kecamatan(all_erdkk_rows):
+def aggregate_erdkk_by_kecamatan(df_erdkk):
     """Agregasi data ERDKK per Kecamatan"""
-    if not all_erdkk_rows:
+    if df_erdkk is None or df_erdkk.empty:
         print("⚠️  Tidak ada data ERDKK untuk diagregasi")
         return pd.DataFrame()
 
     print("\n📊 Mengagregasi data ERDKK per KECAMATAN...")
-    df = pd.DataFrame(all_erdkk_rows)
+    df = df_erdkk.copy()
     
     # Handle kasus KECAMATAN kosong
     if 'KECAMATAN' not in df.columns or df['KECAMATAN'].isna().all():
@@ -945,14 +899,14 @@ def aggregate_erdkk_by_kecamatan(all_erdkk_rows):
     
     return kec_df
 
-def aggregate_erdkk_by_kios(all_erdkk_rows):
+def aggregate_erdkk_by_kios(df_erdkk):
     """Agregasi data ERDKK per Kode Kios"""
-    if not all_erdkk_rows:
+    if df_erdkk is None or df_erdkk.empty:
         print("⚠️  Tidak ada data ERDKK untuk diagregasi")
         return pd.DataFrame()
 
     print("\n📊 Mengagregasi data ERDKK per KIOS...")
-    df = pd.DataFrame(all_erdkk_rows)
+    df = df_erdkk.copy()
     
     # Filter yang punya KECAMATAN dan KODE_KIOS
     mask = df['KECAMATAN'].notna() & (df['KECAMATAN'] != '') & df['KODE_KIOS'].notna() & (df['KODE_KIOS'] != '')
@@ -1001,31 +955,40 @@ def aggregate_erdkk_by_kios(all_erdkk_rows):
 # FUNGSI PROSES DATA REALISASI - VERSI DIPERBAIKI
 # ============================
 def process_realisasi_file(file_path, file_name):
-    """Proses satu file realisasi - VERSI DIPERBAIKI"""
+    """
+    Proses satu file realisasi - VERSI DIPERBAIKI.
+    Setiap batch langsung diubah menjadi DataFrame ringkas; mengembalikan
+    DataFrame gabungan semua batch (kosong jika file gagal/tidak ada data).
+    """
     try:
         print(f"\n   📖 Memproses Realisasi: {file_name}")
 
-        # Coba sheet 'Worksheet' terlebih dahulu (seperti di script lain)
+        # Pilih sheet 'Worksheet' dari metadata workbook (jika tidak ada, sheet pertama),
+        # lalu baca bertahap per batch sehingga memori dibatasi satu batch
         try:
-            df = pd.read_excel(file_path, sheet_name='Worksheet', dtype=str)
-            print(f"   ✅ Membaca sheet 'Worksheet'")
-        except:
-            try:
-                # Coba semua sheet
-                xls = pd.ExcelFile(file_path)
-                print(f"   📋 Sheet yang tersedia: {xls.sheet_names}")
-                # Ambil sheet pertama
-                sheet_name = xls.sheet_names[0]
-                df = pd.read_excel(file_path, sheet_name=sheet_name, dtype=str)
+            sheet_name, sheet_names, batches = open_excel_batches(
+                file_path, sheet_candidates=REALISASI_SHEET_CANDIDATES
+            )
+            if sheet_name.lower() == 'worksheet':
+                print(f"   ✅ Membaca sheet '{sheet_name}'")
+            else:
+                print(f"   📋 Sheet yang tersedia: {sheet_names}")
                 print(f"   ✅ Membaca sheet pertama: {sheet_name}")
-            except Exception as e:
-                print(f"   ❌ Gagal membaca file: {e}")
-                return []
+            
+            # Batch pertama dipakai untuk identifikasi kolom
+            df = next(batches, None)
+        except Exception as e:
+            print(f"   ❌ Gagal membaca file: {e}")
+            return pd.DataFrame()
+        
+        if df is None:
+            print(f"   ⚠️  Sheet '{sheet_name}' tidak berisi data")
+            return pd.DataFrame()
         
         # Clean column names
-        df.columns = [clean_column_name(col) for col in df.columns]
+        columns = [clean_column_name(col) for col in df.columns]
+        df.columns = columns
         
-        print(f"   📊 DataFrame shape: {df.shape}")
         print(f"   📋 Kolom yang ada: {list(df.columns)[:15]}")
         
         # ============================================
@@ -1135,7 +1098,7 @@ def process_realisasi_file(file_path, file_name):
             sample_niks = df[nik_col].head(3).astype(str).tolist()
             print(f"   🔍 Sample NIK (3 pertama):")
             for i, nik in enumerate(sample_niks):
-                cleaned = clean_nik(nik)
+                cleaned = clean_nik(nik, zfill=True)
                 print(f"     {i+1}. '{nik}' -> clean: '{cleaned}' (panjang: {len(cleaned) if cleaned else 0})")
         
         # ============================================
@@ -1193,80 +1156,80 @@ def process_realisasi_file(file_path, file_name):
         
         if not nik_col:
             print(f"   ❌ Tidak dapat menemukan kolom NIK, melewati file ini")
-            return []
+            return pd.DataFrame()
         
-        results = []
+        batch_frames = []
         skipped_rows = 0
         valid_rows = 0
         
-        for idx, row in df.iterrows():
+        total_rows = 0
+        input_date_col = None
+        latest_input_dates = []
+        latest_tanggal_dates = []
+        
+        while df is not None:
+            df.columns = columns
+            # Nama kolom ganda setelah dibersihkan: pakai kolom pertama
+            df = df.loc[:, ~df.columns.duplicated()]
+            total_rows += len(df)
+            
+            # Simpan tanggal input terbaru file ini untuk extract_latest_input_date_from_files
             try:
-                # Clean NIK
-                nik_value = str(row[nik_col]) if nik_col in row else ''
-                nik = clean_nik(nik_value)
-                
-                # Validasi NIK - harus 16 digit
-                if not nik or len(nik) != 16:
-                    skipped_rows += 1
-                    if idx < 3:  # Log hanya untuk 3 baris pertama
-                        print(f"   ⚠️  Baris {idx}: NIK '{nik_value}' tidak valid -> '{nik}'")
-                    continue
-                
-                # Build result dictionary
-                result = {
-                    'NIK': nik,
-                    'NAMA_PETANI': str(row[nama_col]).strip() if nama_col and nama_col in row and pd.notna(row[nama_col]) else '',
-                    'KECAMATAN': str(row[kec_col]).strip().upper() if kec_col and kec_col in row and pd.notna(row[kec_col]) else '',
-                    'KODE_KIOS': str(row[kode_kios_col]).strip().upper() if kode_kios_col and kode_kios_col in row and pd.notna(row[kode_kios_col]) else '',
-                    'NAMA_KIOS': str(row[nama_kios_col]).strip() if nama_kios_col and nama_kios_col in row and pd.notna(row[nama_kios_col]) else '',
-                    'STATUS': str(row[status_col]).strip() if status_col and status_col in row and pd.notna(row[status_col]) else '',
-                    'REALISASI_UREA': 0,
-                    'REALISASI_NPK': 0,
-                    'REALISASI_SP36': 0,
-                    'REALISASI_ZA': 0,
-                    'REALISASI_NPK_FORMULA': 0,
-                    'REALISASI_ORGANIK': 0,
-                    'REALISASI_ORGANIK_CAIR': 0,
-                    'FILE_SOURCE': file_name
-                }
-                
-                # Hitung realisasi pupuk
-                for pupuk_type, col_name in pupuk_cols_found.items():
-                    if col_name in row and pd.notna(row[col_name]):
-                        try:
-                            value = str(row[col_name])
-                            # Bersihkan dari karakter non-numeric
-                            clean_value = re.sub(r'[^\d.-]', '', value)
-                            if clean_value:
-                                num_value = float(clean_value)
-                            else:
-                                num_value = 0
-                        except:
-                            num_value = 0
-                        
-                        if pupuk_type == 'UREA':
-                            result['REALISASI_UREA'] = num_value
-                        elif pupuk_type == 'NPK':
-                            result['REALISASI_NPK'] = num_value
-                        elif pupuk_type == 'SP36':
-                            result['REALISASI_SP36'] = num_value
-                        elif pupuk_type == 'ZA':
-                            result['REALISASI_ZA'] = num_value
-                        elif pupuk_type == 'NPK_FORMULA':
-                            result['REALISASI_NPK_FORMULA'] = num_value
-                        elif pupuk_type == 'ORGANIK':
-                            result['REALISASI_ORGANIK'] = num_value
-                        elif pupuk_type == 'ORGANIK_CAIR':
-                            result['REALISASI_ORGANIK_CAIR'] = num_value
-                
-                results.append(result)
-                valid_rows += 1
-                
+                input_date_col, batch_latest = find_latest_input_date(df)
+                if batch_latest is not None:
+                    latest_input_dates.append(batch_latest)
             except Exception as e:
-                skipped_rows += 1
-                if idx < 3:
-                    print(f"   ⚠️  Error processing row {idx}: {e}")
-                continue
+                print(f"   ⚠️  Gagal membaca tanggal input: {e}")
+            
+            # Tanggal input untuk ditampilkan di log
+            if tgl_input_col:
+                try:
+                    batch_tanggal = pd.to_datetime(df[tgl_input_col], errors='coerce', dayfirst=True).max()
+                    if pd.notna(batch_tanggal):
+                        latest_tanggal_dates.append(batch_tanggal)
+                except Exception as e:
+                    print(f"   ⚠️  Gagal parsing tanggal dari kolom '{tgl_input_col}': {e}")
+            
+            # Clean NIK satu batch sekaligus (leading zero dilengkapi)
+            nik_series, nik_report = clean_nik_series(df[nik_col], zfill=True)
+            print_nik_report(nik_report, file_name)
+            
+            # Aturan sama dengan sisi ERDKK (perilaku lama): NIK kosong/tanpa angka
+            # menjadi 0000000000000000 dan pupuknya tetap dihitung di total
+            nik_series = nik_series.fillna('0' * 16)
+            
+            # Validasi NIK - harus 16 digit
+            valid_mask = nik_series.str.len() == 16
+            skipped_rows += int((~valid_mask).sum())
+            
+            # Seluruh batch diubah sekaligus menjadi DataFrame ringkas (tanpa loop per baris)
+            batch = df[valid_mask]
+            batch_result = pd.DataFrame({
+                'NIK': nik_series[valid_mask],
+                'NAMA_PETANI': text_column(batch, nama_col),
+                'KECAMATAN': text_column(batch, kec_col).str.upper(),
+                'KODE_KIOS': text_column(batch, kode_kios_col).str.upper(),
+                'NAMA_KIOS': text_column(batch, nama_kios_col),
+                'STATUS': text_column(batch, status_col)
+            })
+            
+            # Hitung realisasi pupuk per kolom
+            for pupuk_type, result_key in REALISASI_PUPUK_KEYS.items():
+                col_name = pupuk_cols_found.get(pupuk_type)
+                batch_result[result_key] = parse_realisasi_series(batch[col_name]) if col_name else 0.0
+            
+            batch_result['FILE_SOURCE'] = file_name
+            batch_frames.append(batch_result.reset_index(drop=True))
+            valid_rows += len(batch_result)
+            
+            df = next(batches, None)
+        
+        results = pd.concat(batch_frames, ignore_index=True) if batch_frames else pd.DataFrame()
+        
+        print(f"   📊 Total baris dibaca: {total_rows}")
+        LATEST_INPUT_DATE_CACHE[file_path] = (
+            input_date_col, max(latest_input_dates) if latest_input_dates else None
+        )
         
         print(f"   ✅ Berhasil: {valid_rows} baris data valid")
         if skipped_rows > 0:
@@ -1274,23 +1237,16 @@ def process_realisasi_file(file_path, file_name):
         
         # Tampilkan informasi tanggal input jika ditemukan
         if tgl_input_col:
-            try:
-                # Coba parsing tanggal dari kolom yang ditemukan
-                df[tgl_input_col] = pd.to_datetime(df[tgl_input_col], errors='coerce', dayfirst=True)
-                valid_dates = df[tgl_input_col].dropna()
-                
-                if not valid_dates.empty:
-                    latest_tanggal_file = valid_dates.max()
-                    print(f"   📅 Tanggal input terbaru dalam file ini: {latest_tanggal_file.strftime('%d %b %Y %H:%M:%S')}")
-                else:
-                    print(f"   ⚠️  Kolom '{tgl_input_col}' ditemukan tapi tidak ada tanggal valid")
-            except Exception as e:
-                print(f"   ⚠️  Gagal parsing tanggal dari kolom '{tgl_input_col}': {e}")
+            if latest_tanggal_dates:
+                latest_tanggal_file = max(latest_tanggal_dates)
+                print(f"   📅 Tanggal input terbaru dalam file ini: {latest_tanggal_file.strftime('%d %b %Y %H:%M:%S')}")
+            else:
+                print(f"   ⚠️  Kolom '{tgl_input_col}' ditemukan tapi tidak ada tanggal valid")
         
         # Tampilkan sample
-        if results:
+        if not results.empty:
             print(f"\n   🔍 Sample data (baris pertama):")
-            sample = results[0]
+            sample = results.iloc[0]
             print(f"     NIK: {sample['NIK']}")
             print(f"     NAMA: {sample['NAMA_PETANI'][:30]}{'...' if len(sample['NAMA_PETANI']) > 30 else ''}")
             print(f"     STATUS: {sample['STATUS']}")
@@ -1304,23 +1260,23 @@ def process_realisasi_file(file_path, file_name):
     except Exception as e:
         print(f"   ❌ Error memproses realisasi {file_name}: {str(e)}")
         traceback.print_exc()
-        return []
+        return pd.DataFrame()
 
-def aggregate_realisasi_by_kecamatan(all_realisasi_rows, filter_acc_pusat=False):
+def aggregate_realisasi_by_kecamatan(realisasi_df, filter_acc_pusat=False):
     """Agregasi data realisasi per Kecamatan"""
-    if not all_realisasi_rows:
+    if realisasi_df.empty:
         print(f"⚠️  Tidak ada data realisasi untuk diagregasi (filter: {'ACC PUSAT' if filter_acc_pusat else 'ALL'})")
         return pd.DataFrame(columns=['KECAMATAN', 'REALISASI_UREA', 'REALISASI_NPK', 'REALISASI_SP36', 
                                      'REALISASI_ZA', 'REALISASI_NPK_FORMULA', 'REALISASI_ORGANIK', 'REALISASI_ORGANIK_CAIR'])
 
     print(f"\n📊 Mengagregasi data REALISASI per KECAMATAN ({'ACC PUSAT' if filter_acc_pusat else 'ALL'})...")
-    df = pd.DataFrame(all_realisasi_rows)
+    df = realisasi_df.copy()
     
     # Filter berdasarkan status ACC PUSAT jika diperlukan
     if filter_acc_pusat:
         if 'STATUS' in df.columns:
             initial_count = len(df)
-            mask = df['STATUS'].apply(is_status_disetujui_pusat)
+            mask = classify_status(df['STATUS'], is_status_disetujui_pusat)
             df = df[mask]
             print(f"   Filter ACC PUSAT: {len(df)}/{initial_count} baris tersisa")
         else:
@@ -1379,22 +1335,22 @@ def aggregate_realisasi_by_kecamatan(all_realisasi_rows, filter_acc_pusat=False)
     
     return kec_df
 
-def aggregate_realisasi_by_kios(all_realisasi_rows, filter_acc_pusat=False):
+def aggregate_realisasi_by_kios(realisasi_df, filter_acc_pusat=False):
     """Agregasi data realisasi per Kode Kios"""
-    if not all_realisasi_rows:
+    if realisasi_df.empty:
         print(f"⚠️  Tidak ada data realisasi untuk diagregasi (filter: {'ACC PUSAT' if filter_acc_pusat else 'ALL'})")
         return pd.DataFrame(columns=['KECAMATAN', 'KODE_KIOS', 'NAMA_KIOS', 'REALISASI_UREA', 'REALISASI_NPK', 
                                      'REALISASI_SP36', 'REALISASI_ZA', 'REALISASI_NPK_FORMULA', 
                                      'REALISASI_ORGANIK', 'REALISASI_ORGANIK_CAIR'])
 
     print(f"\n📊 Mengagregasi data REALISASI per KIOS ({'ACC PUSAT' if filter_acc_pusat else 'ALL'})...")
-    df = pd.DataFrame(all_realisasi_rows)
+    df = realisasi_df.copy()
     
     # Filter berdasarkan status ACC PUSAT jika diperlukan
     if filter_acc_pusat:
         if 'STATUS' in df.columns:
             initial_count = len(df)
-            mask = df['STATUS'].apply(is_status_disetujui_pusat)
+            mask = classify_status(df['STATUS'], is_status_disetujui_pusat)
             df = df[mask]
             print(f"   Filter ACC PUSAT: {len(df)}/{initial_count} baris tersisa")
         else:
@@ -1765,144 +1721,153 @@ def create_comparison_kios(erdkk_kios_df, realisasi_kios_df_all, realisasi_kios_
 # ============================
 # FUNGSI UPDATE GOOGLE SHEETS
 # ============================
-def format_worksheet_with_date(worksheet, df, latest_tanggal_input=None):
-    """Format worksheet dengan warna header, border, dan informasi tanggal"""
-    try:
-        # Format header (baris 1)
-        header_format = {
-            "backgroundColor": {
-                "red": 0.2,
-                "green": 0.6,
-                "blue": 0.8
-            },
-            "textFormat": {
-                "foregroundColor": {
-                    "red": 1.0,
-                    "green": 1.0,
-                    "blue": 1.0
-                },
-                "bold": True,
-                "fontSize": 11
-            },
-            "horizontalAlignment": "CENTER",
-            "verticalAlignment": "MIDDLE",
-            "wrapStrategy": "WRAP"
-        }
-        
-        # Format untuk baris TOTAL (baris terakhir)
-        total_format = {
-            "backgroundColor": {
-                "red": 0.9,
-                "green": 0.9,
-                "blue": 0.9
-            },
-            "textFormat": {
-                "bold": True
-            }
-        }
-        
-        # Format untuk kolom persentase
-        percent_format = {
-            "numberFormat": {
-                "type": "PERCENT",
-                "pattern": "0.00%"
-            }
-        }
-        
-        # Format untuk kolom angka
-        number_format = {
-            "numberFormat": {
-                "type": "NUMBER",
-                "pattern": "#,##0.00"
-            }
-        }
-        
-        # Format header
-        worksheet.format("1:1", header_format)
-        
-        # Format baris TOTAL (jika ada)
-        total_row = len(df) + 1  # +1 karena header di baris 1
-        if 'KECAMATAN' in df.columns and 'TOTAL' in df['KECAMATAN'].values:
-            worksheet.format(f"{total_row}:{total_row}", total_format)
-        
-        # Format kolom persentase
-        for col_idx, col_name in enumerate(df.columns, start=1):
-            if '%' in col_name:
-                col_letter = gspread.utils.rowcol_to_a1(1, col_idx)[0]
-                worksheet.format(f"{col_letter}2:{col_letter}{total_row}", percent_format)
-            elif any(x in col_name for x in ['ERDKK', 'REALISASI', 'SELISIH']):
-                col_letter = gspread.utils.rowcol_to_a1(1, col_idx)[0]
-                worksheet.format(f"{col_letter}2:{col_letter}{total_row}", number_format)
-        
-        # Set lebar kolom otomatis
-        try:
-            worksheet.columns_auto_resize(start_column_index=0, end_column_index=len(df.columns))
-        except:
-            pass
-        
-        # Freeze header row
-        try:
-            worksheet.freeze(rows=1)
-        except:
-            pass
-        
-        print(f"      ✅ Formatting diterapkan untuk sheet {worksheet.title}")
-        
-    except Exception as e:
-        print(f"      ⚠️  Gagal formatting: {e}")
+# Format header (baris 1)
+HEADER_FORMAT = {
+    "backgroundColor": {
+        "red": 0.2,
+        "green": 0.6,
+        "blue": 0.8
+    },
+    "textFormat": {
+        "foregroundColor": {
+            "red": 1.0,
+            "green": 1.0,
+            "blue": 1.0
+        },
+        "bold": True,
+        "fontSize": 11
+    },
+    "horizontalAlignment": "CENTER",
+    "verticalAlignment": "MIDDLE",
+    "wrapStrategy": "WRAP"
+}
+
+# Format untuk baris TOTAL (baris terakhir)
+TOTAL_FORMAT = {
+    "backgroundColor": {
+        "red": 0.9,
+        "green": 0.9,
+        "blue": 0.9
+    },
+    "textFormat": {
+        "bold": True
+    }
+}
+
+# Format untuk kolom persentase
+PERCENT_FORMAT = {
+    "numberFormat": {
+        "type": "PERCENT",
+        "pattern": "0.00%"
+    }
+}
+
+# Format untuk kolom angka
+NUMBER_FORMAT = {
+    "numberFormat": {
+        "type": "NUMBER",
+        "pattern": "#,##0.00"
+    }
+}
+
+def worksheet_format_requests(sheet_id, df):
+    """Request format sheet (header, baris TOTAL, kolom persen/angka, freeze header) untuk batchUpdate"""
+    total_row = len(df) + 1  # +1 karena header di baris 1
+    
+    requests = [cell_format_request(grid_range(sheet_id, 0, 1), HEADER_FORMAT)]
+    
+    # Format baris TOTAL (jika ada)
+    if 'KECAMATAN' in df.columns and 'TOTAL' in df['KECAMATAN'].values:
+        requests.append(cell_format_request(grid_range(sheet_id, total_row - 1, total_row), TOTAL_FORMAT))
+    
+    # Format kolom persentase dan angka (baris 2 sampai baris terakhir)
+    for col_idx, col_name in enumerate(df.columns):
+        column_range = grid_range(sheet_id, 1, total_row, col_idx, col_idx + 1)
+        if '%' in col_name:
+            requests.append(cell_format_request(column_range, PERCENT_FORMAT))
+        elif any(x in col_name for x in ['ERDKK', 'REALISASI', 'SELISIH']):
+            requests.append(cell_format_request(column_range, NUMBER_FORMAT))
+    
+    # Freeze header row
+    requests.append(freeze_rows_request(sheet_id, 1))
+    
+    return requests
 
 def batch_update_worksheets(spreadsheet, updates):
-    """Batch update untuk multiple worksheets dengan formatting"""
+    """
+    Batch update untuk multiple worksheets dengan formatting: semua sheet
+    dikirim dalam satu batchUpdate (buat/resize/clear/format) + satu
+    values.batchUpdate (isi data) + satu batchUpdate auto resize kolom
+    """
     print(f"🔄 Memproses batch update untuk {len(updates)} worksheet...")
     
-    success_count = 0
-    for i, (sheet_name, data) in enumerate(updates):
-        try:
-            print(f"   📝 Processing {i+1}/{len(updates)}: {sheet_name} ({len(data)} baris)")
-            
-            try:
-                # Coba akses sheet yang sudah ada
-                worksheet = spreadsheet.worksheet(sheet_name)
-                print(f"      📝 Menggunakan sheet existing")
-                
-                # Clear existing data
-                safe_google_api_operation(worksheet.clear)
-                time.sleep(WRITE_DELAY)
-                
-            except gspread.exceptions.WorksheetNotFound:
-                # Buat sheet baru
-                worksheet = safe_google_api_operation(
-                    spreadsheet.add_worksheet, 
-                    title=sheet_name, 
-                    rows=str(max(1000, len(data) + 100)), 
-                    cols=str(min(50, len(data.columns) + 5))
-                )
-                print(f"      ✅ Membuat sheet baru: {sheet_name}")
-                time.sleep(WRITE_DELAY)
-            
-            # Update data
-            safe_google_api_operation(
-                worksheet.update,
-                [data.columns.values.tolist()] + data.values.tolist(),
-                value_input_option='USER_ENTERED'
-            )
-            
-            # Format worksheet
-            format_worksheet_with_date(worksheet, data, None)
-            
-            print(f"      ✅ Berhasil update data ({len(data)} baris, {len(data.columns)} kolom)")
-            success_count += 1
-            
-            if i < len(updates) - 1:
-                time.sleep(WRITE_DELAY)
-                
-        except Exception as e:
-            print(f"      ❌ Gagal update {sheet_name}: {str(e)}")
-            continue
+    try:
+        published = publish_sheets(
+            spreadsheet,
+            updates,
+            value_input_option='USER_ENTERED',
+            format_requests=worksheet_format_requests,
+            auto_resize=True,
+            api_call=safe_google_api_operation
+        )
+    except Exception as e:
+        print(f"   ❌ Gagal batch update: {str(e)}")
+        return 0
+    
+    for sheet_name, row_count, created in published:
+        status = "sheet baru" if created else "sheet existing"
+        print(f"   ✅ {sheet_name}: {row_count} baris ({status}), formatting diterapkan")
     
+    success_count = len(published)
     print(f"✅ Batch update selesai: {success_count}/{len(updates)} berhasil")
     return success_count
 
+# ============================
+# FUNGSI PARSING FILE PARALEL
+# ============================
+def process_realisasi_file_with_date(file_path, file_name):
+    """process_realisasi_file + tanggal input terbaru file (cache tidak ikut kembali dari proses worker)"""
+    realisasi_df = process_realisasi_file(file_path, file_name)
+    return realisasi_df, LATEST_INPUT_DATE_CACHE.get(file_path)
+
+def run_with_captured_output(func, *args):
+    """Jalankan func di proses worker dan kembalikan (hasil, log print)"""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        result = func(*args)
+    return result, output.getvalue()
+
+def parse_files(func, file_infos):
+    """
+    Jalankan func(path, name) untuk setiap file. Jika PARSE_WORKERS > 1 file
+    diparse paralel di process pool; hasil dan log setiap file tetap
+    dikembalikan sesuai urutan file. Hasil None berarti file gagal diproses.
+    """
+    workers = max(1, min(PARSE_WORKERS, len(file_infos)))
+    
+    if workers == 1:
+        for index, file_info in enumerate(file_infos, 1):
+            print(f"\n📄 Processing file {index}/{len(file_infos)}")
+            yield file_info, func(file_info['path'], file_info['name'])
+        return
+    
+    print(f"⚙️  Parsing {len(file_infos)} file dengan {workers} proses paralel")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(run_with_captured_output, func, file_info['path'], file_info['name'])
+            for file_info in file_infos
+        ]
+        
+        for index, (file_info, future) in enumerate(zip(file_infos, futures), 1):
+            print(f"\n📄 Processing file {index}/{len(file_infos)}")
+            try:
+                result, output = future.result()
+                print(output, end='')
+            except Exception as e:
+                print(f"   ❌ Gagal memproses {file_info['name']}: {str(e)}")
+                result = None
+            yield file_info, result
+
 # ============================
 # FUNGSI UTAMA DENGAN TANGGAL INPUT
 # ============================
@@ -1959,34 +1924,36 @@ def process_erdkk_vs_realisasi_with_date():
             print("⚠️  Tidak ada file ERDKK yang ditemukan")
             erdkk_kec_df = pd.DataFrame()
             erdkk_kios_df = pd.DataFrame()
-            all_erdkk_rows = []
+            df_erdkk = pd.DataFrame(columns=ERDKK_RESULT_COLUMNS)
         else:
             print(f"✅ Download selesai: {len(erdkk_files)} file")
             
             # Process setiap file ERDKK
             print("\n🔄 Memproses data ERDKK...")
-            all_erdkk_rows = []
+            erdkk_frames = []
             processed_files = 0
             
-            for file_info in erdkk_files:
-                print(f"\n📄 Processing file {processed_files + 1}/{len(erdkk_files)}")
-                file_rows = process_erdkk_file(file_info['path'], file_info['name'])
-                
-                if file_rows:
-                    all_erdkk_rows.extend(file_rows)
+            for file_info, file_df in parse_files(process_erdkk_file, erdkk_files):
+                if file_df is not None and not file_df.empty:
+                    erdkk_frames.append(file_df)
                     processed_files += 1
-                    print(f"   ✅ File '{file_info['name']}' berhasil diproses: {len(file_rows)} baris")
+                    print(f"   ✅ File '{file_info['name']}' berhasil diproses: {len(file_df)} baris")
                 else:
                     print(f"   ⚠️  File '{file_info['name']}' tidak menghasilkan data")
             
-            if all_erdkk_rows:
+            if erdkk_frames:
+                df_erdkk = pd.concat(erdkk_frames, ignore_index=True)
+            else:
+                df_erdkk = pd.DataFrame(columns=ERDKK_RESULT_COLUMNS)
+            
+            if not df_erdkk.empty:
                 print(f"\n✅ Total file ERDKK diproses: {processed_files}/{len(erdkk_files)}")
-                print(f"✅ Total baris data ERDKK: {len(all_erdkk_rows)}")
+                print(f"✅ Total baris data ERDKK: {len(df_erdkk)}")
                 
                 # Agregasi data ERDKK
                 print("\n📊 Melakukan agregasi data ERDKK...")
-                erdkk_kec_df = aggregate_erdkk_by_kecamatan(all_erdkk_rows)
-                erdkk_kios_df = aggregate_erdkk_by_kios(all_erdkk_rows)
+                erdkk_kec_df = aggregate_erdkk_by_kecamatan(df_erdkk)
+                erdkk_kios_df = aggregate_erdkk_by_kios(df_erdkk)
             else:
                 print("⚠️  Tidak ada data ERDKK yang berhasil diproses")
                 erdkk_kec_df = pd.DataFrame()
@@ -2010,13 +1977,33 @@ def process_erdkk_vs_realisasi_with_date():
             realisasi_kec_acc = pd.DataFrame()
             realisasi_kios_all = pd.DataFrame()
             realisasi_kios_acc = pd.DataFrame()
-            all_realisasi_rows = []
+            realisasi_df = pd.DataFrame()
             latest_tanggal_input = None
             found_in_files = 0
         else:
             print(f"✅ Download selesai: {len(realisasi_files)} file")
             
-            # Ekstrak tanggal input terbaru dari semua file
+            # Process setiap file Realisasi
+            print("\n🔄 Memproses data Realisasi...")
+            realisasi_frames = []
+            processed_files = 0
+            
+            for file_info, file_result in parse_files(process_realisasi_file_with_date, realisasi_files):
+                file_df, date_result = file_result or (None, None)
+                if date_result is not None:
+                    LATEST_INPUT_DATE_CACHE[file_info['path']] = date_result
+                
+                if file_df is not None and not file_df.empty:
+                    realisasi_frames.append(file_df)
+                    processed_files += 1
+                    print(f"   ✅ File '{file_info['name']}' berhasil diproses: {len(file_df)} baris")
+                else:
+                    print(f"   ⚠️  File '{file_info['name']}' tidak menghasilkan data")
+            
+            realisasi_df = pd.concat(realisasi_frames, ignore_index=True) if realisasi_frames else pd.DataFrame()
+            del realisasi_frames
+            
+            # Ekstrak tanggal input terbaru (hasil sampingan parsing di atas)
             print("\n📅 Mengekstrak tanggal input dari file realisasi...")
             latest_tanggal_input, found_in_files = extract_latest_input_date_from_files(realisasi_files)
             
@@ -2035,43 +2022,26 @@ def process_erdkk_vs_realisasi_with_date():
             else:
                 print(f"⚠️ Tidak ada tanggal input yang valid ditemukan")
             
-            # Process setiap file Realisasi
-            print("\n🔄 Memproses data Realisasi...")
-            all_realisasi_rows = []
-            processed_files = 0
-            
-            for file_info in realisasi_files:
-                print(f"\n📄 Processing file {processed_files + 1}/{len(realisasi_files)}")
-                file_rows = process_realisasi_file(file_info['path'], file_info['name'])
-                
-                if file_rows:
-                    all_realisasi_rows.extend(file_rows)
-                    processed_files += 1
-                    print(f"   ✅ File '{file_info['name']}' berhasil diproses: {len(file_rows)} baris")
-                else:
-                    print(f"   ⚠️  File '{file_info['name']}' tidak menghasilkan data")
-            
-            if all_realisasi_rows:
+            if not realisasi_df.empty:
                 print(f"\n✅ Total file realisasi diproses: {processed_files}/{len(realisasi_files)}")
-                print(f"✅ Total baris data realisasi: {len(all_realisasi_rows)}")
+                print(f"✅ Total baris data realisasi: {len(realisasi_df)}")
                 
                 # Analisis status
-                df_status = pd.DataFrame(all_realisasi_rows)
-                if 'STATUS' in df_status.columns:
-                    print_status_analysis(df_status)
+                if 'STATUS' in realisasi_df.columns:
+                    print_status_analysis(realisasi_df)
                     
                     # Cek berapa banyak yang ACC PUSAT
-                    acc_pusat_count = df_status['STATUS'].apply(is_status_disetujui_pusat).sum()
-                    print(f"\n📊 Status ACC PUSAT: {acc_pusat_count} baris ({acc_pusat_count/len(df_status)*100:.1f}%)")
+                    acc_pusat_count = classify_status(realisasi_df['STATUS'], is_status_disetujui_pusat).sum()
+                    print(f"\n📊 Status ACC PUSAT: {acc_pusat_count} baris ({acc_pusat_count/len(realisasi_df)*100:.1f}%)")
                 else:
                     print(f"⚠️  Kolom STATUS tidak ditemukan dalam data realisasi")
                 
                 # Agregasi data Realisasi (ALL dan ACC PUSAT)
                 print("\n📊 Mengagregasi data Realisasi...")
-                realisasi_kec_all = aggregate_realisasi_by_kecamatan(all_realisasi_rows, filter_acc_pusat=False)
-                realisasi_kec_acc = aggregate_realisasi_by_kecamatan(all_realisasi_rows, filter_acc_pusat=True)
-                realisasi_kios_all = aggregate_realisasi_by_kios(all_realisasi_rows, filter_acc_pusat=False)
-                realisasi_kios_acc = aggregate_realisasi_by_kios(all_realisasi_rows, filter_acc_pusat=True)
+                realisasi_kec_all = aggregate_realisasi_by_kecamatan(realisasi_df, filter_acc_pusat=False)
+                realisasi_kec_acc = aggregate_realisasi_by_kecamatan(realisasi_df, filter_acc_pusat=True)
+                realisasi_kios_all = aggregate_realisasi_by_kios(realisasi_df, filter_acc_pusat=False)
+                realisasi_kios_acc = aggregate_realisasi_by_kios(realisasi_df, filter_acc_pusat=True)
             else:
                 print("⚠️  Tidak ada data realisasi yang berhasil diproses")
                 realisasi_kec_all = pd.DataFrame()
@@ -2254,17 +2224,17 @@ def process_erdkk_vs_realisasi_with_date():
         
         end_time = datetime.now()
         duration = end_time - start_time
+        print_rate_limit_report()
         
         # Buat summary
-        total_erdkk_rows = len(all_erdkk_rows) if 'all_erdkk_rows' in locals() else 0
-        total_realisasi_rows = len(all_realisasi_rows) if 'all_realisasi_rows' in locals() else 0
+        total_erdkk_rows = len(df_erdkk) if 'df_erdkk' in locals() else 0
+        total_realisasi_rows = len(realisasi_df) if 'realisasi_df' in locals() else 0
         
         # Hitung ACC PUSAT
         acc_pusat_count = 0
-        if 'all_realisasi_rows' in locals() and all_realisasi_rows:
-            df_status = pd.DataFrame(all_realisasi_rows)
-            if 'STATUS' in df_status.columns:
-                acc_pusat_count = df_status['STATUS'].apply(is_status_disetujui_pusat).sum()
+        if 'realisasi_df' in locals() and not realisasi_df.empty:
+            if 'STATUS' in realisasi_df.columns:
+                acc_pusat_count = classify_status(realisasi_df['STATUS'], is_status_disetujui_pusat).sum()
         
         # Hitung statistik pupuk
         total_erdkk_urea = erdkk_kec_df['TOTAL_UREA'].sum() if not erdkk_kec_df.empty else 0
@@ -2288,6 +2258,7 @@ def process_erdkk_vs_realisasi_with_date():
 ANALISIS PERBANDINGAN ERDKK vs REALISASI - VERSI 6 (DENGAN TANGGAL INPUT)
 
 ⏰ Waktu proses: {duration.seconds // 60}m {duration.seconds % 60}s
+⏱️ Waktu tunggu quota Google API: {get_throttled_seconds():.1f} detik
 📅 Tanggal analisis: {datetime.now().strftime('%d-%m-%Y %H:%M:%S')}
 📁 Repository: verval-pupuk2/scripts/erdkk_vs_realisasi_fixed_v6.py
 
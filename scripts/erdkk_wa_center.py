@@ -28,9 +28,14 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import traceback
-import time
 import math
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import glob
+from nik_cleaner import clean_nik_series, print_nik_report
+from rate_limiter import rate_limited_call, print_rate_limit_report
+from incremental_sheet import write_sheet_incremental
 
 # ==============================================
 # KONFIGURASI
@@ -38,6 +43,14 @@ import glob
 FOLDER_ID = "1BBgVsgq7EMGs0TLaO_4GEtUppznm1v5J"
 SPREADSHEET_ID = "1W5s0LPqugmcqsjPPaqzKlwUJBAmJfyls574eak_BQ5Q"
 
+# Upload penuh: ukuran chunk, jumlah chunk yang diupload bersamaan, retry per chunk
+UPLOAD_BATCH_SIZE = 5000
+UPLOAD_WORKERS = int(os.getenv("SHEETS_UPLOAD_WORKERS", "3"))
+UPLOAD_CHUNK_RETRIES = 3
+
+# Service Sheets per thread uploader
+_thread_local = threading.local()
+
 # ==============================================
 # FUNGSI EMAIL
 # ==============================================
@@ -522,7 +535,8 @@ def read_and_process_excel(file_id, drive_service, filename):
         clean_df = pd.DataFrame()
         
         # NIK - Kolom H
-        clean_df['nik'] = df[nik_col].astype(str).str.strip().apply(lambda x: re.sub(r'\D', '', x))
+        clean_df['nik'], nik_report = clean_nik_series(df[nik_col])
+        print_nik_report(nik_report)
         clean_df = clean_df[clean_df['nik'].str.len() >= 10].copy()
         if clean_df.empty:
             print(f"   ⚠️ Tidak ada NIK valid setelah cleaning")
@@ -628,84 +642,108 @@ def read_and_process_excel(file_id, drive_service, filename):
         print(f"   🔍 Traceback: {traceback.format_exc()}")
         return None
 
-def choose_nama_from_group(group):
-    """Pilih nama petani yang paling mungkin benar"""
-    names = group['nama_petani'].astype(str).str.strip()
-    candidates = names[(names != '') & (~names.str.lower().str.contains('penyuluh'))]
-    if not candidates.empty:
-        mode = candidates.mode()
-        if not mode.empty:
-            return mode.iloc[0]
-        else:
-            return candidates.iloc[0]
-    non_empty = names[names != '']
-    if not non_empty.empty:
-        return non_empty.iloc[non_empty.str.len().argmax()]
-    return ''
-
-def format_poktan_details_row(row):
-    """Format detail satu baris poktan menjadi teks"""
-    parts = []
-    
-    poktan = str(row.get('poktan', 'Tidak disebutkan')).strip()
-    desa = str(row.get('desa', '')).strip()
-    kec = str(row.get('kecamatan', '')).strip()
-    luas = float(row.get('luas_tanam', 0.0))
-    
-    if poktan and poktan.lower() not in ['nan', 'tidak disebutkan', '']:
-        parts.append(f"Poktan {poktan} Desa {desa} Kec. {kec},")
-    else:
-        parts.append(f"Poktan (tidak disebutkan) Desa {desa} Kec. {kec},")
-    
-    parts.append(f"Luas Tanam setahun {luas:.2f} Ha,")
-    
-    # Pupuk
-    urea_mt1 = float(row.get('urea_mt1', 0))
-    npk_mt1 = float(row.get('npk_mt1', 0))
-    npk_formula_mt1 = float(row.get('npk_formula_mt1', 0))
-    organik_mt1 = float(row.get('organik_mt1', 0))
-    
-    urea_mt2 = float(row.get('urea_mt2', 0))
-    npk_mt2 = float(row.get('npk_mt2', 0))
-    npk_formula_mt2 = float(row.get('npk_formula_mt2', 0))
-    organik_mt2 = float(row.get('organik_mt2', 0))
-    
-    urea_mt3 = float(row.get('urea_mt3', 0))
-    npk_mt3 = float(row.get('npk_mt3', 0))
-    npk_formula_mt3 = float(row.get('npk_formula_mt3', 0))
-    organik_mt3 = float(row.get('organik_mt3', 0))
-    
-    if urea_mt1 > 0 or npk_mt1 > 0 or npk_formula_mt1 > 0 or organik_mt1 > 0:
-        mt1 = f"*. Urea MT1 {urea_mt1:.0f} kg, NPK MT1 {npk_mt1:.0f} kg, NPK Formula MT1 {npk_formula_mt1:.0f} kg, Organik MT1 {organik_mt1:.0f} kg,"
-        parts.append(mt1)
-    
-    if urea_mt2 > 0 or npk_mt2 > 0 or npk_formula_mt2 > 0 or organik_mt2 > 0:
-        mt2 = f"*. Urea MT2 {urea_mt2:.0f} kg, NPK MT2 {npk_mt2:.0f} kg, NPK Formula MT2 {npk_formula_mt2:.0f} kg, Organik MT2 {organik_mt2:.0f} kg,"
-        parts.append(mt2)
-    
-    if urea_mt3 > 0 or npk_mt3 > 0 or npk_formula_mt3 > 0 or organik_mt3 > 0:
-        mt3 = f"*. Urea MT3 {urea_mt3:.0f} kg, NPK MT3 {npk_mt3:.0f} kg, NPK Formula MT3 {npk_formula_mt3:.0f} kg, Organik MT3 {organik_mt3:.0f} kg,"
-        parts.append(mt3)
-    
-    # Kios
-    kios = str(row.get('kios', '')).strip()
-    if kios and kios.lower() not in ['nan', 'tidak disebutkan', '']:
-        parts.append(f'Kios layanan {kios}, Desa {desa}')
-    
-    # Komoditas
-    kom = str(row.get('komoditas_raw', '')).strip()
-    if kom and kom.lower() not in ['nan', '']:
-        kom_list = re.split(r'[;,/]+', kom)
+PUPUK_KEYS = ['urea_mt1', 'npk_mt1', 'npk_formula_mt1', 'organik_mt1',
+              'urea_mt2', 'npk_mt2', 'npk_formula_mt2', 'organik_mt2',
+              'urea_mt3', 'npk_mt3', 'npk_formula_mt3', 'organik_mt3']
+
+def column_values(df, col, default):
+    """Nilai kolom sebagai list Python (default jika kolom tidak ada)"""
+    if col in df.columns:
+        return df[col].tolist()
+    return [default] * len(df)
+
+def choose_nama_per_nik(all_data):
+    """
+    Pilih nama petani yang paling mungkin benar untuk semua NIK sekaligus:
+    nama terbanyak (bukan penyuluh), jika sama banyak pilih urutan abjad pertama;
+    jika semua nama penyuluh, pilih nama terpanjang. Mengembalikan Series index NIK.
+    """
+    names = all_data['nama_petani'].astype(str).str.strip()
+    non_empty = names != ''
+    is_candidate = non_empty & (~names.str.lower().str.contains('penyuluh'))
+
+    # Modus nama per NIK dari kandidat
+    counts = (pd.DataFrame({'nik': all_data['nik'][is_candidate], 'nama': names[is_candidate]})
+              .groupby(['nik', 'nama'], sort=False).size().reset_index(name='jumlah'))
+    counts['jumlah'] = -counts['jumlah']
+    mode_names = (counts.sort_values(['jumlah', 'nama'], kind='mergesort')
+                  .drop_duplicates('nik').set_index('nik')['nama'])
+
+    # Nama terpanjang (pertama) untuk NIK tanpa kandidat
+    fallback = non_empty & ~all_data['nik'].isin(mode_names.index)
+    lengths = names[fallback].str.len()
+    longest_names = names.loc[lengths.groupby(all_data['nik'][fallback], sort=False).idxmax()]
+    longest_names.index = all_data['nik'].loc[longest_names.index]
+
+    nama_per_nik = pd.concat([mode_names, longest_names])
+    nik_order = all_data['nik'].drop_duplicates()
+    return nama_per_nik.reindex(nik_order).fillna('')
+
+_komoditas_cache = {}
+
+def format_komoditas(kom):
+    """Teks komoditas unik (tanpa membedakan huruf besar/kecil), hasil disimpan per teks"""
+    if kom not in _komoditas_cache:
         kom_unique = []
-        for k in kom_list:
+        for k in re.split(r'[;,/]+', kom):
             k_clean = k.strip()
             if k_clean and k_clean.lower() not in [x.lower() for x in kom_unique]:
                 kom_unique.append(k_clean)
-        
-        if kom_unique:
-            parts.append(f"Komoditas {', '.join(kom_unique)}")
-    
-    return "\n".join(parts)
+        _komoditas_cache[kom] = f"Komoditas {', '.join(kom_unique)}" if kom_unique else None
+    return _komoditas_cache[kom]
+
+def format_pupuk_lines(pupuk, mt_number):
+    """Baris pupuk satu musim tanam untuk semua baris (None jika semua pupuk 0)"""
+    values = pupuk[:, (mt_number - 1) * 4:mt_number * 4]
+    has_pupuk = (values > 0).any(axis=1)
+    return [
+        f"*. Urea MT{mt_number} {urea:.0f} kg, NPK MT{mt_number} {npk:.0f} kg, "
+        f"NPK Formula MT{mt_number} {npk_formula:.0f} kg, Organik MT{mt_number} {organik:.0f} kg,"
+        if flag else None
+        for flag, (urea, npk, npk_formula, organik) in zip(has_pupuk, values.tolist())
+    ]
+
+def format_poktan_details(all_data):
+    """Format detail setiap baris poktan menjadi teks (list, urutan sama dengan all_data)"""
+    poktans = [str(x).strip() for x in column_values(all_data, 'poktan', 'Tidak disebutkan')]
+    desas = [str(x).strip() for x in column_values(all_data, 'desa', '')]
+    kecs = [str(x).strip() for x in column_values(all_data, 'kecamatan', '')]
+    kioss = [str(x).strip() for x in column_values(all_data, 'kios', '')]
+    koms = [str(x).strip() for x in column_values(all_data, 'komoditas_raw', '')]
+    luass = [float(x) for x in column_values(all_data, 'luas_tanam', 0.0)]
+
+    pupuk = all_data.reindex(columns=PUPUK_KEYS, fill_value=0).to_numpy(dtype=float)
+    pupuk_lines = [format_pupuk_lines(pupuk, mt) for mt in (1, 2, 3)]
+
+    skip_values = ['nan', 'tidak disebutkan', '']
+    details = []
+    for poktan, desa, kec, kios, kom, luas, mt1, mt2, mt3 in zip(
+            poktans, desas, kecs, kioss, koms, luass, *pupuk_lines):
+        if poktan and poktan.lower() not in skip_values:
+            parts = [f"Poktan {poktan} Desa {desa} Kec. {kec},"]
+        else:
+            parts = [f"Poktan (tidak disebutkan) Desa {desa} Kec. {kec},"]
+
+        parts.append(f"Luas Tanam setahun {luas:.2f} Ha,")
+
+        # Pupuk
+        for mt_line in (mt1, mt2, mt3):
+            if mt_line is not None:
+                parts.append(mt_line)
+
+        # Kios
+        if kios and kios.lower() not in skip_values:
+            parts.append(f'Kios layanan {kios}, Desa {desa}')
+
+        # Komoditas
+        if kom and kom.lower() not in ['nan', '']:
+            kom_line = format_komoditas(kom)
+            if kom_line:
+                parts.append(kom_line)
+
+        details.append("\n".join(parts))
+
+    return details
 
 def pivot_and_format_data(df_list):
     """Pivot dan format data; hasil hanya 3 kolom: nik, nama_petani, data"""
@@ -723,40 +761,23 @@ def pivot_and_format_data(df_list):
     print(f"🏠 Desa unique: {all_data['desa'].nunique()}")
     print(f"🗺️  Kecamatan unique: {all_data['kecamatan'].nunique()}")
 
-    result_rows = []
-    grouped = all_data.groupby('nik', sort=False)
-    total_groups = len(grouped)
-
-    for i, (nik, group) in enumerate(grouped, 1):
-        if i % 50 == 0 or i == 1 or i == total_groups:
-            print(f"   Memproses NIK ke-{i:,}/{total_groups:,}...")
-
-        nama_petani = choose_nama_from_group(group)
-
-        # buat detail per poktan
-        poktan_details = []
-        for _, row in group.iterrows():
-            rowd = row.to_dict()
-            poktan_details.append(format_poktan_details_row(rowd))
-
-        # gabungkan dengan penomoran
-        formatted_poktans = [f"{j+1}. {d}" for j,d in enumerate(poktan_details)]
+    print(f"   Memproses {all_data['nik'].nunique():,} NIK...")
 
-        if poktan_details:
-            if len(poktan_details) == 1:
-                data_field = f"Nama {nama_petani} terdaftar di:\n    {formatted_poktans[0]}"
-            else:
-                data_field = f"Nama {nama_petani} terdaftar di:\n    " + "\n\n".join(formatted_poktans)
-        else:
-            data_field = f"Nama {nama_petani} terdaftar di: (tidak ada data)"
+    # Nama terpilih per NIK dan detail per baris poktan
+    nama_per_nik = choose_nama_per_nik(all_data)
+    details = pd.Series(format_poktan_details(all_data), index=all_data.index)
 
-        result_rows.append({
-            'nik': nik,
-            'nama_petani': nama_petani,
-            'data': data_field
-        })
+    # Gabungkan detail per NIK dengan penomoran (urutan baris dalam NIK tetap)
+    nomor = all_data.groupby('nik', sort=False).cumcount() + 1
+    numbered = nomor.astype(str) + '. ' + details
+    poktan_text = numbered.groupby(all_data['nik'], sort=False).agg('\n\n'.join)
 
-    result_df = pd.DataFrame(result_rows, columns=['nik','nama_petani','data'])
+    nama_petani = nama_per_nik.reindex(poktan_text.index)
+    result_df = pd.DataFrame({
+        'nik': poktan_text.index.tolist(),
+        'nama_petani': nama_petani.tolist(),
+        'data': [f"Nama {nama} terdaftar di:\n    {text}" for nama, text in zip(nama_petani, poktan_text)]
+    }, columns=['nik','nama_petani','data'])
 
     print("\n" + "="*60)
     print("✅ PIVOT SELESAI")
@@ -768,244 +789,138 @@ def pivot_and_format_data(df_list):
     return result_df
 
 # ==============================================
-# FUNGSI GOOGLE SHEETS EXPAND & UPLOAD
+# FUNGSI GOOGLE SHEETS UPLOAD
 # ==============================================
 
-def expand_google_sheet(sheets_service, spreadsheet_id, required_rows, required_cols=3):
-    """Expand Google Sheets grid untuk menampung data besar"""
-    try:
-        print(f"\n📈 EXPANDING GOOGLE SHEETS GRID...")
-        print(f"   • Required rows: {required_rows:,}")
-        print(f"   • Required columns: {required_cols}")
-        
-        # 1. Get current sheet properties
-        spreadsheet = sheets_service.spreadsheets().get(
-            spreadsheetId=spreadsheet_id
-        ).execute()
-        
-        sheets = spreadsheet.get('sheets', [])
-        if not sheets:
-            print("   ❌ No sheets found in spreadsheet")
-            return False
-        
-        # Ambil sheet pertama (Sheet1)
-        sheet = sheets[0]
-        sheet_id = sheet['properties']['sheetId']
-        current_rows = sheet['properties']['gridProperties']['rowCount']
-        current_cols = sheet['properties']['gridProperties']['columnCount']
-        
-        print(f"   • Current rows: {current_rows:,}")
-        print(f"   • Current columns: {current_cols}")
-        
-        # 2. Calculate required expansion
-        add_rows = max(0, required_rows - current_rows + 1000)  # Tambah buffer 1000
-        add_cols = max(0, required_cols - current_cols + 5)     # Tambah buffer 5 kolom
-        
-        if add_rows == 0 and add_cols == 0:
-            print("   ✅ No expansion needed")
-            return True
-        
-        # 3. Prepare batch update requests
-        requests = []
-        
-        if add_rows > 0:
-            requests.append({
-                "appendDimension": {
-                    "sheetId": sheet_id,
-                    "dimension": "ROWS",
-                    "length": add_rows
-                }
-            })
-            print(f"   ➕ Adding {add_rows:,} rows")
-        
-        if add_cols > 0:
-            requests.append({
-                "appendDimension": {
-                    "sheetId": sheet_id,
-                    "dimension": "COLUMNS",
-                    "length": add_cols
-                }
-            })
-            print(f"   ➕ Adding {add_cols} columns")
-        
-        # 4. Execute batch update
-        if requests:
-            body = {"requests": requests}
-            response = sheets_service.spreadsheets().batchUpdate(
-                spreadsheetId=spreadsheet_id,
-                body=body
-            ).execute()
-            
-            print(f"   ✅ Grid expanded successfully")
-            print(f"   • New total rows: {current_rows + add_rows:,}")
-            print(f"   • New total columns: {current_cols + add_cols}")
-        
-        return True
-        
-    except Exception as e:
-        print(f"   ❌ Error expanding sheet: {e}")
-        return False
-
-def upload_large_dataset(df, spreadsheet_id, credentials):
-    """Upload dataset besar ke Google Sheets dengan chunking yang optimal"""
-    try:
-        print("\n📤 UPLOADING LARGE DATASET TO GOOGLE SHEETS...")
-        print(f"   📊 Data size: {len(df):,} rows, {len(df.columns)} columns")
-        
-        sheets_service = build('sheets', 'v4', credentials=credentials)
-        
-        # 1. Expand sheet jika diperlukan
-        required_rows = len(df) + 1  # +1 untuk header
-        expand_success = expand_google_sheet(sheets_service, spreadsheet_id, required_rows)
-        
-        if not expand_success:
-            print("   ⚠️ Grid expansion failed, trying to upload anyway")
-        
-        # 2. Clear existing data
-        print("   🧹 Clearing existing data...")
-        try:
-            sheets_service.spreadsheets().values().clear(
-                spreadsheetId=spreadsheet_id,
-                range="Sheet1!A:Z"
-            ).execute()
-            print("   ✅ Sheet cleared successfully")
-            time.sleep(1)
-        except Exception as e:
-            print(f"   ⚠️ Warning while clearing sheet: {e}")
-        
-        # 3. Prepare data
-        headers = df.columns.tolist()
-        values = df.fillna('').values.tolist()
-        
-        # 4. Upload dengan batch yang lebih kecil untuk reliability
-        batch_size = 5000  # Ukuran batch optimal
-        total_rows = len(values)
-        total_batches = math.ceil(total_rows / batch_size)
-        
-        print(f"\n📦 UPLOAD STRATEGY:")
-        print(f"   • Total data rows: {total_rows:,}")
-        print(f"   • Batch size: {batch_size:,}")
-        print(f"   • Number of batches: {total_batches}")
-        print(f"   • Estimated time: {total_batches * 2} seconds")
-        
-        # 5. Upload header terlebih dahulu
-        print("\n📋 Uploading headers...")
-        try:
-            sheets_service.spreadsheets().values().update(
-                spreadsheetId=spreadsheet_id,
-                range="Sheet1!A1",
-                valueInputOption="USER_ENTERED",
-                body={"values": [headers]}
-            ).execute()
-            print("   ✅ Headers uploaded")
-            time.sleep(1)
-        except Exception as e:
-            print(f"   ⚠️ Error uploading headers: {e}")
-            return False
-        
-        # 6. Upload data per batch
-        successful_batches = 0
-        failed_batches = []
-        
-        for batch_num in range(total_batches):
-            start_idx = batch_num * batch_size
-            end_idx = min(start_idx + batch_size, total_rows)
-            batch_data = values[start_idx:end_idx]
-            batch_size_actual = len(batch_data)
-            
-            # Range untuk batch ini (baris mulai dari 2 karena header di row 1)
-            range_start = start_idx + 2
-            range_name = f"Sheet1!A{range_start}"
-            
-            max_retries = 3
-            batch_success = False
+def get_sheets_service(credentials):
+    """Service Sheets milik thread saat ini (objek httplib2 tidak thread-safe)"""
+    service = getattr(_thread_local, 'sheets_service', None)
+    if service is None:
+        service = build('sheets', 'v4', credentials=credentials, cache_discovery=False)
+        _thread_local.sheets_service = service
+    return service
+
+def upload_chunk(credentials, spreadsheet_id, start_idx, batch_data):
+    """Upload satu chunk data mulai baris data ke-start_idx (baris sheet start_idx + 2)"""
+    request = get_sheets_service(credentials).spreadsheets().values().update(
+        spreadsheetId=spreadsheet_id,
+        range=f"Sheet1!A{start_idx + 2}",
+        valueInputOption="USER_ENTERED",
+        body={"values": batch_data, "majorDimension": "ROWS"}
+    )
+    # Jeda antar panggilan dan retry 429/5xx diatur rate limiter sesuai quota
+    return rate_limited_call(request.execute, bucket='sheets_write')
+
+def upload_data_batches(sheets_service, credentials, spreadsheet_id, df):
+    """
+    Upload penuh header + data ke Sheet1 per chunk UPLOAD_BATCH_SIZE baris.
+    Dipanggil penulis inkremental saat sheet harus ditulis ulang penuh
+    (sheet sudah dikosongkan dan di-resize sesuai ukuran data).
+    
+    Producer/consumer: chunk baru diubah ke list Python hanya saat akan
+    dikirim, maksimal UPLOAD_WORKERS chunk sedang diupload bersamaan, dan
+    chunk yang gagal dimasukkan kembali ke antrean tanpa menahan chunk lain.
+    """
+    total_rows = len(df)
+    total_batches = math.ceil(total_rows / UPLOAD_BATCH_SIZE)
+    workers = max(1, min(UPLOAD_WORKERS, total_batches))
+    
+    print(f"\n📦 UPLOAD STRATEGY:")
+    print(f"   • Total data rows: {total_rows:,}")
+    print(f"   • Batch size: {UPLOAD_BATCH_SIZE:,}")
+    print(f"   • Number of batches: {total_batches}")
+    print(f"   • Parallel uploads: {workers}")
+    
+    # Upload header terlebih dahulu
+    print("\n📋 Uploading headers...")
+    rate_limited_call(sheets_service.spreadsheets().values().update(
+        spreadsheetId=spreadsheet_id,
+        range="Sheet1!A1",
+        valueInputOption="USER_ENTERED",
+        body={"values": [df.columns.tolist()]}
+    ).execute, bucket='sheets_write')
+    print("   ✅ Headers uploaded")
+    
+    # Antrean chunk: (nomor batch, percobaan ke-)
+    pending = deque((batch_num, 1) for batch_num in range(total_batches))
+    in_flight = {}
+    successful_batches = 0
+    failed_batches = []
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending or in_flight:
+            # Producer: serialisasi chunk hanya sebanyak slot upload yang kosong
+            while pending and len(in_flight) < workers:
+                batch_num, attempt = pending.popleft()
+                start_idx = batch_num * UPLOAD_BATCH_SIZE
+                end_idx = min(start_idx + UPLOAD_BATCH_SIZE, total_rows)
+                batch_data = df.iloc[start_idx:end_idx].values.tolist()
+                
+                print(f"   📤 Batch {batch_num + 1}/{total_batches}: rows {start_idx + 1:,}-{end_idx:,} ({len(batch_data):,} rows)...")
+                future = executor.submit(upload_chunk, credentials, spreadsheet_id, start_idx, batch_data)
+                in_flight[future] = (batch_num, attempt, start_idx, end_idx)
             
-            for attempt in range(max_retries):
+            # Consumer: proses chunk yang selesai lebih dulu
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch_num, attempt, start_idx, end_idx = in_flight.pop(future)
                 try:
-                    if attempt > 0:
-                        print(f"   🔄 Retry {attempt} for batch {batch_num + 1}...")
-                        time.sleep(2 ** attempt)  # Exponential backoff
-                    
-                    print(f"   📤 Batch {batch_num + 1}/{total_batches}: rows {start_idx + 1:,}-{end_idx:,} ({batch_size_actual:,} rows)...")
-                    
-                    body = {
-                        "values": batch_data,
-                        "majorDimension": "ROWS"
-                    }
-                    
-                    request = sheets_service.spreadsheets().values().update(
-                        spreadsheetId=spreadsheet_id,
-                        range=range_name,
-                        valueInputOption="USER_ENTERED",
-                        body=body
-                    )
-                    response = request.execute()
-                    
+                    response = future.result()
                     updated_cells = response.get('updatedCells', 0)
                     print(f"   ✅ Batch {batch_num + 1} uploaded ({updated_cells:,} cells updated)")
-                    
                     successful_batches += 1
-                    batch_success = True
-                    
-                    # Delay antar batch untuk menghindari rate limit
-                    if batch_num < total_batches - 1:
-                        delay = 0.5  # 500ms delay
-                        time.sleep(delay)
-                    
-                    break  # Break retry loop jika sukses
-                    
                 except Exception as e:
                     error_msg = str(e)
-                    if "exceeds grid limits" in error_msg:
-                        print(f"   ❌ GRID LIMIT ERROR: Need to expand sheet more")
-                        # Coba expand sheet lagi
-                        additional_rows_needed = start_idx + batch_size_actual + 1000
-                        expand_google_sheet(sheets_service, spreadsheet_id, additional_rows_needed)
-                        time.sleep(2)
-                        continue  # Coba lagi
-                    
-                    print(f"   ⚠️ Attempt {attempt + 1} failed: {error_msg[:100]}...")
-                    
-                    if attempt < max_retries - 1:
-                        wait_time = 2 * (attempt + 1)
-                        print(f"   ⏳ Waiting {wait_time} seconds before retry...")
-                        time.sleep(wait_time)
+                    print(f"   ❌ Batch {batch_num + 1} failed (percobaan {attempt}/{UPLOAD_CHUNK_RETRIES}): {error_msg[:100]}...")
+                    if attempt < UPLOAD_CHUNK_RETRIES:
+                        print(f"   ⚠️ Batch {batch_num + 1} masuk antrean ulang, lanjut batch berikutnya...")
+                        pending.append((batch_num, attempt + 1))
                     else:
-                        print(f"   ❌ Batch {batch_num + 1} failed after all retries")
                         failed_batches.append({
                             'batch': batch_num + 1,
                             'rows': f"{start_idx + 1}-{end_idx}",
                             'error': error_msg[:200]
                         })
-            
-            if not batch_success:
-                print(f"   ⚠️ Moving to next batch...")
-        
-        # 7. Report upload results
-        print(f"\n📊 UPLOAD COMPLETE REPORT:")
-        print(f"   • Total batches attempted: {total_batches}")
-        print(f"   • Successful batches: {successful_batches}")
-        print(f"   • Failed batches: {len(failed_batches)}")
-        
-        if failed_batches:
-            print(f"   ❌ FAILED BATCHES:")
-            for fb in failed_batches:
-                print(f"     - Batch {fb['batch']}: rows {fb['rows']}")
-                print(f"       Error: {fb['error']}")
-        
-        success_rate = (successful_batches / total_batches) * 100
-        print(f"   📈 Success rate: {success_rate:.1f}%")
-        
-        if successful_batches > 0:
-            estimated_uploaded_rows = successful_batches * batch_size
-            if successful_batches == total_batches:
-                estimated_uploaded_rows = total_rows
-            
-            print(f"   ✅ Estimated uploaded rows: {estimated_uploaded_rows:,}/{total_rows:,}")
-            return True
-        else:
-            print(f"   ❌ No batches uploaded successfully")
-            return False
+    
+    # Report upload results
+    print(f"\n📊 UPLOAD COMPLETE REPORT:")
+    print(f"   • Total batches attempted: {total_batches}")
+    print(f"   • Successful batches: {successful_batches}")
+    print(f"   • Failed batches: {len(failed_batches)}")
+    
+    if failed_batches:
+        print(f"   ❌ FAILED BATCHES:")
+        for fb in sorted(failed_batches, key=lambda item: item['batch']):
+            print(f"     - Batch {fb['batch']}: rows {fb['rows']}")
+            print(f"       Error: {fb['error']}")
+        # State hash tidak disimpan agar run berikutnya menulis ulang penuh
+        raise RuntimeError(f"{len(failed_batches)} dari {total_batches} batch gagal diupload")
+
+def upload_large_dataset(df, spreadsheet_id, credentials):
+    """
+    Upload dataset besar ke Google Sheets.
+    Hanya baris NIK yang berubah/baru/hilang sejak upload sebelumnya yang ditulis
+    (lihat incremental_sheet.py); tulis ulang penuh memakai upload_data_batches.
+    """
+    try:
+        print("\n📤 UPLOADING LARGE DATASET TO GOOGLE SHEETS...")
+        print(f"   📊 Data size: {len(df):,} rows, {len(df.columns)} columns")
+        
+        sheets_service = build('sheets', 'v4', credentials=credentials)
+        upload_df = df.fillna('')
+        
+        summary = write_sheet_incremental(
+            sheets_service,
+            spreadsheet_id,
+            "Sheet1",
+            upload_df,
+            key_columns=['nik'],
+            full_write=lambda data: upload_data_batches(sheets_service, credentials, spreadsheet_id, data)
+        )
+        print_rate_limit_report()
+        
+        print(f"   ✅ Uploaded rows: {len(df):,}/{len(df):,} ({summary['cells_written']:,} cells written)")
+        return True
         
     except Exception as e:
         print(f"❌ Error in upload process: {e}")
@@ -1033,11 +948,11 @@ def verify_complete_upload(sheets_service, spreadsheet_id, expected_rows):
             range_name = f"Sheet1!A{start_row}:C{end_row}"
             
             try:
-                result = sheets_service.spreadsheets().values().get(
+                result = rate_limited_call(sheets_service.spreadsheets().values().get(
                     spreadsheetId=spreadsheet_id,
                     range=range_name,
                     majorDimension="ROWS"
-                ).execute()
+                ).execute, bucket='sheets_read')
                 
                 values = result.get('values', [])
                 if req_num == 0 and values:
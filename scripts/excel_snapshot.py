@@ -0,0 +1,249 @@
+"""
+excel_snapshot.py
+Snapshot kolumnar (Parquet) dari workbook Excel yang sudah pernah diparse.
+Parsing XLSX lewat openpyxl adalah langkah paling lambat, padahal file
+ERDKK/realisasi yang sama dibaca oleh beberapa script setiap malam.
+Snapshot disimpan berdasarkan md5 isi file (sama dengan md5Checksum di
+Google Drive) + parameter baca, sehingga setiap versi workbook cukup
+diparse dari XLSX satu kali.
+
+Jika pyarrow tidak tersedia (atau data tidak bisa ditulis ke Parquet),
+snapshot disimpan sebagai pickle pandas.
+
+Snapshot dibatasi umur (EXCEL_SNAPSHOT_MAX_AGE_DAYS) dan total ukuran
+(EXCEL_SNAPSHOT_MAX_MB, LRU berdasarkan waktu terakhir dipakai).
+
+read_excel_sheet membuka workbook satu kali, memilih sheet dari metadata
+workbook (tanpa membedakan huruf besar/kecil) lalu hanya memparse sheet itu.
+Jika select_columns diberikan, baris header dibaca lebih dulu dan hanya
+kolom yang dipilih yang diparse (usecols).
+
+Lokasi: verval-pupuk2/scripts/excel_snapshot.py
+"""
+
+import os
+import time
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+# ============================
+# KONFIGURASI
+# ============================
+DEFAULT_SNAPSHOT_DIR = os.path.normpath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".drive_cache", "snapshots")
+)
+SNAPSHOT_DIR = os.getenv("EXCEL_SNAPSHOT_DIR", DEFAULT_SNAPSHOT_DIR)
+SNAPSHOT_MAX_AGE_DAYS = float(os.getenv("EXCEL_SNAPSHOT_MAX_AGE_DAYS", "14"))
+# Batas ukuran terpisah dari DRIVE_CACHE_MAX_MB (folder snapshot ikut disimpan ke actions/cache)
+SNAPSHOT_MAX_BYTES = int(float(os.getenv("EXCEL_SNAPSHOT_MAX_MB", "512")) * 1024 * 1024)
+SNAPSHOT_ENABLED = os.getenv("EXCEL_SNAPSHOT_DISABLED", "").lower() not in ("1", "true", "yes")
+
+# Versi format snapshot, naikkan jika cara penyimpanan berubah
+SNAPSHOT_VERSION = 1
+
+_pruned = False
+
+
+# ============================
+# FUNGSI BANTU
+# ============================
+def file_md5(source):
+    """md5 isi file (path atau file-like), sama dengan md5Checksum Google Drive"""
+    digest = hashlib.md5()
+    if hasattr(source, 'read'):
+        position = source.tell()
+        source.seek(0)
+        for chunk in iter(lambda: source.read(1024 * 1024), b''):
+            digest.update(chunk)
+        source.seek(position)
+    else:
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def snapshot_key(source, read_kwargs):
+    """Key snapshot: md5 file + parameter pd.read_excel"""
+    params = repr(sorted((key, repr(value)) for key, value in read_kwargs.items()))
+    params_hash = hashlib.md5(f"{SNAPSHOT_VERSION}|{params}".encode('utf-8')).hexdigest()[:12]
+    return f"{file_md5(source)}_{params_hash}"
+
+
+def prune_snapshots(max_bytes=None, max_age_days=None, keep_key=None):
+    """
+    Hapus snapshot yang tidak dipakai lebih dari max_age_days, lalu yang paling
+    lama tidak dipakai (mtime, disentuh setiap dibaca) sampai total ukuran di
+    bawah max_bytes. Snapshot keep_key (baru saja ditulis) tidak dihapus.
+    """
+    max_bytes = SNAPSHOT_MAX_BYTES if max_bytes is None else max_bytes
+    max_age_days = SNAPSHOT_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return
+
+    snapshots = []
+    for filename in os.listdir(SNAPSHOT_DIR):
+        path = os.path.join(SNAPSHOT_DIR, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        snapshots.append((stat.st_mtime, stat.st_size, filename, path))
+
+    oldest_allowed = time.time() - max_age_days * 86400
+    total_size = sum(size for _, size, _, _ in snapshots)
+    evicted = 0
+
+    # LRU: yang paling lama tidak dipakai dihapus lebih dulu
+    for mtime, size, filename, path in sorted(snapshots):
+        if mtime >= oldest_allowed and total_size <= max_bytes:
+            break
+        if keep_key and filename.startswith(f"{keep_key}."):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total_size -= size
+        evicted += 1
+
+    if evicted:
+        print(f"   🗑️  Snapshot Excel dihapus: {evicted} file, sisa {total_size / (1024 * 1024):.1f} MB")
+
+
+def _restore_missing_values(df):
+    """Parquet mengembalikan None di kolom object, samakan dengan hasil read_excel (NaN)"""
+    for col in df.columns[df.dtypes == object]:
+        if df[col].isna().any():
+            df[col] = df[col].where(df[col].notna(), np.nan)
+    return df
+
+
+def _load_snapshot(key):
+    parquet_path = os.path.join(SNAPSHOT_DIR, f"{key}.parquet")
+    pickle_path = os.path.join(SNAPSHOT_DIR, f"{key}.pkl")
+
+    if PARQUET_AVAILABLE and os.path.exists(parquet_path):
+        df = _restore_missing_values(pd.read_parquet(parquet_path))
+        os.utime(parquet_path)
+        return df
+    if os.path.exists(pickle_path):
+        df = pd.read_pickle(pickle_path)
+        os.utime(pickle_path)
+        return df
+    return None
+
+
+def _save_snapshot(key, df):
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+
+    # Parquet hanya untuk nama kolom string unik, selain itu pakai pickle
+    columns_ok = all(isinstance(col, str) for col in df.columns) and df.columns.is_unique
+    if PARQUET_AVAILABLE and columns_ok:
+        parquet_path = os.path.join(SNAPSHOT_DIR, f"{key}.parquet")
+        tmp_path = parquet_path + ".tmp"
+        try:
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, parquet_path)
+            return
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    pickle_path = os.path.join(SNAPSHOT_DIR, f"{key}.pkl")
+    tmp_path = pickle_path + ".tmp"
+    df.to_pickle(tmp_path)
+    os.replace(tmp_path, pickle_path)
+
+
+# ============================
+# FUNGSI UTAMA
+# ============================
+def read_excel_snapshot(source, excel_file=None, **read_kwargs):
+    """
+    Pengganti pd.read_excel untuk satu sheet: hasil diambil dari snapshot jika
+    workbook versi yang sama sudah pernah diparse, selain itu diparse lalu disimpan.
+    excel_file: pd.ExcelFile yang sudah dibuka untuk source (agar tidak dibuka ulang).
+    """
+    global _pruned
+
+    def parse_excel():
+        if excel_file is not None:
+            return excel_file.parse(**read_kwargs)
+        return pd.read_excel(source, **read_kwargs)
+
+    if not SNAPSHOT_ENABLED or read_kwargs.get('sheet_name', 0) is None:
+        return parse_excel()
+
+    if not _pruned:
+        _pruned = True
+        prune_snapshots()
+
+    try:
+        key = snapshot_key(source, read_kwargs)
+        df = _load_snapshot(key)
+        if df is not None:
+            return df
+    except Exception as e:
+        print(f"   ⚠️  Snapshot tidak bisa dibaca, parse ulang Excel: {str(e)}")
+        key = None
+
+    df = parse_excel()
+
+    if key:
+        try:
+            _save_snapshot(key, df)
+            prune_snapshots(keep_key=key)
+        except Exception as e:
+            print(f"   ⚠️  Gagal menyimpan snapshot: {str(e)}")
+
+    return df
+
+
+def pick_sheet_name(sheet_names, sheet_candidates=None):
+    """Nama sheet pertama dari kandidat yang ada di workbook (case-insensitive), default sheet pertama"""
+    if not sheet_names:
+        raise ValueError("Workbook tidak memiliki sheet")
+
+    sheets_by_lower = {}
+    for name in sheet_names:
+        sheets_by_lower.setdefault(name.strip().lower(), name)
+
+    for candidate in sheet_candidates or []:
+        if candidate.strip().lower() in sheets_by_lower:
+            return sheets_by_lower[candidate.strip().lower()]
+
+    return sheet_names[0]
+
+
+def read_excel_sheet(source, sheet_candidates=None, select_columns=None, **read_kwargs):
+    """
+    Buka workbook satu kali, pilih sheet dari daftar kandidat berdasarkan nama
+    sheet di metadata workbook, lalu parse hanya sheet tersebut.
+    select_columns: fungsi(list nama kolom header) -> kolom yang dibutuhkan;
+    None/kosong berarti semua kolom dibaca.
+    Mengembalikan (df, nama_sheet_terpakai, semua_nama_sheet).
+    """
+    with pd.ExcelFile(source) as excel_file:
+        sheet_names = excel_file.sheet_names
+        sheet_name = pick_sheet_name(sheet_names, sheet_candidates)
+
+        if select_columns is not None and 'usecols' not in read_kwargs:
+            # Tahap 1: header saja, tahap 2: hanya kolom yang dibutuhkan (berdasarkan posisi)
+            header = excel_file.parse(sheet_name=sheet_name, header=read_kwargs.get('header', 0), nrows=0)
+            selected = select_columns(list(header.columns))
+            if selected:
+                selected = set(selected)
+                read_kwargs['usecols'] = [i for i, col in enumerate(header.columns) if col in selected]
+
+        df = read_excel_snapshot(source, excel_file=excel_file, sheet_name=sheet_name, **read_kwargs)
+
+    return df, sheet_name, sheet_names
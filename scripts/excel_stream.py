@@ -0,0 +1,144 @@
+"""
+excel_stream.py
+Pembacaan sheet Excel bertahap (streaming) untuk file realisasi yang besar.
+Workbook dibuka dengan openpyxl read_only sehingga baris dibaca langsung
+dari XML sheet dan diserahkan per batch (DataFrame berukuran tetap) ke
+proses berikutnya. Memori puncak dibatasi satu batch dan agregasi bisa
+dimulai sebelum seluruh file selesai diparse.
+
+Nilai sel dikonversi seperti pd.read_excel(dtype=str): angka bulat menjadi
+teks tanpa '.0', sel kosong/error dan teks NA menjadi NaN, baris kosong di
+akhir sheet dibuang. Sel di luar lebar header diabaikan. File yang tidak
+bisa dibuka openpyxl (mis. .xls) dibaca penuh lewat read_excel_sheet lalu
+dipotong per batch.
+
+Lokasi: verval-pupuk2/scripts/excel_stream.py
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+
+from excel_snapshot import pick_sheet_name, read_excel_sheet
+
+# ============================
+# KONFIGURASI
+# ============================
+STREAM_BATCH_ROWS = int(os.getenv("EXCEL_STREAM_BATCH_ROWS", "50000"))
+
+# Teks yang dianggap kosong oleh pd.read_excel (na_values bawaan pandas)
+NA_STRINGS = {
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+    '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None',
+    'n/a', 'nan', 'null'
+}
+
+
+# ============================
+# FUNGSI BANTU
+# ============================
+def convert_cell(cell):
+    """Nilai sel seperti hasil pd.read_excel(dtype=str): teks atau NaN"""
+    value = cell.value
+    if value is None or cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        int_value = int(value)
+        value = int_value if int_value == value else float(value)
+    text = str(value)
+    return np.nan if text in NA_STRINGS else text
+
+
+def make_column_names(header_values):
+    """Nama kolom dari baris header (kosong -> 'Unnamed: i', duplikat -> 'X.1')"""
+    columns = []
+    seen = {}
+    for i, value in enumerate(header_values):
+        name = f"Unnamed: {i}" if pd.isna(value) else value
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+
+def build_batch(rows, columns, start):
+    """DataFrame satu batch, index melanjutkan nomor baris batch sebelumnya"""
+    width = len(columns)
+    rows = [row[:width] + [np.nan] * (width - len(row)) for row in rows]
+    return pd.DataFrame(rows, columns=columns, index=pd.RangeIndex(start, start + len(rows)), dtype=object)
+
+
+def stream_sheet_batches(workbook, sheet_name, batch_size):
+    """Generator batch DataFrame dari sheet workbook read_only"""
+    try:
+        sheet = workbook[sheet_name]
+        sheet.reset_dimensions()
+
+        columns = None
+        batch = []
+        start = 0
+        pending_blank_rows = 0
+
+        for row in sheet.rows:
+            values = [convert_cell(cell) for cell in row]
+
+            # Baris pertama adalah header
+            if columns is None:
+                while values and pd.isna(values[-1]):
+                    values.pop()
+                columns = make_column_names(values)
+                continue
+
+            # Baris kosong di akhir sheet dibuang (sama dengan pd.read_excel),
+            # baris kosong di tengah data tetap menjadi baris NaN
+            if all(pd.isna(value) for value in values):
+                pending_blank_rows += 1
+                continue
+            batch.extend([] for _ in range(pending_blank_rows))
+            pending_blank_rows = 0
+            batch.append(values)
+
+            if len(batch) >= batch_size:
+                yield build_batch(batch, columns, start)
+                start += len(batch)
+                batch = []
+
+        if batch:
+            yield build_batch(batch, columns, start)
+
+    finally:
+        workbook.close()
+
+
+def slice_batches(df, batch_size):
+    """Generator batch dari DataFrame yang sudah dibaca penuh"""
+    for start in range(0, len(df), batch_size):
+        yield df.iloc[start:start + batch_size].copy()
+
+
+# ============================
+# FUNGSI UTAMA
+# ============================
+def open_excel_batches(source, sheet_candidates=None, batch_size=None):
+    """
+    Buka satu sheet untuk dibaca bertahap.
+    Mengembalikan (nama_sheet_terpakai, semua_nama_sheet, generator batch DataFrame).
+    """
+    batch_size = batch_size or STREAM_BATCH_ROWS
+
+    try:
+        workbook = load_workbook(source, read_only=True, data_only=True, keep_links=False)
+    except Exception:
+        # Format yang tidak didukung openpyxl: baca penuh lalu potong per batch
+        df, sheet_name, sheet_names = read_excel_sheet(source, sheet_candidates=sheet_candidates, dtype=str)
+        return sheet_name, sheet_names, slice_batches(df, batch_size)
+
+    sheet_names = workbook.sheetnames
+    sheet_name = pick_sheet_name(sheet_names, sheet_candidates)
+    return sheet_name, sheet_names, stream_sheet_batches(workbook, sheet_name, batch_size)
@@ -0,0 +1,359 @@
+"""
+incremental_sheet.py
+Penulisan sheet inkremental: hanya baris yang berubah sejak publish
+sebelumnya yang ditulis ulang.
+
+Setiap publish menyimpan hash per baris (hash kunci + hash isi baris) di
+sheet tersembunyi "_hash_<nama sheet>" pada spreadsheet yang sama. Sheet
+state dipakai (bukan file lokal) karena runner GitHub Actions selalu baru.
+Susunan baris sheet state selalu sama dengan sheet data.
+
+Pada publish berikutnya urutan kunci lama dan baru disejajarkan
+(difflib.SequenceMatcher), lalu:
+- baris dengan kunci sama tapi isi berbeda ditulis ulang di tempat
+- kunci baru disisipkan (insertDimension) di posisinya
+- kunci yang hilang dihapus (deleteDimension)
+Semua sisip/hapus dikirim dalam satu spreadsheets.batchUpdate dan semua
+blok baris yang berubah dalam values.batchUpdate (dipotong per
+WRITE_CHUNK_ROWS baris).
+
+Sheet ditulis ulang penuh jika state belum ada/tidak cocok dengan sheet,
+header berubah, atau perubahan melebihi FULL_REWRITE_RATIO dari jumlah baris.
+
+Lokasi: verval-pupuk2/scripts/incremental_sheet.py
+"""
+
+import os
+import random
+from difflib import SequenceMatcher
+
+import pandas as pd
+
+from rate_limiter import rate_limited_call
+
+# ============================
+# KONFIGURASI
+# ============================
+STATE_SHEET_PREFIX = "_hash_"
+WRITE_CHUNK_ROWS = int(os.getenv("SHEET_WRITE_CHUNK_ROWS", "10000"))
+
+# Jika baris yang berubah/disisipkan/dihapus melebihi rasio ini, tulis ulang penuh
+FULL_REWRITE_RATIO = float(os.getenv("SHEET_FULL_REWRITE_RATIO", "0.5"))
+
+HEADER_KEY = "header"
+MAX_SHEET_ID = 2 ** 31 - 1
+
+
+# ============================
+# FUNGSI BANTU
+# ============================
+def column_letter(column_number):
+    """Nomor kolom (1 = A) menjadi huruf kolom A1"""
+    letters = ""
+    while column_number > 0:
+        column_number, remainder = divmod(column_number - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def sheet_range(sheet_name, start_row, end_row, column_count):
+    """Range A1 baris start_row..end_row (1-based, inklusif) dari kolom A"""
+    quoted_name = sheet_name.replace("'", "''")
+    return f"'{quoted_name}'!A{start_row}:{column_letter(column_count)}{end_row}"
+
+
+def hash_values(df, prefix):
+    """Hash per baris DataFrame (teks seperti yang dikirim ke sheet)"""
+    hashes = pd.util.hash_pandas_object(df.astype(str), index=False)
+    return [f"{prefix}{value:016x}" for value in hashes.tolist()]
+
+
+def row_state(df, key_columns):
+    """(kunci per baris, hash isi per baris) termasuk baris header di posisi 0"""
+    row_hashes = hash_values(df, "h")
+
+    # Kunci duplikat dibedakan dengan nomor kemunculan
+    key_source = df[key_columns] if key_columns else df
+    key_hashes = pd.Series(hash_values(key_source, "k"), dtype=object)
+    occurrence = key_hashes.groupby(key_hashes).cumcount()
+    keys = [f"{key}-{count}" for key, count in zip(key_hashes.tolist(), occurrence.tolist())]
+
+    header_hash = hash_values(pd.DataFrame([df.columns.astype(str).tolist()]), "h")[0]
+    return [HEADER_KEY] + keys, [header_hash] + row_hashes
+
+
+def execute(request, bucket='sheets_write'):
+    """
+    Jalankan request googleapiclient lewat rate limiter bersama.
+    Semua request bernama execute, jadi request baca harus memberi bucket='sheets_read'.
+    """
+    return rate_limited_call(request.execute, bucket=bucket)
+
+
+def fetch_sheet_properties(service, spreadsheet_id):
+    """Properti semua sheet: {judul: properties}"""
+    metadata = execute(service.spreadsheets().get(
+        spreadsheetId=spreadsheet_id,
+        fields="sheets.properties"
+    ), bucket='sheets_read')
+    return {sheet['properties']['title']: sheet['properties'] for sheet in metadata.get('sheets', [])}
+
+
+def read_state(service, spreadsheet_id, state_sheet):
+    """(kunci, hash) publish sebelumnya dari sheet state"""
+    result = execute(service.spreadsheets().values().get(
+        spreadsheetId=spreadsheet_id,
+        range=f"'{state_sheet.replace(chr(39), chr(39) * 2)}'!A:B"
+    ), bucket='sheets_read')
+    rows = result.get('values', [])
+    keys = [row[0] if row else "" for row in rows]
+    hashes = [row[1] if len(row) > 1 else "" for row in rows]
+    return keys, hashes
+
+
+def diff_rows(old_keys, old_hashes, new_keys, new_hashes):
+    """
+    Bandingkan state lama dan baru.
+    Mengembalikan (operasi sisip/hapus pada posisi baris lama, indeks baris baru yang harus ditulis).
+    Operasi: ('insert'|'delete', posisi_lama, jumlah), urut dari bawah ke atas.
+    """
+    matcher = SequenceMatcher(None, old_keys, new_keys, autojunk=False)
+    operations = []
+    changed = []
+
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            changed.extend(j1 + k for k in range(i2 - i1) if old_hashes[i1 + k] != new_hashes[j1 + k])
+            continue
+
+        # Bagian yang tumpang tindih ditulis di tempat, sisanya disisipkan/dihapus
+        overlap = min(i2 - i1, j2 - j1)
+        changed.extend(range(j1, j2))
+        if j2 - j1 > overlap:
+            operations.append(('insert', i1 + overlap, j2 - j1 - overlap))
+        if i2 - i1 > overlap:
+            operations.append(('delete', i1 + overlap, i2 - i1 - overlap))
+
+    # Dari bawah ke atas agar posisi lama tetap valid; hapus sebelum sisip di posisi sama
+    operations.sort(key=lambda op: (-op[1], op[0] != 'delete'))
+    return operations, changed
+
+
+def contiguous_blocks(indices):
+    """Kelompokkan indeks terurut menjadi blok [awal, akhir)"""
+    blocks = []
+    for index in indices:
+        if blocks and blocks[-1][1] == index:
+            blocks[-1][1] = index + 1
+        else:
+            blocks.append([index, index + 1])
+    return blocks
+
+
+def dimension_request(kind, sheet_id, start, count):
+    """Request insertDimension/deleteDimension baris"""
+    dimension_range = {
+        'sheetId': sheet_id,
+        'dimension': 'ROWS',
+        'startIndex': start,
+        'endIndex': start + count
+    }
+    if kind == 'insert':
+        # Baris sisipan tepat di bawah header mewarisi format baris data di bawahnya
+        return {'insertDimension': {'range': dimension_range, 'inheritFromBefore': start > 1}}
+    return {'deleteDimension': {'range': dimension_range}}
+
+
+def reset_sheet_requests(properties, sheet_name, sheet_id, row_count, column_count, hidden=False):
+    """Request buat sheet baru, atau resize + kosongkan sheet yang sudah ada"""
+    grid_properties = {'rowCount': row_count, 'columnCount': column_count}
+    if properties is None:
+        new_properties = {'sheetId': sheet_id, 'title': sheet_name, 'gridProperties': grid_properties}
+        if hidden:
+            new_properties['hidden'] = True
+        return [{'addSheet': {'properties': new_properties}}]
+
+    return [
+        {
+            'updateSheetProperties': {
+                'properties': {'sheetId': sheet_id, 'gridProperties': grid_properties},
+                'fields': 'gridProperties.rowCount,gridProperties.columnCount'
+            }
+        },
+        {'updateCells': {'range': {'sheetId': sheet_id}, 'fields': 'userEnteredValue'}}
+    ]
+
+
+def new_sheet_id(used_ids):
+    """sheetId acak yang belum dipakai"""
+    while True:
+        sheet_id = random.randint(1, MAX_SHEET_ID)
+        if sheet_id not in used_ids:
+            used_ids.add(sheet_id)
+            return sheet_id
+
+
+def write_ranges(service, spreadsheet_id, ranges, value_input_option):
+    """values.batchUpdate untuk list (range, values), dipotong per WRITE_CHUNK_ROWS baris"""
+    batch = []
+    batch_rows = 0
+    for range_name, values in ranges:
+        batch.append({'range': range_name, 'values': values})
+        batch_rows += len(values)
+        if batch_rows >= WRITE_CHUNK_ROWS:
+            execute(service.spreadsheets().values().batchUpdate(
+                spreadsheetId=spreadsheet_id,
+                body={'valueInputOption': value_input_option, 'data': batch}
+            ))
+            batch = []
+            batch_rows = 0
+
+    if batch:
+        execute(service.spreadsheets().values().batchUpdate(
+            spreadsheetId=spreadsheet_id,
+            body={'valueInputOption': value_input_option, 'data': batch}
+        ))
+
+
+def block_ranges(sheet_name, column_count, blocks, row_values, max_rows=WRITE_CHUNK_ROWS):
+    """(range, values) per blok baris (indeks 0 = baris 1), blok besar dipecah per max_rows"""
+    ranges = []
+    for start, end in blocks:
+        for chunk_start in range(start, end, max_rows):
+            chunk_end = min(chunk_start + max_rows, end)
+            ranges.append((
+                sheet_range(sheet_name, chunk_start + 1, chunk_end, column_count),
+                row_values(chunk_start, chunk_end)
+            ))
+    return ranges
+
+
+def data_row_values(df):
+    """Fungsi pengambil nilai baris sheet (0 = header, i = baris data ke-i)"""
+    def row_values(start, end):
+        values = []
+        if start == 0:
+            values.append(df.columns.values.tolist())
+            start = 1
+        return values + df.iloc[start - 1:end - 1].values.tolist()
+    return row_values
+
+
+def write_full(service, spreadsheet_id, sheet_name, df, value_input_option):
+    """Tulis header + semua baris mulai A1 (per WRITE_CHUNK_ROWS baris)"""
+    ranges = block_ranges(sheet_name, len(df.columns), [[0, len(df) + 1]], data_row_values(df))
+    write_ranges(service, spreadsheet_id, ranges, value_input_option)
+
+
+# ============================
+# FUNGSI UTAMA
+# ============================
+def write_sheet_incremental(service, spreadsheet_id, sheet_name, df, key_columns=None,
+                            value_input_option='USER_ENTERED', full_write=None):
+    """
+    Publikasikan df ke sheet_name, hanya menulis baris yang berubah.
+    - service: service Sheets API v4 (googleapiclient)
+    - key_columns: kolom kunci baris (mis. ['NIK']), None = seluruh isi baris
+    - full_write(df): penulis penuh milik script (dipanggil setelah sheet
+      dikosongkan dan di-resize), default write_full
+    Mengembalikan ringkasan {'mode', 'rows_written', 'inserted', 'deleted', 'cells_written'}.
+    """
+    state_sheet = STATE_SHEET_PREFIX + sheet_name
+    column_count = max(len(df.columns), 1)
+    new_keys, new_hashes = row_state(df, key_columns)
+
+    properties = fetch_sheet_properties(service, spreadsheet_id)
+    data_properties = properties.get(sheet_name)
+    state_properties = properties.get(state_sheet)
+
+    old_keys, old_hashes = [], []
+    if data_properties and state_properties:
+        old_keys, old_hashes = read_state(service, spreadsheet_id, state_sheet)
+
+    # State hanya valid jika susunan barisnya sama dengan sheet data dan header tidak berubah
+    state_valid = (
+        len(df) > 0
+        and old_keys[:1] == [HEADER_KEY]
+        and old_hashes[0] == new_hashes[0]
+        and data_properties['gridProperties']['rowCount'] == len(old_keys)
+        and data_properties['gridProperties']['columnCount'] == column_count
+    )
+
+    if state_valid:
+        operations, changed = diff_rows(old_keys, old_hashes, new_keys, new_hashes)
+        inserted = sum(count for kind, _, count in operations if kind == 'insert')
+        deleted = sum(count for kind, _, count in operations if kind == 'delete')
+        if len(changed) + deleted > FULL_REWRITE_RATIO * len(new_keys):
+            print(f"   ℹ️  {len(changed):,} baris berubah dari {len(df):,}, tulis ulang penuh")
+            state_valid = False
+
+    if not state_valid:
+        summary = rewrite_sheet(service, spreadsheet_id, sheet_name, df, properties,
+                                new_keys, new_hashes, value_input_option, full_write)
+    else:
+        summary = apply_changes(service, spreadsheet_id, sheet_name, df, properties,
+                                operations, changed, new_keys, new_hashes, value_input_option)
+        summary.update({'inserted': inserted, 'deleted': deleted})
+
+    summary['cells_written'] = summary['rows_written'] * len(df.columns)
+    print(f"   📝 Sheet '{sheet_name}' ({summary['mode']}): {summary['rows_written']:,} baris ditulis, "
+          f"{summary['inserted']:,} disisipkan, {summary['deleted']:,} dihapus, "
+          f"{summary['cells_written']:,} sel dari {(len(df) + 1) * len(df.columns):,}")
+    return summary
+
+
+def rewrite_sheet(service, spreadsheet_id, sheet_name, df, properties, new_keys, new_hashes,
+                  value_input_option, full_write):
+    """Tulis ulang penuh sheet data dan sheet state"""
+    state_sheet = STATE_SHEET_PREFIX + sheet_name
+    data_properties = properties.get(sheet_name)
+    state_properties = properties.get(state_sheet)
+
+    used_ids = {sheet_properties['sheetId'] for sheet_properties in properties.values()}
+    data_id = data_properties['sheetId'] if data_properties else new_sheet_id(used_ids)
+    state_id = state_properties['sheetId'] if state_properties else new_sheet_id(used_ids)
+    row_count = max(len(new_keys), 2)
+
+    requests = (
+        reset_sheet_requests(data_properties, sheet_name, data_id, row_count, max(len(df.columns), 1))
+        + reset_sheet_requests(state_properties, state_sheet, state_id, row_count, 2, hidden=True)
+    )
+    execute(service.spreadsheets().batchUpdate(spreadsheetId=spreadsheet_id, body={'requests': requests}))
+
+    if full_write:
+        full_write(df)
+    else:
+        write_full(service, spreadsheet_id, sheet_name, df, value_input_option)
+
+    state_values = [list(pair) for pair in zip(new_keys, new_hashes)]
+    ranges = block_ranges(state_sheet, 2, [[0, len(state_values)]],
+                          lambda start, end: state_values[start:end])
+    write_ranges(service, spreadsheet_id, ranges, 'RAW')
+
+    return {'mode': 'penuh', 'rows_written': len(new_keys), 'inserted': 0, 'deleted': 0}
+
+
+def apply_changes(service, spreadsheet_id, sheet_name, df, properties, operations, changed,
+                  new_keys, new_hashes, value_input_option):
+    """Terapkan sisip/hapus baris lalu tulis blok baris yang berubah (sheet data + state)"""
+    state_sheet = STATE_SHEET_PREFIX + sheet_name
+    data_id = properties[sheet_name]['sheetId']
+    state_id = properties[state_sheet]['sheetId']
+
+    if operations:
+        requests = []
+        for kind, start, count in operations:
+            requests.append(dimension_request(kind, data_id, start, count))
+            requests.append(dimension_request(kind, state_id, start, count))
+        execute(service.spreadsheets().batchUpdate(spreadsheetId=spreadsheet_id, body={'requests': requests}))
+
+    blocks = contiguous_blocks(changed)
+    if blocks:
+        ranges = block_ranges(sheet_name, len(df.columns), blocks, data_row_values(df))
+        write_ranges(service, spreadsheet_id, ranges, value_input_option)
+
+        state_values = [list(pair) for pair in zip(new_keys, new_hashes)]
+        state_ranges = block_ranges(state_sheet, 2, blocks, lambda start, end: state_values[start:end])
+        write_ranges(service, spreadsheet_id, state_ranges, 'RAW')
+
+    return {'mode': 'inkremental', 'rows_written': len(changed)}
@@ -173,6 +173,41 @@ def clean_filename(filename):
         cleaned = cleaned[:100]
     return cleaned
 
+def text_series(series, na_value=''):
+    """Nilai kolom sebagai teks ter-strip, sel kosong (NaN) diganti na_value"""
+    text = series.astype(object).astype(str).str.strip()
+    return text.where(series.notna(), na_value)
+
+def build_kode_mapping(kode_df, value_col):
+    """Mapping kode desa -> nilai kolom (Series ber-index kode, entri terakhir dipakai)"""
+    kode_desa = text_series(kode_df['Kode Desa'], na_value='nan')
+    if value_col in kode_df.columns:
+        values = text_series(kode_df[value_col])
+    else:
+        values = pd.Series('', index=kode_df.index)
+    
+    valid = (kode_desa != '') & (values != '')
+    mapping = pd.Series(values[valid].values, index=kode_desa[valid].values)
+    return mapping[~mapping.index.duplicated(keep='last')]
+
+def get_kode_desa_series(erdkk_df, kode_col_names):
+    """Kode desa per baris dari kolom kandidat pertama yang terisi ('' jika tidak ada)"""
+    kode_desa = pd.Series(np.nan, index=erdkk_df.index, dtype=object)
+    for col_name in kode_col_names:
+        if col_name in erdkk_df.columns:
+            kode_desa = kode_desa.where(kode_desa.notna(), text_series(erdkk_df[col_name], na_value=np.nan))
+    return kode_desa.fillna('')
+
+def enrich_column(current, from_mapping):
+    """
+    Nilai akhir kolom (prioritas: data mapping > data existing) dan jumlah baris
+    yang diperbarui (mapping terisi dan berbeda dari data existing)
+    """
+    has_mapping = from_mapping != ''
+    final = from_mapping.where(has_mapping, current)
+    updated_count = int((has_mapping & (current != from_mapping)).sum())
+    return final, updated_count
+
 # ============================
 # FUNGSI KIRIM EMAIL
 # ============================
@@ -440,19 +475,8 @@ def process_erdkk_files():
                 break
     
     # Buat mapping kode desa ke kecamatan dan desa
-    kode_to_kecamatan = {}
-    kode_to_desa = {}
-    
-    for _, row in kode_df.iterrows():
-        kode_desa = str(row['Kode Desa']).strip()
-        kecamatan = str(row['KECAMATAN']).strip() if 'KECAMATAN' in kode_df.columns and pd.notna(row['KECAMATAN']) else ''
-        desa = str(row['Desa']).strip() if 'Desa' in kode_df.columns and pd.notna(row['Desa']) else ''
-        
-        if kode_desa:
-            if kecamatan:
-                kode_to_kecamatan[kode_desa] = kecamatan
-            if desa:
-                kode_to_desa[kode_desa] = desa
+    kode_to_kecamatan = build_kode_mapping(kode_df, 'KECAMATAN')
+    kode_to_desa = build_kode_mapping(kode_df, 'Desa')
     
     print(f"✅ Mapping berhasil dibuat:")
     print(f"  📍 Kode desa → kecamatan: {len(kode_to_kecamatan)} entri")
@@ -556,58 +580,34 @@ def process_erdkk_files():
                 print(f"✅ Kolom 'Nama Desa' ditambahkan di akhir file")
             
             # =============== ISI DATA KECAMATAN DAN DESA ===============
-            kecamatan_data = []
-            desa_data = []
-            kecamatan_updated_count = 0
-            desa_updated_count = 0
-            kecamatan_found = None
+            # 1. Dapatkan kode desa dari berbagai kemungkinan nama kolom
+            kode_col_names = ['Kode Desa', 'Kode_Desa', 'KodeDesa', 'KODE DESA', 'KODES', 'Kode']
+            kode_desa = get_kode_desa_series(erdkk_df, kode_col_names)
             
-            for idx, row in erdkk_df.iterrows():
-                # 1. Dapatkan kode desa dari berbagai kemungkinan nama kolom
-                kode_desa = ''
-                kode_col_names = ['Kode Desa', 'Kode_Desa', 'KodeDesa', 'KODE DESA', 'KODES', 'Kode']
-                
-                for col_name in kode_col_names:
-                    if col_name in erdkk_df.columns:
-                        kode_val = row[col_name]
-                        if pd.notna(kode_val):
-                            kode_desa = str(kode_val).strip()
-                            break
-                
-                # 2. Dapatkan data dari mapping
-                kecamatan_from_mapping = kode_to_kecamatan.get(kode_desa, '')
-                desa_from_mapping = kode_to_desa.get(kode_desa, '')
-                
-                # 3. Dapatkan data yang sudah ada di file
-                current_kecamatan = str(row[kecamatan_col_name]).strip() if pd.notna(row[kecamatan_col_name]) else ''
-                current_desa = str(row[desa_col_name]).strip() if pd.notna(row[desa_col_name]) else ''
-                
-                # 4. Tentukan nilai akhir (prioritas: data mapping > data existing)
-                final_kecamatan = kecamatan_from_mapping if kecamatan_from_mapping else current_kecamatan
-                final_desa = desa_from_mapping if desa_from_mapping else current_desa
-                
-                # 5. Hitung berapa data yang diperbarui
-                if kecamatan_from_mapping and (not current_kecamatan or current_kecamatan != kecamatan_from_mapping):
-                    kecamatan_updated_count += 1
-                
-                if desa_from_mapping and (not current_desa or current_desa != desa_from_mapping):
-                    desa_updated_count += 1
-                
-                kecamatan_data.append(final_kecamatan)
-                desa_data.append(final_desa)
-                
-                # 6. Catat kecamatan pertama yang ditemukan untuk rename file
-                if final_kecamatan and kecamatan_found is None:
-                    kecamatan_found = final_kecamatan
+            # 2. Dapatkan data dari mapping
+            kecamatan_from_mapping = kode_desa.map(kode_to_kecamatan).fillna('')
+            desa_from_mapping = kode_desa.map(kode_to_desa).fillna('')
+            
+            # 3. Dapatkan data yang sudah ada di file
+            current_kecamatan = text_series(erdkk_df[kecamatan_col_name])
+            current_desa = text_series(erdkk_df[desa_col_name])
+            
+            # 4-5. Tentukan nilai akhir dan hitung berapa data yang diperbarui
+            kecamatan_data, kecamatan_updated_count = enrich_column(current_kecamatan, kecamatan_from_mapping)
+            desa_data, desa_updated_count = enrich_column(current_desa, desa_from_mapping)
+            
+            # 6. Catat kecamatan pertama yang ditemukan untuk rename file
+            kecamatan_terisi = kecamatan_data[kecamatan_data != '']
+            kecamatan_found = kecamatan_terisi.iloc[0] if len(kecamatan_terisi) > 0 else None
             
             # Update kolom Kecamatan dan Desa
-            erdkk_df[kecamatan_col_name] = kecamatan_data
-            erdkk_df[desa_col_name] = desa_data
+            erdkk_df[kecamatan_col_name] = kecamatan_data.tolist()
+            erdkk_df[desa_col_name] = desa_data.tolist()
             
             # Hitung statistik
             total_rows = len(erdkk_df)
-            kecamatan_filled = sum(1 for x in kecamatan_data if x)
-            desa_filled = sum(1 for x in desa_data if x)
+            kecamatan_filled = int((kecamatan_data != '').sum())
+            desa_filled = int((desa_data != '').sum())
             fill_percentage = ((kecamatan_filled + desa_filled) / (total_rows * 2) * 100) if total_rows > 0 else 0
             
             print(f"✅ Data berhasil diproses:")
@@ -0,0 +1,70 @@
+"""
+nik_cleaner.py
+Normalisasi NIK/KTP bersama untuk semua script.
+NIK dibersihkan per kolom (bukan per baris): semua karakter non-angka
+seperti ', `, spasi, titik dihapus, nilai kosong/tanpa angka menjadi None,
+lalu panjang dicek terhadap 16 digit. Opsi zfill menambahkan nol di depan
+NIK yang kurang dari 16 digit (leading zero hilang karena dibaca sebagai angka).
+
+NIK tidak standar tidak dicetak per baris; hasilnya dirangkum dalam satu
+laporan ringkas (jumlah + beberapa contoh) yang dicetak lewat print_nik_report.
+
+Lokasi: verval-pupuk2/scripts/nik_cleaner.py
+"""
+
+import pandas as pd
+
+# ============================
+# KONFIGURASI
+# ============================
+NIK_LENGTH = 16
+NIK_REPORT_EXAMPLES = 5
+
+
+# ============================
+# FUNGSI UTAMA
+# ============================
+def clean_nik_series(nik_series, zfill=False):
+    """
+    Bersihkan satu kolom NIK.
+    Mengembalikan (Series NIK bersih dengan None untuk NIK kosong, laporan NIK tidak valid).
+    Laporan: {'total', 'kosong', 'tidak_standar', 'contoh': [(nilai asli, hasil), ...]}
+    """
+    text = nik_series.astype(object).where(nik_series.isna(), nik_series.astype(str))
+    cleaned = text.str.replace(r'\D', '', regex=True)
+    cleaned = cleaned.where(cleaned.notna() & (cleaned != ''), None)
+
+    if zfill:
+        cleaned = cleaned.where(cleaned.isna(), cleaned.str.zfill(NIK_LENGTH))
+
+    empty = nik_series.notna() & cleaned.isna()
+    non_standard = cleaned.notna() & (cleaned.str.len() != NIK_LENGTH)
+
+    report = {
+        'total': len(nik_series),
+        'kosong': int(empty.sum()),
+        'tidak_standar': int(non_standard.sum()),
+        'contoh': list(zip(nik_series[non_standard].head(NIK_REPORT_EXAMPLES),
+                           cleaned[non_standard].head(NIK_REPORT_EXAMPLES)))
+    }
+    return cleaned, report
+
+
+def clean_nik(nik_value, zfill=False):
+    """Bersihkan satu nilai NIK (aturan sama dengan clean_nik_series), None jika kosong"""
+    cleaned, _ = clean_nik_series(pd.Series([nik_value], dtype=object), zfill=zfill)
+    return cleaned.iloc[0]
+
+
+def print_nik_report(report, label=""):
+    """Cetak ringkasan NIK tidak valid (tidak mencetak apa pun jika semua NIK standar)"""
+    prefix = f"{label}: " if label else ""
+
+    if report['kosong']:
+        print(f"   ⚠️  {prefix}{report['kosong']:,} NIK tanpa angka dikosongkan")
+
+    if report['tidak_standar']:
+        print(f"   ⚠️  {prefix}{report['tidak_standar']:,} dari {report['total']:,} NIK tidak standar "
+              f"(bukan {NIK_LENGTH} digit), contoh:")
+        for raw_value, nik in report['contoh']:
+            print(f"      • {raw_value} -> {nik} (panjang: {len(nik)})")
@@ -0,0 +1,79 @@
+"""
+parallel_publish.py
+Tahap publikasi paralel untuk spreadsheet yang saling independen.
+Setiap spreadsheet tujuan (mis. spreadsheet utama dan bulanan) ditulis
+di thread sendiri, sehingga waktu publikasi mengikuti spreadsheet
+terlama dan bukan jumlah semuanya. Quota tetap dijaga oleh rate limiter
+bersama (rate_limiter.py) yang aman dipakai dari banyak thread.
+
+Client gspread memakai requests.Session sehingga boleh dipakai bersama
+antar thread; service googleapiclient (httplib2) harus dibuat per thread.
+
+Lokasi: verval-pupuk2/scripts/parallel_publish.py
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# ============================
+# KONFIGURASI
+# ============================
+PUBLISH_WORKERS = int(os.getenv("SHEETS_PUBLISH_WORKERS", "4"))
+
+
+# ============================
+# FUNGSI BANTU
+# ============================
+def timed_call(function, args):
+    """Jalankan function(*args), kembalikan (hasil, lama detik)"""
+    start_time = time.time()
+    result = function(*args)
+    return result, time.time() - start_time
+
+
+# ============================
+# FUNGSI UTAMA
+# ============================
+def publish_parallel(tasks, max_workers=None):
+    """
+    Jalankan semua tugas publikasi (label, function, *args) secara paralel.
+    Semua tugas ditunggu sampai selesai walaupun ada yang gagal; error
+    pertama dilempar ulang setelahnya.
+    Mengembalikan dict {label: hasil function}.
+    """
+    if not tasks:
+        return {}
+
+    workers = max(1, min(max_workers or PUBLISH_WORKERS, len(tasks)))
+    labels = [task[0] for task in tasks]
+    print(f"\n🚀 Publikasi {len(tasks)} spreadsheet paralel ({workers} thread): {', '.join(labels)}")
+
+    start_time = time.time()
+    results = {}
+    durations = {}
+    errors = []
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(timed_call, function, args): label
+            for label, function, *args in tasks
+        }
+
+        for future in as_completed(futures):
+            label = futures[future]
+            try:
+                results[label], durations[label] = future.result()
+                print(f"   ✅ Spreadsheet {label} selesai dalam {durations[label]:.1f} detik")
+            except Exception as e:
+                errors.append((label, e))
+                print(f"   ❌ Spreadsheet {label} gagal: {str(e)}")
+
+    elapsed = time.time() - start_time
+    print(f"📊 Publikasi selesai dalam {elapsed:.1f} detik "
+          f"(berurutan ≈ {sum(durations.values()):.1f} detik)")
+
+    if errors:
+        raise errors[0][1]
+
+    return results
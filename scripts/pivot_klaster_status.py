@@ -14,11 +14,13 @@ from google.oauth2.service_account import Credentials
 from datetime import datetime, date
 import traceback
 import json
-import time
-from googleapiclient.errors import HttpError
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
-import io
+from drive_download import download_folder_files
+from excel_snapshot import read_excel_snapshot
+from status_classifier import classify_status
+from nik_cleaner import clean_nik_series, print_nik_report
+from rate_limiter import rate_limited_call, print_rate_limit_report, get_throttled_seconds
+from parallel_publish import publish_parallel
+from sheet_publisher import publish_sheets, cell_format_request, grid_range
 
 # ============================
 # KONFIGURASI
@@ -29,9 +31,6 @@ KIOS_SHEET_URL = "https://docs.google.com/spreadsheets/d/1R5ok4B-0AAlZd3gblMViRr
 
 # OPTIMIZED RATE LIMITING
 MAX_RETRIES = 5
-INITIAL_RETRY_DELAY = 30
-WRITE_DELAY = 5
-BATCH_DELAY = 10
 
 # Warna untuk header Google Sheets (RGB values 0-1)
 HEADER_FORMAT = {
@@ -40,6 +39,10 @@ HEADER_FORMAT = {
     "horizontalAlignment": "CENTER"
 }
 
+# Pola klasifikasi status: isi kurung () [] {} <> dan spasi berlebihan
+STATUS_BRACKET_PATTERN = re.compile(r'[\(\[{<].*?[\)\]}>]')
+STATUS_WHITESPACE_PATTERN = re.compile(r'\s+')
+
 # ============================
 # LOAD EMAIL CONFIGURATION FROM SECRETS
 # ============================
@@ -146,13 +149,11 @@ def klasifikasikan_status(status_value):
     original_status = status_str
     
     # **HAPUS SEMUA KONTEN DALAM KURUNG APAPUN**
-    import re
-    
     # Hapus semua kurung dan isinya: (), [], {}, <>
-    status_no_brackets = re.sub(r'[\(\[{<].*?[\)\]}>]', '', status_str)
+    status_no_brackets = STATUS_BRACKET_PATTERN.sub('', status_str)
     
     # Bersihkan spasi berlebihan
-    status_no_brackets = re.sub(r'\s+', ' ', status_no_brackets).strip()
+    status_no_brackets = STATUS_WHITESPACE_PATTERN.sub(' ', status_no_brackets).strip()
     
     # Jika setelah hapus kurung jadi kosong, gunakan string asli
     if not status_no_brackets:
@@ -286,7 +287,45 @@ def debug_status_classification(df, sample_size=10):
 # ============================
 # FUNGSI BANTU UNTUK TANGGAL INPUT
 # ============================
+# Cache tanggal input terbaru per file: path -> (kolom tanggal, tanggal terbaru)
+LATEST_INPUT_DATE_CACHE = {}
+
+def is_tgl_input_column(col_name):
+    col_upper = str(col_name).upper()
+    return 'TGL INPUT' in col_upper or 'TANGGAL INPUT' in col_upper
+
+def parse_tanggal_input(values):
+    try:
+        return pd.to_datetime(values, errors='coerce', dayfirst=True)
+    except:
+        pass
+    
+    for date_format in ['%d/%m/%Y %H:%M:%S', '%d-%m-%Y %H:%M:%S', '%d/%m/%Y', '%d-%m-%Y']:
+        try:
+            return pd.to_datetime(values, errors='coerce', format=date_format)
+        except:
+            continue
+    
+    return pd.to_datetime(values, errors='coerce')
+
+def find_latest_input_date(df):
+    """Kolom TGL INPUT dan tanggal terbarunya; (None, None) jika kolom tidak ada"""
+    tgl_input_cols = [col for col in df.columns if is_tgl_input_column(col)]
+    if not tgl_input_cols:
+        return None, None
+    
+    tgl_col = tgl_input_cols[0]
+    valid_datetimes = parse_tanggal_input(df[tgl_col]).dropna()
+    
+    if valid_datetimes.empty:
+        return tgl_col, None
+    return tgl_col, valid_datetimes.max()
+
 def extract_latest_input_date_from_files(excel_files):
+    """
+    Tanggal input terbaru dari semua file. Memakai hasil yang dihitung saat
+    file diparse di proses utama; file lain hanya dibaca kolom tanggalnya.
+    """
     latest_datetime = None
     found_in_files = 0
     
@@ -297,36 +336,15 @@ def extract_latest_input_date_from_files(excel_files):
         file_name = file_info['name']
         
         try:
-            df = pd.read_excel(file_path, sheet_name='Worksheet')
-            
-            tgl_input_cols = [col for col in df.columns if 'TGL INPUT' in col.upper() or 'TANGGAL INPUT' in col.upper()]
+            if file_path not in LATEST_INPUT_DATE_CACHE:
+                df = pd.read_excel(file_path, sheet_name='Worksheet', usecols=is_tgl_input_column)
+                LATEST_INPUT_DATE_CACHE[file_path] = find_latest_input_date(df)
+            tgl_col, file_latest_datetime = LATEST_INPUT_DATE_CACHE[file_path]
             
-            if tgl_input_cols:
-                tgl_col = tgl_input_cols[0]
+            if tgl_col:
                 found_in_files += 1
                 
-                try:
-                    df[tgl_col] = pd.to_datetime(df[tgl_col], errors='coerce', dayfirst=True)
-                except:
-                    try:
-                        df[tgl_col] = pd.to_datetime(df[tgl_col], errors='coerce', format='%d/%m/%Y %H:%M:%S')
-                    except:
-                        try:
-                            df[tgl_col] = pd.to_datetime(df[tgl_col], errors='coerce', format='%d-%m-%Y %H:%M:%S')
-                        except:
-                            try:
-                                df[tgl_col] = pd.to_datetime(df[tgl_col], errors='coerce', format='%d/%m/%Y')
-                            except:
-                                try:
-                                    df[tgl_col] = pd.to_datetime(df[tgl_col], errors='coerce', format='%d-%m-%Y')
-                                except:
-                                    df[tgl_col] = pd.to_datetime(df[tgl_col], errors='coerce')
-                
-                valid_datetimes = df[tgl_col].dropna()
-                
-                if not valid_datetimes.empty:
-                    file_latest_datetime = valid_datetimes.max()
-                    
+                if file_latest_datetime is not None:
                     if latest_datetime is None or file_latest_datetime > latest_datetime:
                         latest_datetime = file_latest_datetime
                     
@@ -376,25 +394,23 @@ def write_update_date_to_sheet(gc, spreadsheet_url, latest_datetime):
         try:
             worksheet = spreadsheet.worksheet("Sheet1")
         except:
-            worksheet = spreadsheet.add_worksheet(title="Sheet1", rows="100", cols="20")
+            worksheet = safe_google_api_operation(spreadsheet.add_worksheet, title="Sheet1", rows="100", cols="20")
         
-        worksheet.update('E1', [['Update per tanggal input']])
-        time.sleep(WRITE_DELAY)
+        safe_google_api_operation(worksheet.update, 'E1', [['Update per tanggal input']])
         
         if latest_datetime:
             date_formatted = format_date_indonesian(latest_datetime.date())
         else:
             date_formatted = "Tanggal tidak tersedia"
         
-        worksheet.update('E2', [[date_formatted]])
-        time.sleep(WRITE_DELAY)
+        safe_google_api_operation(worksheet.update, 'E2', [[date_formatted]])
         
         if latest_datetime:
             time_formatted = latest_datetime.strftime('%H:%M:%S')
         else:
             time_formatted = "Waktu tidak tersedia"
         
-        worksheet.update('E3', [[time_formatted]])
+        safe_google_api_operation(worksheet.update, 'E3', [[time_formatted]])
         
         print(f"   ✅ Tanggal update: {date_formatted} {time_formatted}")
         return True
@@ -406,58 +422,9 @@ def write_update_date_to_sheet(gc, spreadsheet_url, latest_datetime):
 # ============================
 # FUNGSI BANTU LAINNYA
 # ============================
-def clean_nik(nik_value):
-    if pd.isna(nik_value) or nik_value is None:
-        return None
-    nik_str = str(nik_value)
-    cleaned_nik = re.sub(r'\D', '', nik_str)
-    if len(cleaned_nik) != 16:
-        print(f"⚠️  NIK tidak standar: {nik_value} -> {cleaned_nik}")
-    return cleaned_nik if cleaned_nik else None
-
-def exponential_backoff(attempt):
-    base_delay = INITIAL_RETRY_DELAY * (2 ** (attempt - 1))
-    jitter = base_delay * 0.1
-    return base_delay + jitter
-
 def safe_google_api_operation(operation, *args, **kwargs):
-    last_exception = None
-    
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            result = operation(*args, **kwargs)
-            if attempt > 1:
-                print(f"   ✅ Berhasil pada percobaan ke-{attempt}")
-            return result
-            
-        except HttpError as e:
-            last_exception = e
-            if e.resp.status == 429:
-                if attempt < MAX_RETRIES:
-                    wait_time = exponential_backoff(attempt)
-                    print(f"⏳ Quota exceeded, menunggu {wait_time:.1f} detik...")
-                    time.sleep(wait_time)
-                else:
-                    raise e
-            elif e.resp.status in [500, 502, 503, 504]:
-                if attempt < MAX_RETRIES:
-                    wait_time = exponential_backoff(attempt)
-                    print(f"⏳ Server error {e.resp.status}, menunggu {wait_time:.1f} detik...")
-                    time.sleep(wait_time)
-                else:
-                    raise e
-            else:
-                raise e
-        except Exception as e:
-            last_exception = e
-            if attempt < MAX_RETRIES:
-                wait_time = exponential_backoff(attempt)
-                print(f"⏳ Error {type(e).__name__}, menunggu {wait_time:.1f} detik...")
-                time.sleep(wait_time)
-            else:
-                raise e
-    
-    raise last_exception
+    """Panggilan Google API lewat rate limiter bersama (retry 429/5xx, mengikuti Retry-After)"""
+    return rate_limited_call(operation, *args, max_retries=MAX_RETRIES, **kwargs)
 
 def add_total_row(df, pupuk_columns):
     df_with_total = df.copy()
@@ -493,55 +460,19 @@ def add_total_row_with_kios(df, pupuk_columns):
     
     return df_with_total
 
-def apply_header_format(gc, spreadsheet_url, sheet_name):
-    try:
-        spreadsheet = gc.open_by_url(spreadsheet_url)
-        worksheet = spreadsheet.worksheet(sheet_name)
-        
-        worksheet.format('A1:Z1', HEADER_FORMAT)
-        worksheet.columns_auto_resize(0, 20)
-        
-        print(f"   🎨 Format header diterapkan pada {sheet_name}")
-        return True
-    except Exception as e:
-        print(f"   ⚠️  Gagal format header {sheet_name}: {str(e)}")
-        return False
+def header_format_requests(sheet_id, df):
+    """Request format header (baris 1) untuk batchUpdate publish_sheets"""
+    return [cell_format_request(grid_range(sheet_id, 0, 1), HEADER_FORMAT)]
 
 # ============================
 # FUNGSI DOWNLOAD FILE
 # ============================
 def download_excel_files_from_drive(credentials, folder_id, save_folder="data_excel"):
-    os.makedirs(save_folder, exist_ok=True)
-    drive_service = build('drive', 'v3', credentials=credentials)
+    paths = download_folder_files(credentials, folder_id, save_folder)
 
-    query = f"'{folder_id}' in parents and (mimeType='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet' or mimeType='application/vnd.ms-excel')"
-    results = drive_service.files().list(q=query, fields="files(id, name)").execute()
-    files = results.get("files", [])
-
-    if not files:
+    if not paths:
         raise ValueError("❌ Tidak ada file Excel di folder Google Drive.")
 
-    paths = []
-    for file in files:
-        print(f"📥 Downloading: {file['name']}")
-        request = drive_service.files().get_media(fileId=file["id"])
-        
-        safe_filename = "".join(c for c in file['name'] if c.isalnum() or c in (' ', '-', '_', '.')).rstrip()
-        file_path = os.path.join(save_folder, safe_filename)
-
-        with io.FileIO(file_path, 'wb') as fh:
-            downloader = MediaIoBaseDownload(fh, request)
-            done = False
-            while not done:
-                status, done = downloader.next_chunk()
-
-        paths.append({
-            'path': file_path,
-            'name': file['name'],
-            'id': file['id']
-        })
-
-    print(f"✅ Berhasil download {len(paths)} file Excel")
     return paths
 
 # ============================
@@ -553,7 +484,7 @@ def create_pivot_klaster(df, numeric_columns, pivot_type='kecamatan'):
     # PASTIKAN kolom KLASIFIKASI_STATUS sudah ada
     if 'KLASIFIKASI_STATUS' not in df.columns:
         print("   ⚠️  Membuat kolom KLASIFIKASI_STATUS...")
-        df['KLASIFIKASI_STATUS'] = df['STATUS'].apply(klasifikasikan_status)
+        df['KLASIFIKASI_STATUS'] = classify_status(df['STATUS'], klasifikasikan_status)
     
     # DEBUG: Hitung distribusi per klaster
     print("\n   📊 DISTRIBUSI PER KLASTER:")
@@ -599,47 +530,33 @@ def process_and_upload_pivots(gc, df, numeric_columns, spreadsheet_url, pivot_ty
     if latest_datetime:
         write_update_date_to_sheet(gc, spreadsheet_url, latest_datetime)
     
-    # HAPUS SEMUA SHEET LAMA (kecuali Sheet1)
-    existing_sheets = spreadsheet.worksheets()
-    for sheet in existing_sheets:
-        if sheet.title != "Sheet1":
-            try:
-                spreadsheet.del_worksheet(sheet)
-                print(f"   🗑️  Menghapus sheet lama: {sheet.title}")
-                time.sleep(WRITE_DELAY)
-            except:
-                pass
-    
-    sheet_count = 0
+    updates = []
     for klaster, pivot_df in pivots.items():
         sheet_name = get_klaster_display_name(klaster)
-        row_count = len(pivot_df)
-        
-        print(f"   📝 Uploading {sheet_name}: {row_count-1} baris data")
-        
-        try:
-            worksheet = spreadsheet.add_worksheet(
-                title=sheet_name, 
-                rows=str(row_count + 10), 
-                cols=str(len(pivot_df.columns) + 5)
-            )
-            
-            worksheet.clear()
-            time.sleep(WRITE_DELAY)
-            
-            worksheet.update(
-                [pivot_df.columns.values.tolist()] + pivot_df.values.tolist()
-            )
-            
-            time.sleep(WRITE_DELAY)
-            apply_header_format(gc, spreadsheet_url, sheet_name)
-            
-            sheet_count += 1
-            time.sleep(WRITE_DELAY)
-            
-        except Exception as e:
-            print(f"   ❌ Gagal membuat sheet {sheet_name}: {str(e)}")
+        print(f"   📝 Uploading {sheet_name}: {len(pivot_df)-1} baris data")
+        updates.append((sheet_name, pivot_df))
     
+    # Sheet lama dipakai ulang, hanya sheet klaster yang tidak ada lagi yang dihapus
+    # (Sheet1 berisi tanggal update tetap di paling kiri)
+    try:
+        published = publish_sheets(
+            spreadsheet,
+            updates,
+            format_requests=header_format_requests,
+            auto_resize=True,
+            api_call=safe_google_api_operation,
+            reconcile=True,
+            keep_sheets=["Sheet1"]
+        )
+    except Exception as e:
+        print(f"   ❌ Gagal membuat sheet {pivot_type}: {str(e)}")
+        published = []
+    
+    for sheet_name, row_count, created in published:
+        status = "sheet baru" if created else "sheet existing"
+        print(f"   🎨 {sheet_name} ({status}), format header diterapkan")
+    
+    sheet_count = len(published)
     print(f"📊 Total {pivot_type} sheet dibuat: {sheet_count}")
     return sheet_count
 
@@ -671,8 +588,6 @@ def process_verval_pupuk_by_klaster():
         excel_files = download_excel_files_from_drive(credentials, FOLDER_ID)
         print(f"📁 Ditemukan {len(excel_files)} file Excel")
 
-        latest_datetime, files_with_date = extract_latest_input_date_from_files(excel_files)
-        
         expected_columns = ['KECAMATAN', 'NO TRANSAKSI', 'KODE KIOS', 'NAMA KIOS', 'NIK', 'NAMA PETANI',
                           'UREA', 'NPK', 'SP36', 'ZA', 'NPK FORMULA', 'ORGANIK', 'ORGANIK CAIR',
                           'TGL TEBUS', 'STATUS']
@@ -688,7 +603,10 @@ def process_verval_pupuk_by_klaster():
             print(f"\n📖 Memproses: {file_name}")
 
             try:
-                df = pd.read_excel(file_path, sheet_name='Worksheet')
+                df = read_excel_snapshot(file_path, sheet_name='Worksheet')
+                
+                # Tanggal input terbaru dihitung sekalian dari hasil parsing ini
+                LATEST_INPUT_DATE_CACHE[file_path] = find_latest_input_date(df)
 
                 missing_columns = [col for col in expected_columns if col not in df.columns]
                 if missing_columns:
@@ -696,7 +614,8 @@ def process_verval_pupuk_by_klaster():
                     continue
 
                 # Clean data
-                df['NIK'] = df['NIK'].apply(clean_nik)
+                df['NIK'], nik_report = clean_nik_series(df['NIK'])
+                print_nik_report(nik_report)
                 df = df[df['NIK'].notna()]
 
                 for col in pupuk_columns:
@@ -717,6 +636,8 @@ def process_verval_pupuk_by_klaster():
                 print(f"   ❌ Error: {str(e)}")
                 continue
 
+        latest_datetime, files_with_date = extract_latest_input_date_from_files(excel_files)
+
         if not all_data:
             error_msg = "Tidak ada data yang berhasil diproses!"
             send_email_notification("REKAP KLASTER GAGAL", error_msg, is_success=False)
@@ -741,7 +662,7 @@ def process_verval_pupuk_by_klaster():
         
         # 3. Klasifikasi semua data
         print("\n🎯 MENERAPKAN KLASIFIKASI STATUS...")
-        combined_df['KLASIFIKASI_STATUS'] = combined_df['STATUS'].apply(klasifikasikan_status)
+        combined_df['KLASIFIKASI_STATUS'] = classify_status(combined_df['STATUS'], klasifikasikan_status)
         
         # 4. Analisis setelah klasifikasi
         print("\n📊 DISTRIBUSI SETELAH KLASIFIKASI:")
@@ -764,29 +685,16 @@ def process_verval_pupuk_by_klaster():
             for i, status in enumerate(sample_statuses):
                 print(f"     {i+1}. '{status}'")
         
-        # Clear old sheets
-        print(f"\n🗑️  MEMBERSIHKAN SHEET LAMA...")
-        
-        for url in [KECAMATAN_SHEET_URL, KIOS_SHEET_URL]:
-            try:
-                spreadsheet = gc.open_by_url(url)
-                sheets = spreadsheet.worksheets()
-                for sheet in sheets:
-                    if sheet.title != "Sheet1":
-                        spreadsheet.del_worksheet(sheet)
-                        print(f"   ✅ Menghapus: {sheet.title}")
-                        time.sleep(WRITE_DELAY)
-            except Exception as e:
-                print(f"   ⚠️  Gagal clear {url}: {str(e)}")
-        
-        # Process pivots
-        kecamatan_sheet_count = process_and_upload_pivots(
-            gc, combined_df, pupuk_columns, KECAMATAN_SHEET_URL, 'kecamatan', latest_datetime
-        )
-
-        kios_sheet_count = process_and_upload_pivots(
-            gc, combined_df, pupuk_columns, KIOS_SHEET_URL, 'kios', latest_datetime
-        )
+        # Process pivots: spreadsheet kecamatan dan kios ditulis paralel
+        publish_results = publish_parallel([
+            ('kecamatan', process_and_upload_pivots,
+             gc, combined_df, pupuk_columns, KECAMATAN_SHEET_URL, 'kecamatan', latest_datetime),
+            ('kios', process_and_upload_pivots,
+             gc, combined_df, pupuk_columns, KIOS_SHEET_URL, 'kios', latest_datetime)
+        ])
+        kecamatan_sheet_count = publish_results['kecamatan']
+        kios_sheet_count = publish_results['kios']
+        print_rate_limit_report()
 
         # Prepare success message
         success_message = f"""
@@ -799,6 +707,7 @@ REKAP DATA BERDASARKAN KLASTER STATUS BERHASIL ✓
 • Status unik: {len(unique_statuses)}
 • Sheet Kecamatan: {kecamatan_sheet_count} klaster
 • Sheet Kios: {kios_sheet_count} klaster
+• Waktu tunggu quota Google API: {get_throttled_seconds():.1f} detik
 
 📋 DISTRIBUSI STATUS:
 """
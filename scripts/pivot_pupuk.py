@@ -1,7 +1,6 @@
 import os
 import pandas as pd
 import gspread
-import re
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -9,8 +8,13 @@ from google.oauth2.service_account import Credentials
 from datetime import datetime
 import traceback
 import json
-import time
-from googleapiclient.errors import HttpError
+from drive_download import download_folder_files
+from excel_snapshot import read_excel_snapshot
+from status_classifier import classify_status
+from nik_cleaner import clean_nik_series, print_nik_report
+from sheet_publisher import publish_sheets
+from parallel_publish import publish_parallel
+from rate_limiter import rate_limited_call, print_rate_limit_report, get_throttled_seconds, RATE_LIMITS_PER_MINUTE
 
 # ============================
 # KONFIGURASI QUOTA OPTIMIZATION
@@ -21,9 +25,6 @@ MONTHLY_SHEET_URL = "https://docs.google.com/spreadsheets/d/1SgVxOjmht5fmYson6Wc
 
 # OPTIMIZED RATE LIMITING
 MAX_RETRIES = 5
-INITIAL_RETRY_DELAY = 30
-WRITE_DELAY = 5
-BATCH_DELAY = 10
 
 EMAIL_CONFIG = {
     "smtp_server": os.getenv("SMTP_SERVER", "smtp.gmail.com"),
@@ -211,23 +212,16 @@ def extract_month_name(filename):
     return name_without_ext
 
 def create_ordered_monthly_sheets(gc, monthly_pivots, monthly_pivots_acc_pusat):
-    """Buat sheet bulanan dengan urutan yang ditentukan"""
+    """
+    Buat sheet bulanan dengan urutan yang ditentukan.
+    Sheet lama dipakai ulang (resize + isi ulang), hanya sheet yang tidak lagi
+    dibutuhkan yang dihapus, dan urutan tab diatur dalam batchUpdate yang sama.
+    """
     print("\n📊 Membuat sheet bulanan dengan urutan terstruktur...")
     
     # Buka spreadsheet bulanan
     monthly_sheet = safe_google_api_operation(gc.open_by_url, MONTHLY_SHEET_URL)
     
-    # Hapus semua sheet kecuali default pertama
-    existing_sheets = safe_google_api_operation(monthly_sheet.worksheets)
-    if len(existing_sheets) > 1:
-        for sheet in existing_sheets[1:]:
-            try:
-                safe_google_api_operation(monthly_sheet.del_worksheet, sheet)
-                print(f"   🗑️  Menghapus sheet: {sheet.title}")
-                time.sleep(WRITE_DELAY)
-            except Exception as e:
-                print(f"   ⚠️  Gagal menghapus {sheet.title}: {str(e)}")
-    
     # Standardisasi nama bulan untuk kedua dataset
     standardized_acc_pusat = {}
     standardized_all = {}
@@ -249,126 +243,44 @@ def create_ordered_monthly_sheets(gc, monthly_pivots, monthly_pivots_acc_pusat):
     print(f"   📅 Data Disetujui Pusat: {list(sorted_acc_pusat.keys())}")
     print(f"   📅 Data All: {list(sorted_all.keys())}")
     
-    # Buat sheet untuk Disetujui Pusat terlebih dahulu (akan muncul di kiri)
-    sheet_count = 0
-    
-    print("\n   🟢 MEMBUAT SHEET DISETUJUI PUSAT:")
-    for bulan in BULAN_URUTAN:
-        if bulan in sorted_acc_pusat:
-            sheet_name = f"{bulan}_acc_pusat"
-            try:
-                worksheet = safe_google_api_operation(
-                    monthly_sheet.add_worksheet, 
-                    title=sheet_name, 
-                    rows="1000", 
-                    cols="20"
-                )
-                
-                data = sorted_acc_pusat[bulan]
-                safe_google_api_operation(worksheet.clear)
-                time.sleep(WRITE_DELAY)
-                
-                safe_google_api_operation(
-                    worksheet.update,
-                    [data.columns.values.tolist()] + data.values.tolist()
-                )
-                
-                print(f"      ✅ {sheet_name} ({len(data)} baris)")
-                sheet_count += 1
-                time.sleep(WRITE_DELAY)
-                
-            except Exception as e:
-                print(f"      ❌ Gagal membuat {sheet_name}: {str(e)}")
-    
-    # Buat sheet untuk All setelah Disetujui Pusat (akan muncul di kanan)
-    print("\n   🔵 MEMBUAT SHEET ALL:")
-    for bulan in BULAN_URUTAN:
-        if bulan in sorted_all:
-            sheet_name = f"{bulan}_all"
-            try:
-                worksheet = safe_google_api_operation(
-                    monthly_sheet.add_worksheet, 
-                    title=sheet_name, 
-                    rows="1000", 
-                    cols="20"
-                )
-                
-                data = sorted_all[bulan]
-                safe_google_api_operation(worksheet.clear)
-                time.sleep(WRITE_DELAY)
-                
-                safe_google_api_operation(
-                    worksheet.update,
-                    [data.columns.values.tolist()] + data.values.tolist()
-                )
-                
-                print(f"      ✅ {sheet_name} ({len(data)} baris)")
-                sheet_count += 1
-                time.sleep(WRITE_DELAY)
-                
-            except Exception as e:
-                print(f"      ❌ Gagal membuat {sheet_name}: {str(e)}")
+    # Urutan sheet: Disetujui Pusat (kiri), All (kanan), lalu bulan non-standard
+    monthly_updates = []
+    monthly_updates.extend(
+        (f"{bulan}_acc_pusat", sorted_acc_pusat[bulan]) for bulan in BULAN_URUTAN if bulan in sorted_acc_pusat
+    )
+    monthly_updates.extend(
+        (f"{bulan}_all", sorted_all[bulan]) for bulan in BULAN_URUTAN if bulan in sorted_all
+    )
     
     # Handle bulan-bulan yang tidak standar (jika ada)
     non_standard_months = set(list(sorted_acc_pusat.keys()) + list(sorted_all.keys())) - set(BULAN_URUTAN)
+    for bulan in sorted(non_standard_months):
+        if bulan in sorted_acc_pusat:
+            monthly_updates.append((f"{bulan}_acc_pusat", sorted_acc_pusat[bulan]))
+        if bulan in sorted_all:
+            monthly_updates.append((f"{bulan}_all", sorted_all[bulan]))
     
     if non_standard_months:
-        print(f"\n   🟡 MEMBUAT SHEET BULAN NON-STANDARD:")
-        for bulan in sorted(non_standard_months):
-            # Untuk Disetujui Pusat non-standard
-            if bulan in sorted_acc_pusat:
-                sheet_name = f"{bulan}_acc_pusat"
-                try:
-                    worksheet = safe_google_api_operation(
-                        monthly_sheet.add_worksheet, 
-                        title=sheet_name, 
-                        rows="1000", 
-                        cols="20"
-                    )
-                    
-                    data = sorted_acc_pusat[bulan]
-                    safe_google_api_operation(worksheet.clear)
-                    time.sleep(WRITE_DELAY)
-                    
-                    safe_google_api_operation(
-                        worksheet.update,
-                        [data.columns.values.tolist()] + data.values.tolist()
-                    )
-                    
-                    print(f"      ✅ {sheet_name} ({len(data)} baris)")
-                    sheet_count += 1
-                    time.sleep(WRITE_DELAY)
-                    
-                except Exception as e:
-                    print(f"      ❌ Gagal membuat {sheet_name}: {str(e)}")
-            
-            # Untuk All non-standard
-            if bulan in sorted_all:
-                sheet_name = f"{bulan}_all"
-                try:
-                    worksheet = safe_google_api_operation(
-                        monthly_sheet.add_worksheet, 
-                        title=sheet_name, 
-                        rows="1000", 
-                        cols="20"
-                    )
-                    
-                    data = sorted_all[bulan]
-                    safe_google_api_operation(worksheet.clear)
-                    time.sleep(WRITE_DELAY)
-                    
-                    safe_google_api_operation(
-                        worksheet.update,
-                        [data.columns.values.tolist()] + data.values.tolist()
-                    )
-                    
-                    print(f"      ✅ {sheet_name} ({len(data)} baris)")
-                    sheet_count += 1
-                    time.sleep(WRITE_DELAY)
-                    
-                except Exception as e:
-                    print(f"      ❌ Gagal membuat {sheet_name}: {str(e)}")
+        print(f"   🟡 Bulan non-standard: {sorted(non_standard_months)}")
+    
+    # Sheet default pertama dipertahankan, sheet bulanan lain direkonsiliasi
+    try:
+        published = publish_sheets(
+            monthly_sheet,
+            monthly_updates,
+            api_call=safe_google_api_operation,
+            reconcile=True,
+            keep_first_sheet=True
+        )
+    except Exception as e:
+        print(f"   ❌ Gagal membuat sheet bulanan: {str(e)}")
+        return 0
+    
+    for sheet_name, row_count, created in published:
+        status = "sheet baru" if created else "sheet existing"
+        print(f"      ✅ {sheet_name} ({row_count} baris, {status})")
     
+    sheet_count = len(published)
     print(f"\n📊 Total sheet bulanan dibuat: {sheet_count}")
     
     return sheet_count
@@ -376,59 +288,9 @@ def create_ordered_monthly_sheets(gc, monthly_pivots, monthly_pivots_acc_pusat):
 # ============================
 # FUNGSI UTAMA YANG DIOPTIMASI
 # ============================
-def clean_nik(nik_value):
-    if pd.isna(nik_value) or nik_value is None:
-        return None
-    nik_str = str(nik_value)
-    cleaned_nik = re.sub(r'\D', '', nik_str)
-    if len(cleaned_nik) != 16:
-        print(f"⚠️  NIK tidak standar: {nik_value} -> {cleaned_nik} (panjang: {len(cleaned_nik)})")
-    return cleaned_nik if cleaned_nik else None
-
-def exponential_backoff(attempt):
-    base_delay = INITIAL_RETRY_DELAY * (2 ** (attempt - 1))
-    jitter = base_delay * 0.1
-    return base_delay + jitter
-
 def safe_google_api_operation(operation, *args, **kwargs):
-    last_exception = None
-    
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            result = operation(*args, **kwargs)
-            if attempt > 1:
-                print(f"   ✅ Berhasil pada percobaan ke-{attempt}")
-            return result
-            
-        except HttpError as e:
-            last_exception = e
-            if e.resp.status == 429:
-                if attempt < MAX_RETRIES:
-                    wait_time = exponential_backoff(attempt)
-                    print(f"⏳ Quota exceeded, menunggu {wait_time:.1f} detik... (Percobaan {attempt}/{MAX_RETRIES})")
-                    time.sleep(wait_time)
-                else:
-                    print(f"❌ Gagal setelah {MAX_RETRIES} percobaan")
-                    raise e
-            elif e.resp.status in [500, 502, 503, 504]:
-                if attempt < MAX_RETRIES:
-                    wait_time = exponential_backoff(attempt)
-                    print(f"⏳ Server error {e.resp.status}, menunggu {wait_time:.1f} detik... (Percobaan {attempt}/{MAX_RETRIES})")
-                    time.sleep(wait_time)
-                else:
-                    raise e
-            else:
-                raise e
-        except Exception as e:
-            last_exception = e
-            if attempt < MAX_RETRIES:
-                wait_time = exponential_backoff(attempt)
-                print(f"⏳ Error {type(e).__name__}, menunggu {wait_time:.1f} detik... (Percobaan {attempt}/{MAX_RETRIES})")
-                time.sleep(wait_time)
-            else:
-                raise e
-    
-    raise last_exception
+    """Panggilan Google API lewat rate limiter bersama (retry 429/5xx, mengikuti Retry-After)"""
+    return rate_limited_call(operation, *args, max_retries=MAX_RETRIES, **kwargs)
 
 def add_total_row(df, pupuk_columns):
     """
@@ -512,85 +374,39 @@ def create_pivot_tables(combined_df, monthly_data, pupuk_columns):
     return pivot_kecamatan, pivot_kios, monthly_pivots
 
 def batch_update_worksheets(spreadsheet, updates):
+    """
+    Tulis semua sheet sekaligus: satu batchUpdate (buat/resize/clear sheet)
+    + satu values.batchUpdate (isi data) untuk seluruh updates
+    """
     print(f"🔄 Memproses batch update untuk {len(updates)} worksheet...")
     
-    for i, (sheet_name, data) in enumerate(updates):
-        try:
-            print(f"   📝 Processing {i+1}/{len(updates)}: {sheet_name}")
-            
-            try:
-                worksheet = spreadsheet.worksheet(sheet_name)
-                print(f"      📝 Menggunakan sheet existing")
-            except gspread.exceptions.WorksheetNotFound:
-                worksheet = safe_google_api_operation(
-                    spreadsheet.add_worksheet, 
-                    title=sheet_name, 
-                    rows="1000", 
-                    cols="20"
-                )
-                print(f"      ✅ Membuat sheet baru")
-                time.sleep(WRITE_DELAY)
-            
-            safe_google_api_operation(worksheet.clear)
-            time.sleep(WRITE_DELAY)
-            
-            safe_google_api_operation(
-                worksheet.update,
-                [data.columns.values.tolist()] + data.values.tolist()
-            )
-            
-            print(f"      ✅ Berhasil update data ({len(data)} baris)")
-            
-            if i < len(updates) - 1:
-                time.sleep(WRITE_DELAY)
-                
-        except Exception as e:
-            print(f"      ❌ Gagal update {sheet_name}: {str(e)}")
-            continue
+    try:
+        published = publish_sheets(spreadsheet, updates, api_call=safe_google_api_operation)
+    except Exception as e:
+        print(f"   ❌ Gagal batch update: {str(e)}")
+        return 0
+    
+    for sheet_name, row_count, created in published:
+        status = "sheet baru" if created else "sheet existing"
+        print(f"   ✅ {sheet_name}: {row_count} baris ({status})")
     
     print(f"✅ Batch update selesai")
+    return len(published)
+
+def publish_main_sheets(gc, main_updates):
+    """Buka spreadsheet utama dan tulis semua sheet pivot utama"""
+    main_sheet = safe_google_api_operation(gc.open_by_url, MAIN_SHEET_URL)
+    return batch_update_worksheets(main_sheet, main_updates)
 
 def download_excel_files_from_drive(credentials, folder_id, save_folder="data_excel"):
     """
     Download file Excel dari Google Drive (untuk GitHub Actions)
     """
-    from googleapiclient.discovery import build
-    from googleapiclient.http import MediaIoBaseDownload
-    import io
-
-    os.makedirs(save_folder, exist_ok=True)
-    drive_service = build('drive', 'v3', credentials=credentials)
-
-    # Query untuk mencari file Excel
-    query = f"'{folder_id}' in parents and (mimeType='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet' or mimeType='application/vnd.ms-excel')"
-    results = drive_service.files().list(q=query, fields="files(id, name)").execute()
-    files = results.get("files", [])
+    paths = download_folder_files(credentials, folder_id, save_folder)
 
-    if not files:
+    if not paths:
         raise ValueError("❌ Tidak ada file Excel di folder Google Drive.")
 
-    paths = []
-    for file in files:
-        print(f"📥 Downloading: {file['name']}")
-        request = drive_service.files().get_media(fileId=file["id"])
-        
-        # Gunakan nama file yang aman
-        safe_filename = "".join(c for c in file['name'] if c.isalnum() or c in (' ', '-', '_', '.')).rstrip()
-        file_path = os.path.join(save_folder, safe_filename)
-
-        with io.FileIO(file_path, 'wb') as fh:
-            downloader = MediaIoBaseDownload(fh, request)
-            done = False
-            while not done:
-                status, done = downloader.next_chunk()
-
-        paths.append({
-            'path': file_path,
-            'name': file['name'],
-            'id': file['id']
-        })
-
-    print(f"✅ Berhasil download {len(paths)} file Excel")
     return paths
 
 def is_dataframe_valid(df):
@@ -601,7 +417,7 @@ def process_verval_pupuk_data_optimized():
     print("🚀 Memulai proses rekap data dengan optimasi quota...")
     print(f"⏰ Konfigurasi:")
     print(f"   - Max retries: {MAX_RETRIES}")
-    print(f"   - Write delay: {WRITE_DELAY} detik")
+    print(f"   - Quota tulis Sheets: {RATE_LIMITS_PER_MINUTE['sheets_write']} request/menit")
     print(f"   - Urutan bulan: {BULAN_URUTAN}")
     print(f"🔍 Kriteria Disetujui Pusat: mengandung 'disetujui' DAN 'pusat' TANPA 'menunggu'")
     print(f"🏪 Struktur baru: KODE KIOS sebelum NAMA KIOS")
@@ -648,7 +464,7 @@ def process_verval_pupuk_data_optimized():
             print(f"\n📖 Memproses file: {file_name} -> Bulan: {bulan}")
 
             try:
-                df = pd.read_excel(file_path, sheet_name='Worksheet')
+                df = read_excel_snapshot(file_path, sheet_name='Worksheet')
 
                 missing_columns = [col for col in expected_columns if col not in df.columns]
                 if missing_columns:
@@ -661,11 +477,13 @@ def process_verval_pupuk_data_optimized():
                 # Clean NIK
                 original_nik_count = len(df)
                 df['NIK_ORIGINAL'] = df['NIK']
-                df['NIK'] = df['NIK'].apply(clean_nik)
+                df['NIK'], nik_report = clean_nik_series(df['NIK'])
+                print_nik_report(nik_report)
 
                 cleaned_niks = df[df['NIK_ORIGINAL'] != df['NIK']][['NIK_ORIGINAL', 'NIK']]
-                for _, row in cleaned_niks.iterrows():
-                    nik_cleaning_log.append(f"'{row['NIK_ORIGINAL']}' -> {row['NIK']}")
+                nik_cleaning_log.extend(
+                    f"'{original}' -> {nik}" for original, nik in zip(cleaned_niks['NIK_ORIGINAL'], cleaned_niks['NIK'])
+                )
 
                 df = df[df['NIK'].notna()]
                 cleaned_nik_count = len(df)
@@ -678,7 +496,7 @@ def process_verval_pupuk_data_optimized():
                 all_data.append(df)
 
                 # Filter data Disetujui Pusat dengan kriteria baru
-                df_acc_pusat = df[df['STATUS'].apply(is_status_disetujui_pusat)]
+                df_acc_pusat = df[classify_status(df['STATUS'], is_status_disetujui_pusat)]
                 
                 if len(df_acc_pusat) > 0:
                     all_data_acc_pusat.append(df_acc_pusat)
@@ -739,9 +557,6 @@ def process_verval_pupuk_data_optimized():
         # Export ke Google Sheets
         print("\n📤 MENGGUNAKAN STRATEGI EXPORT OPTIMIZED...")
 
-        # Buka spreadsheet
-        main_sheet = safe_google_api_operation(gc.open_by_url, MAIN_SHEET_URL)
-
         # Update Main Sheets dengan BATCH
         main_updates = []
         if len(combined_df) > 0:
@@ -752,12 +567,14 @@ def process_verval_pupuk_data_optimized():
             main_updates.append(("Kecamatan_acc_pusat", pivot_kecamatan_acc_pusat))
             main_updates.append(("Kios_acc_pusat", pivot_kios_acc_pusat))
 
+        # Spreadsheet utama dan bulanan adalah file terpisah: ditulis paralel
+        publish_tasks = [("Bulanan", create_ordered_monthly_sheets, gc, monthly_pivots, monthly_pivots_acc_pusat)]
         if main_updates:
-            batch_update_worksheets(main_sheet, main_updates)
-            time.sleep(BATCH_DELAY)
+            publish_tasks.insert(0, ("Utama", publish_main_sheets, gc, main_updates))
 
-        # Buat sheet bulanan dengan urutan yang ditentukan
-        monthly_sheet_count = create_ordered_monthly_sheets(gc, monthly_pivots, monthly_pivots_acc_pusat)
+        publish_results = publish_parallel(publish_tasks)
+        monthly_sheet_count = publish_results["Bulanan"]
+        print_rate_limit_report()
 
         acc_pusat_count = len(combined_df_acc_pusat) if is_dataframe_valid(combined_df_acc_pusat) else 0
         
@@ -791,6 +608,7 @@ REKAP DATA BERHASIL DENGAN PENAMBAHAN KODE KIOS ✓
 - Total data: {len(combined_df):,} baris
 - Data Disetujui Pusat: {acc_pusat_count:,} baris
 - Sheet dibuat: {len(main_updates)} utama + {monthly_sheet_count} bulanan
+- Waktu tunggu quota Google API: {get_throttled_seconds():.1f} detik
 
 🏪 STRUKTUR KOLOM BARU:
 - Pivot Kios: KECAMATAN → KODE KIOS → NAMA KIOS → Jenis Pupuk
@@ -93,22 +93,30 @@ def list_files_in_folder(folder_id):
 # FUNGSI BANTUAN UNTUK PARSING TANGGAL
 # ----------------------------------------------------
 
+# Format tanggal yang dicoba berurutan (format pertama yang cocok dipakai)
+DATE_FORMATS = [
+    '%d-%m-%Y',  # 3-1-2026
+    '%d/%m/%Y',  # 3/1/2026
+    '%Y-%m-%d',  # 2026-01-03
+    '%Y/%m/%d',  # 2026/01/03
+    '%d %b %Y',  # 3 Jan 2026
+    '%d %B %Y',  # 3 Januari 2026
+]
+
+BULAN_MAP = {
+    1: "Januari", 2: "Februari", 3: "Maret",
+    4: "April", 5: "Mei", 6: "Juni",
+    7: "Juli", 8: "Agustus", 9: "September",
+    10: "Oktober", 11: "November", 12: "Desember"
+}
+
 def parse_date_safe(date_str):
     """Parse tanggal dengan format yang lebih fleksibel"""
     if pd.isna(date_str):
         return None
     
     # Coba berbagai format
-    date_formats = [
-        '%d-%m-%Y',  # 3-1-2026
-        '%d/%m/%Y',  # 3/1/2026
-        '%Y-%m-%d',  # 2026-01-03
-        '%Y/%m/%d',  # 2026/01/03
-        '%d %b %Y',  # 3 Jan 2026
-        '%d %B %Y',  # 3 Januari 2026
-    ]
-    
-    for fmt in date_formats:
+    for fmt in DATE_FORMATS:
         try:
             return datetime.strptime(str(date_str).strip(), fmt)
         except ValueError:
@@ -120,18 +128,39 @@ def parse_date_safe(date_str):
     except:
         return None
 
+def parse_date_column(values):
+    """
+    Parse satu kolom tanggal sekaligus (hasil sama dengan parse_date_safe per sel):
+    setiap format dicoba ke seluruh kolom, nilai yang belum berhasil diparse
+    dicoba dengan format berikutnya, sisanya diparse pandas per nilai (format='mixed').
+    """
+    text = values.astype(object).where(values.isna(), values.astype(str))
+    stripped = text.str.strip()
+    result = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    remaining = values.notna()
+    
+    for fmt in DATE_FORMATS:
+        if not remaining.any():
+            break
+        parsed = pd.to_datetime(stripped[remaining], format=fmt, errors='coerce')
+        parsed = parsed[parsed.notna()]
+        result[parsed.index] = parsed
+        remaining[parsed.index] = False
+    
+    # Jika tidak ada format yang cocok, coba parsing dengan pandas
+    if remaining.any():
+        try:
+            result[remaining] = pd.to_datetime(text[remaining], errors='coerce', format='mixed')
+        except Exception:
+            result[remaining] = pd.to_datetime(text[remaining].apply(parse_date_safe), errors='coerce')
+    
+    return result
+
 def extract_month_from_date(date_value):
     """Ekstrak bulan dari tanggal dengan handling error"""
     if pd.isna(date_value):
         return None
     
-    bulan_map = {
-        1: "Januari", 2: "Februari", 3: "Maret",
-        4: "April", 5: "Mei", 6: "Juni",
-        7: "Juli", 8: "Agustus", 9: "September",
-        10: "Oktober", 11: "November", 12: "Desember"
-    }
-    
     try:
         if isinstance(date_value, datetime):
             month_num = date_value.month
@@ -143,10 +172,14 @@ def extract_month_from_date(date_value):
             else:
                 return None
         
-        return bulan_map.get(month_num, None)
+        return BULAN_MAP.get(month_num, None)
     except:
         return None
 
+def extract_month_column(dates):
+    """Nama bulan untuk satu kolom datetime (None untuk tanggal kosong)"""
+    return dates.dt.month.map(BULAN_MAP)
+
 # ----------------------------------------------------
 # PROSES EXCEL → RETURN DATAFRAME & BULAN (MODIFIKASI)
 # ----------------------------------------------------
@@ -187,15 +220,11 @@ def process_excel(file_id, file_name):
     df.rename(columns={tgl_input_col: "TGL INPUT", tgl_tebus_col: "TGL TEBUS"}, inplace=True)
     
     # Konversi tanggal dengan cara yang lebih aman
-    df["TGL INPUT"] = df["TGL INPUT"].apply(parse_date_safe)
-    df["TGL TEBUS"] = df["TGL TEBUS"].apply(parse_date_safe)
+    df["TGL INPUT"] = parse_date_column(df["TGL INPUT"])
+    df["TGL TEBUS"] = parse_date_column(df["TGL TEBUS"])
 
     # Cari bulan untuk TGL TEBUS
-    bulan_tebus_list = []
-    for date_val in df["TGL TEBUS"]:
-        bulan = extract_month_from_date(date_val)
-        if bulan:
-            bulan_tebus_list.append(bulan)
+    bulan_tebus_list = extract_month_column(df["TGL TEBUS"]).dropna().tolist()
     
     if not bulan_tebus_list:
         add_log("⚠ Tidak ada bulan yang valid di TGL TEBUS", is_error=True)
@@ -0,0 +1,254 @@
+"""
+rate_limiter.py
+Pembatas laju (token bucket) bersama untuk panggilan Google Sheets/Drive API.
+Setiap jenis quota (baca Sheets, tulis Sheets, Drive) punya bucket sendiri
+yang terisi sesuai quota per menit. Panggilan API hanya menunggu jika
+bucket kosong, sehingga tidak ada lagi jeda tetap (WRITE_DELAY/BATCH_DELAY)
+di antara panggilan.
+
+Bucket bersifat adaptif: saat Google mengembalikan 429 laju bucket
+diturunkan setengahnya dan semua panggilan berikutnya ditahan selama
+Retry-After (atau backoff eksponensial jika header tidak ada), lalu laju
+naik kembali sedikit demi sedikit setiap panggilan berhasil. Total waktu
+tunggu dicatat dan dicetak lewat print_rate_limit_report.
+
+Aman dipakai dari beberapa thread sekaligus.
+
+Lokasi: verval-pupuk2/scripts/rate_limiter.py
+"""
+
+import os
+import time
+import random
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# ============================
+# KONFIGURASI
+# ============================
+# Quota per menit per user (default quota Google Sheets API / Drive API)
+RATE_LIMITS_PER_MINUTE = {
+    'sheets_read': int(os.getenv("SHEETS_READ_PER_MINUTE", "60")),
+    'sheets_write': int(os.getenv("SHEETS_WRITE_PER_MINUTE", "60")),
+    'drive': int(os.getenv("DRIVE_REQUESTS_PER_MINUTE", "1000"))
+}
+
+# Jumlah panggilan yang boleh langsung dikirim tanpa menunggu
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "10"))
+
+API_MAX_RETRIES = 5
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "2"))
+RETRY_MAX_DELAY = 64
+
+# Laju minimal setelah 429 (fraksi quota) dan kenaikan laju per panggilan sukses
+MIN_RATE_FACTOR = 0.1
+RATE_RECOVERY_STEP = 0.05
+
+RETRYABLE_STATUS = {500, 502, 503, 504}
+
+# Nama method gspread/googleapiclient yang memakai quota baca
+READ_OPERATIONS = {
+    'open', 'open_by_key', 'open_by_url', 'fetch_sheet_metadata', 'worksheet',
+    'worksheets', 'get_worksheet', 'get', 'batch_get', 'get_all_values',
+    'get_all_records', 'get_values', 'row_values', 'col_values',
+    'values_get', 'values_batch_get'
+}
+
+_buckets = {}
+_lock = threading.Lock()
+
+
+# ============================
+# FUNGSI BANTU
+# ============================
+def get_bucket(bucket_name):
+    """State bucket (dibuat saat pertama dipakai), harus dipanggil di dalam _lock"""
+    state = _buckets.get(bucket_name)
+    if state is None:
+        base_rate = RATE_LIMITS_PER_MINUTE.get(bucket_name, RATE_LIMITS_PER_MINUTE['sheets_write']) / 60.0
+        state = {
+            'base_rate': base_rate,
+            'rate': base_rate,
+            'tokens': float(RATE_LIMIT_BURST),
+            'updated': time.monotonic(),
+            'blocked_until': 0.0,
+            'requests': 0,
+            'rate_limited': 0,
+            'throttled_seconds': 0.0,
+            'retry_seconds': 0.0
+        }
+        _buckets[bucket_name] = state
+    return state
+
+
+def operation_bucket(operation):
+    """
+    Tebak bucket quota dari nama method operasi (method gspread).
+    Request googleapiclient selalu bernama execute sehingga tidak bisa ditebak:
+    pemanggil harus memberi bucket secara eksplisit.
+    """
+    name = getattr(operation, '__name__', '')
+    return 'sheets_read' if name in READ_OPERATIONS else 'sheets_write'
+
+
+def error_status(error):
+    """Status HTTP dari HttpError (googleapiclient) atau APIError (gspread), None jika bukan error API"""
+    resp = getattr(error, 'resp', None)
+    if resp is not None and getattr(resp, 'status', None) is not None:
+        return int(resp.status)
+    response = getattr(error, 'response', None)
+    if response is not None and getattr(response, 'status_code', None) is not None:
+        return int(response.status_code)
+    return None
+
+
+def is_rate_limit_error(error, status):
+    """429, atau 403 rateLimitExceeded/userRateLimitExceeded milik Drive API"""
+    return status == 429 or (status == 403 and 'ratelimitexceeded' in str(error).lower())
+
+
+def retry_after_seconds(error):
+    """Nilai header Retry-After dalam detik, None jika tidak ada"""
+    headers = getattr(error, 'resp', None)
+    if headers is None:
+        headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers or not hasattr(headers, 'get'):
+        return None
+
+    value = headers.get('retry-after') or headers.get('Retry-After')
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(attempt):
+    """Backoff eksponensial terpotong dengan jitter (detik)"""
+    return min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** (attempt - 1))) + random.random()
+
+
+def mark_rate_limited(bucket_name, delay):
+    """Turunkan laju bucket dan tahan semua panggilan selama delay detik"""
+    with _lock:
+        state = get_bucket(bucket_name)
+        now = time.monotonic()
+        state['rate_limited'] += 1
+        state['rate'] = max(state['base_rate'] * MIN_RATE_FACTOR, state['rate'] / 2)
+        state['tokens'] = min(state['tokens'], 0.0)
+        state['blocked_until'] = max(state['blocked_until'], now + delay)
+
+
+def mark_success(bucket_name):
+    """Naikkan kembali laju bucket setelah panggilan berhasil"""
+    with _lock:
+        state = get_bucket(bucket_name)
+        state['rate'] = min(state['base_rate'], state['rate'] + state['base_rate'] * RATE_RECOVERY_STEP)
+
+
+def wait_retry(bucket_name, delay):
+    """Tunggu sebelum retry karena error server/koneksi (dicatat terpisah dari throttle)"""
+    with _lock:
+        get_bucket(bucket_name)['retry_seconds'] += delay
+    time.sleep(delay)
+
+
+# ============================
+# FUNGSI UTAMA
+# ============================
+def acquire(bucket_name='sheets_write'):
+    """
+    Ambil satu token dari bucket, menunggu hanya jika bucket kosong
+    atau bucket sedang ditahan karena 429. Mengembalikan lama menunggu (detik).
+    """
+    with _lock:
+        state = get_bucket(bucket_name)
+        now = time.monotonic()
+        state['tokens'] = min(float(RATE_LIMIT_BURST), state['tokens'] + (now - state['updated']) * state['rate'])
+        state['updated'] = now
+        state['requests'] += 1
+
+        # Token boleh minus: panggilan berikutnya antre di belakang yang sudah reservasi
+        state['tokens'] -= 1
+        wait = max(0.0, -state['tokens'] / state['rate'], state['blocked_until'] - now)
+        state['throttled_seconds'] += wait
+
+    if wait > 0:
+        time.sleep(wait)
+    return wait
+
+
+def rate_limited_call(operation, *args, bucket=None, max_retries=None, **kwargs):
+    """
+    Jalankan operation(*args, **kwargs) lewat rate limiter dengan retry:
+    - 429 / rateLimitExceeded: tunggu Retry-After (atau backoff), laju bucket diturunkan
+    - 5xx / error koneksi: backoff eksponensial
+    - error API lain (400, 403, 404, ...) dan error non-jaringan
+      (mis. WorksheetNotFound): langsung dilempar
+    """
+    bucket = bucket or operation_bucket(operation)
+    max_retries = max_retries or API_MAX_RETRIES
+
+    for attempt in range(1, max_retries + 1):
+        acquire(bucket)
+        try:
+            result = operation(*args, **kwargs)
+            mark_success(bucket)
+            if attempt > 1:
+                print(f"   ✅ Berhasil pada percobaan ke-{attempt}")
+            return result
+
+        except Exception as e:
+            status = error_status(e)
+            rate_limited = is_rate_limit_error(e, status)
+            if status is None and not isinstance(e, OSError):
+                raise
+            if status is not None and not rate_limited and status not in RETRYABLE_STATUS:
+                raise
+            if attempt >= max_retries:
+                print(f"❌ Gagal setelah {max_retries} percobaan")
+                raise
+
+            if rate_limited:
+                retry_after = retry_after_seconds(e)
+                wait_time = backoff_delay(attempt) if retry_after is None else retry_after
+                print(f"⏳ Quota exceeded, menahan {bucket} {wait_time:.1f} detik... (Percobaan {attempt}/{max_retries})")
+                mark_rate_limited(bucket, wait_time)
+            else:
+                wait_time = backoff_delay(attempt)
+                reason = f"Server error {status}" if status else f"Error {type(e).__name__}"
+                print(f"⏳ {reason}, menunggu {wait_time:.1f} detik... (Percobaan {attempt}/{max_retries})")
+                wait_retry(bucket, wait_time)
+
+
+def get_throttled_seconds():
+    """Total waktu menunggu rate limiter + retry semua bucket (detik)"""
+    with _lock:
+        return sum(state['throttled_seconds'] + state['retry_seconds'] for state in _buckets.values())
+
+
+def print_rate_limit_report():
+    """Cetak ringkasan pemakaian quota dan waktu tunggu per bucket"""
+    with _lock:
+        snapshot = {name: dict(state) for name, state in _buckets.items()}
+
+    if not snapshot:
+        return
+
+    print("\n⏱️  RINGKASAN RATE LIMIT GOOGLE API:")
+    for name, state in sorted(snapshot.items()):
+        print(f"   • {name}: {state['requests']} panggilan, "
+              f"throttle {state['throttled_seconds']:.1f} detik, "
+              f"retry {state['retry_seconds']:.1f} detik, "
+              f"{state['rate_limited']}x quota exceeded")
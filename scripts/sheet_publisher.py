@@ -0,0 +1,228 @@
+"""
+sheet_publisher.py
+Publikasi beberapa DataFrame ke beberapa sheet dalam satu spreadsheet sekaligus.
+Semua sheet tujuan dalam satu run dikumpulkan menjadi:
+1. satu spreadsheets.batchUpdate: buat sheet baru / resize sheet lama,
+   hapus isi lama, format header/kolom, freeze baris
+2. satu values.batchUpdate: tulis header + data semua sheet
+3. (opsional) satu spreadsheets.batchUpdate untuk auto resize lebar kolom
+   setelah data tertulis
+Metadata spreadsheet dibaca sekali di awal untuk mengetahui sheet yang sudah ada.
+Sheet baru diberi sheetId sendiri sehingga format bisa dikirim di batch yang sama.
+
+Mode rekonsiliasi (reconcile=True) memakai ulang sheet yang sudah ada,
+menghapus hanya sheet yang tidak lagi dibutuhkan, dan mengatur urutan
+sheet lewat updateSheetProperties, semuanya di batchUpdate yang sama.
+
+Lokasi: verval-pupuk2/scripts/sheet_publisher.py
+"""
+
+import random
+
+from gspread.utils import absolute_range_name
+
+# ============================
+# KONFIGURASI
+# ============================
+# Minimal baris grid (header + 1 baris) agar freeze baris header tetap valid
+MIN_GRID_ROWS = 2
+
+MAX_SHEET_ID = 2 ** 31 - 1
+
+
+# ============================
+# FUNGSI BANTU
+# ============================
+def sheet_values(data):
+    """Header + isi DataFrame sebagai list of list (nilai Python biasa)"""
+    return [data.columns.values.tolist()] + data.values.tolist()
+
+
+def grid_range(sheet_id, start_row=None, end_row=None, start_col=None, end_col=None):
+    """GridRange Sheets API (indeks 0, akhir eksklusif, None = tanpa batas)"""
+    bounds = {
+        'startRowIndex': start_row,
+        'endRowIndex': end_row,
+        'startColumnIndex': start_col,
+        'endColumnIndex': end_col
+    }
+    result = {'sheetId': sheet_id}
+    result.update({key: value for key, value in bounds.items() if value is not None})
+    return result
+
+
+def cell_format_request(cell_range, cell_format):
+    """Request repeatCell pengganti worksheet.format(range, cell_format)"""
+    return {
+        'repeatCell': {
+            'range': cell_range,
+            'cell': {'userEnteredFormat': cell_format},
+            'fields': f"userEnteredFormat({','.join(cell_format)})"
+        }
+    }
+
+
+def freeze_rows_request(sheet_id, rows=1):
+    """Request pengganti worksheet.freeze(rows=...)"""
+    return {
+        'updateSheetProperties': {
+            'properties': {'sheetId': sheet_id, 'gridProperties': {'frozenRowCount': rows}},
+            'fields': 'gridProperties.frozenRowCount'
+        }
+    }
+
+
+def auto_resize_request(sheet_id, column_count):
+    """Request pengganti worksheet.columns_auto_resize"""
+    return {
+        'autoResizeDimensions': {
+            'dimensions': {
+                'sheetId': sheet_id,
+                'dimension': 'COLUMNS',
+                'startIndex': 0,
+                'endIndex': column_count
+            }
+        }
+    }
+
+
+def new_sheet_id(used_ids):
+    """sheetId acak yang belum dipakai di spreadsheet"""
+    while True:
+        sheet_id = random.randint(1, MAX_SHEET_ID)
+        if sheet_id not in used_ids:
+            used_ids.add(sheet_id)
+            return sheet_id
+
+
+def sheet_index_request(sheet_id, index):
+    """Request pindah posisi sheet (tab) ke index"""
+    return {
+        'updateSheetProperties': {
+            'properties': {'sheetId': sheet_id, 'index': index},
+            'fields': 'index'
+        }
+    }
+
+
+def reconcile_requests(sheets, desired_titles, sheet_ids):
+    """
+    Request hapus sheet yang tidak ada di desired_titles + urutkan sisanya
+    sesuai desired_titles. sheets: properties sheet lama sesuai urutan tab.
+    Mengembalikan (requests, judul sheet yang dihapus).
+    """
+    wanted = set(desired_titles)
+    obsolete = [properties for properties in sheets if properties['title'] not in wanted]
+    requests = [{'deleteSheet': {'sheetId': properties['sheetId']}} for properties in obsolete]
+
+    # Dipindah dari kiri ke kanan: sheet target selalu berada di kanan posisinya
+    requests.extend(
+        sheet_index_request(sheet_ids[title], index)
+        for index, title in enumerate(desired_titles)
+    )
+    return requests, [properties['title'] for properties in obsolete]
+
+
+def call_api(api_call, operation, *args):
+    """Panggil operasi API langsung atau lewat wrapper retry script"""
+    if api_call is None:
+        return operation(*args)
+    return api_call(operation, *args)
+
+
+# ============================
+# FUNGSI UTAMA
+# ============================
+def publish_sheets(spreadsheet, updates, value_input_option='RAW', format_requests=None,
+                   auto_resize=False, api_call=None, reconcile=False, keep_sheets=(),
+                   keep_first_sheet=False):
+    """
+    Tulis semua (nama_sheet, DataFrame) di updates ke spreadsheet.
+    - format_requests(sheet_id, DataFrame) -> list request format tambahan per sheet
+    - auto_resize: lebar kolom disesuaikan dengan isi setelah data tertulis
+    - api_call: wrapper retry, dipanggil sebagai api_call(operation, *args)
+    - reconcile: hapus sheet selain keep_sheets (+ sheet pertama jika
+      keep_first_sheet) dan updates, lalu urutkan: sheet yang dipertahankan
+      di kiri (urutan lama), kemudian updates sesuai urutan list
+    Mengembalikan list (nama_sheet, jumlah_baris, dibuat_baru).
+    """
+    metadata = call_api(api_call, spreadsheet.fetch_sheet_metadata)
+    sheets = sorted((sheet['properties'] for sheet in metadata.get('sheets', [])),
+                    key=lambda properties: properties.get('index', 0))
+    existing = {properties['title']: properties for properties in sheets}
+    used_ids = {properties['sheetId'] for properties in existing.values()}
+    sheet_ids = {title: properties['sheetId'] for title, properties in existing.items()}
+
+    requests = []
+    value_ranges = []
+    resize_requests = []
+    published = []
+
+    for sheet_name, data in updates:
+        values = sheet_values(data)
+        grid_properties = {
+            'rowCount': max(len(values), MIN_GRID_ROWS),
+            'columnCount': max(len(data.columns), 1)
+        }
+
+        if sheet_name in existing:
+            sheet_id = existing[sheet_name]['sheetId']
+            requests.append({
+                'updateSheetProperties': {
+                    'properties': {'sheetId': sheet_id, 'gridProperties': grid_properties},
+                    'fields': 'gridProperties.rowCount,gridProperties.columnCount'
+                }
+            })
+            requests.append({
+                'updateCells': {
+                    'range': grid_range(sheet_id),
+                    'fields': 'userEnteredValue'
+                }
+            })
+        else:
+            sheet_id = new_sheet_id(used_ids)
+            sheet_ids[sheet_name] = sheet_id
+            requests.append({
+                'addSheet': {
+                    'properties': {
+                        'sheetId': sheet_id,
+                        'title': sheet_name,
+                        'gridProperties': grid_properties
+                    }
+                }
+            })
+
+        if format_requests:
+            requests.extend(format_requests(sheet_id, data))
+        if auto_resize:
+            resize_requests.append(auto_resize_request(sheet_id, len(data.columns)))
+
+        value_ranges.append({'range': absolute_range_name(sheet_name, 'A1'), 'values': values})
+        published.append((sheet_name, len(data), sheet_name not in existing))
+
+    if reconcile:
+        update_names = [sheet_name for sheet_name, _ in updates]
+        kept = [
+            properties['title'] for position, properties in enumerate(sheets)
+            if properties['title'] not in update_names
+            and (properties['title'] in keep_sheets or (keep_first_sheet and position == 0))
+        ]
+        order_requests, deleted = reconcile_requests(sheets, kept + update_names, sheet_ids)
+        # Sheet baru sudah ditambahkan lebih dulu sehingga spreadsheet tidak pernah kosong
+        requests.extend(order_requests)
+        for title in deleted:
+            print(f"   🗑️  Menghapus sheet yang tidak dipakai lagi: {title}")
+
+    if not published:
+        return published
+
+    call_api(api_call, spreadsheet.batch_update, {'requests': requests})
+    call_api(api_call, spreadsheet.values_batch_update, {
+        'valueInputOption': value_input_option,
+        'data': value_ranges
+    })
+
+    if resize_requests:
+        call_api(api_call, spreadsheet.batch_update, {'requests': resize_requests})
+
+    return published
@@ -4,10 +4,14 @@ import numpy as np
 import gspread
 import re
 import json
-import io
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
+from drive_download import download_folder_files
+from excel_snapshot import read_excel_snapshot, read_excel_sheet
+from excel_stream import open_excel_batches
+from nik_cleaner import clean_nik_series, print_nik_report
+from rate_limiter import rate_limited_call, print_rate_limit_report
+from incremental_sheet import write_sheet_incremental
 from datetime import datetime
 import traceback
 import smtplib
@@ -23,6 +27,9 @@ ERDKK_FOLDER_ID = "1BBgVsgq7EMGs0TLaO_4GEtUppznm1v5J"
 REALISASI_FOLDER_ID = "1-7LZB_kvL8zAAsG8w5yIQmdNRoIahz8m"
 OUTPUT_SHEET_URL = "https://docs.google.com/spreadsheets/d/1GRo7BP1a2MdEjZEnUVVDQBqp7KuLOViRlxMOkL0ERJE/edit"
 
+# Kandidat sheet ERDKK (dicocokkan tanpa membedakan huruf besar/kecil)
+ERDKK_SHEET_CANDIDATES = ["Sheet1", "Worksheet"]
+
 # ============================
 # EMAIL CONFIG (DARI SECRETS)
 # ============================
@@ -41,19 +48,6 @@ EMAIL_CONFIG = {
 # ============================
 # FUNGSI UTILITY - TIDAK BERUBAH
 # ============================
-def clean_nik(nik_value):
-    """Membersihkan NIK dari karakter non-angka"""
-    if pd.isna(nik_value) or nik_value is None:
-        return None
-
-    nik_str = str(nik_value)
-    cleaned_nik = re.sub(r'\D', '', nik_str)
-
-    if len(cleaned_nik) != 16:
-        print(f"⚠️  NIK tidak standar: {nik_value} -> {cleaned_nik} (panjang: {len(cleaned_nik)})")
-
-    return cleaned_nik if cleaned_nik else None
-
 def clean_kode_kios(kode_value):
     """Membersihkan kode kios dengan konsisten"""
     if pd.isna(kode_value) or kode_value is None:
@@ -75,6 +69,13 @@ def clean_kode_kios(kode_value):
     
     return kode_cleaned
 
+def clean_kode_kios_series(kode_series):
+    """Versi vektor clean_kode_kios untuk satu kolom"""
+    kode = kode_series.astype(object).where(kode_series.isna(), kode_series.astype(str))
+    kode = kode.str.split().str.join(' ')
+    kode = kode.str.replace(r'[^\w\s-]', '', regex=True).str.upper().str.strip()
+    return kode.fillna('')
+
 def send_email_notification(subject, message, is_success=True):
     """Mengirim notifikasi email (menggunakan secrets/env)"""
     try:
@@ -152,38 +153,18 @@ def send_email_notification(subject, message, is_success=True):
 # FUNGSI DOWNLOAD FILE - TIDAK BERUBAH
 # ============================
 def download_excel_files(credentials, folder_id, folder_name):
-    """Download file Excel dari Google Drive ke temporary folder"""
+    """Download file Excel dari Google Drive ke temporary folder (paralel)"""
     temp_dir = tempfile.gettempdir()
     save_folder = os.path.join(temp_dir, f"data_{folder_name}_{int(time.time())}")
-    os.makedirs(save_folder, exist_ok=True)
-
-    drive_service = build('drive', 'v3', credentials=credentials)
 
-    query = f"'{folder_id}' in parents and (mimeType='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet' or mimeType='application/vnd.ms-excel')"
-    results = drive_service.files().list(q=query, fields="files(id, name)").execute()
-    files = results.get("files", [])
+    file_paths = download_folder_files(credentials, folder_id, save_folder, label=folder_name)
 
-    if not files:
+    if not file_paths:
         print(f"⚠️  Tidak ada file Excel di folder {folder_name}")
         return []
 
-    file_paths = []
-    for file in files:
-        print(f"📥 Downloading {folder_name}: {file['name']}")
-        request = drive_service.files().get_media(fileId=file["id"])
-        file_path = os.path.join(save_folder, file["name"])
-
-        with io.FileIO(file_path, 'wb') as fh:
-            downloader = MediaIoBaseDownload(fh, request)
-            done = False
-            while not done:
-                _, done = downloader.next_chunk()
-
-        file_paths.append({
-            'path': file_path,
-            'name': file['name'],
-            'temp_folder': save_folder
-        })
+    for file_info in file_paths:
+        file_info['temp_folder'] = save_folder
 
     print(f"✅ Berhasil download {len(file_paths)} file dari {folder_name} ke {save_folder}")
     return file_paths
@@ -191,143 +172,106 @@ def download_excel_files(credentials, folder_id, folder_name):
 # ============================
 # FUNGSI PROSES DATA ERDKK - DIPERBAIKI (SHEET1)
 # ============================
-def process_single_erdkk_row(row, file_name=""):
-    """Proses satu baris data ERDKK dengan validasi lebih ketat"""
-    result = {
-        'NIK': None,
-        'NAMA_PETANI': '',
-        'KODE_KIOS': '',
-        'NAMA_KIOS': '',
-        'TOTAL_UREA': 0,
-        'TOTAL_NPK': 0,
-        'TOTAL_SP36': 0,
-        'TOTAL_ZA': 0,
-        'TOTAL_NPK_FORMULA': 0,
-        'TOTAL_ORGANIK': 0,
-        'TOTAL_ORGANIK_CAIR': 0,
-        'FILE_SOURCE': file_name
-    }
-
-    try:
-        # Clean NIK
-        nik = clean_nik(row.get('KTP', ''))
-        if not nik:
-            return None
-
-        result['NIK'] = nik
-        result['NAMA_PETANI'] = str(row.get('Nama Petani', '')).strip()
-
-        # Ambil kode kios dari ERDKK
-        kode_kios_raw = row.get('Kode Kios Pengecer', '')
-        nama_kios_raw = row.get('Nama Kios Pengecer', '')
-
-        # Clean kode kios dengan fungsi khusus
-        result['KODE_KIOS'] = clean_kode_kios(kode_kios_raw)
-        result['NAMA_KIOS'] = str(nama_kios_raw).strip() if pd.notna(nama_kios_raw) else ''
-
-        # Hitung total pupuk per jenis (MT1 + MT2 + MT3)
-        for mt in ['MT1', 'MT2', 'MT3']:
-            # Urea
-            urea_col = f'Pupuk Urea (Kg) {mt}'
-            if urea_col in row:
-                value = pd.to_numeric(row[urea_col], errors='coerce')
-                if pd.notna(value):
-                    result['TOTAL_UREA'] += float(value)
-
-            # NPK
-            npk_col = f'Pupuk NPK (Kg) {mt}'
-            if npk_col in row:
-                value = pd.to_numeric(row[npk_col], errors='coerce')
-                if pd.notna(value):
-                    result['TOTAL_NPK'] += float(value)
-
-            # SP36
-            sp36_col = f'Pupuk SP36 (Kg) {mt}'
-            if sp36_col in row:
-                value = pd.to_numeric(row[sp36_col], errors='coerce')
-                if pd.notna(value):
-                    result['TOTAL_SP36'] += float(value)
-
-            # ZA
-            za_col = f'Pupuk ZA (Kg) {mt}'
-            if za_col in row:
-                value = pd.to_numeric(row[za_col], errors='coerce')
-                if pd.notna(value):
-                    result['TOTAL_ZA'] += float(value)
-
-            # NPK Formula
-            npk_formula_col = f'Pupuk NPK Formula (Kg) {mt}'
-            if npk_formula_col in row:
-                value = pd.to_numeric(row[npk_formula_col], errors='coerce')
-                if pd.notna(value):
-                    result['TOTAL_NPK_FORMULA'] += float(value)
-
-            # Organik
-            organik_col = f'Pupuk Organik (Kg) {mt}'
-            if organik_col in row:
-                value = pd.to_numeric(row[organik_col], errors='coerce')
-                if pd.notna(value):
-                    result['TOTAL_ORGANIK'] += float(value)
-
-            # Organik Cair (jika ada)
-            organik_cair_col = f'Pupuk Organik Cair (Kg) {mt}'
-            if organik_cair_col in row:
-                value = pd.to_numeric(row[organik_cair_col], errors='coerce')
-                if pd.notna(value):
-                    result['TOTAL_ORGANIK_CAIR'] += float(value)
-
-        # Cek apakah ada data pupuk yang valid
-        pupuk_total = (result['TOTAL_UREA'] + result['TOTAL_NPK'] + result['TOTAL_SP36'] + 
-                      result['TOTAL_ZA'] + result['TOTAL_NPK_FORMULA'] + 
-                      result['TOTAL_ORGANIK'] + result['TOTAL_ORGANIK_CAIR'])
-        
-        if pupuk_total <= 0:
-            return None  # Skip jika tidak ada pupuk
-
-        # Bulatkan nilai
-        for key in ['TOTAL_UREA', 'TOTAL_NPK', 'TOTAL_SP36', 'TOTAL_ZA', 
-                   'TOTAL_NPK_FORMULA', 'TOTAL_ORGANIK', 'TOTAL_ORGANIK_CAIR']:
-            result[key] = round(result[key], 2)
-
-        return result
+# Jenis pupuk ERDKK: kolom hasil -> nama pupuk di header 'Pupuk X (Kg) MTn'
+ERDKK_PUPUK_COLUMNS = {
+    'TOTAL_UREA': 'Urea',
+    'TOTAL_NPK': 'NPK',
+    'TOTAL_SP36': 'SP36',
+    'TOTAL_ZA': 'ZA',
+    'TOTAL_NPK_FORMULA': 'NPK Formula',
+    'TOTAL_ORGANIK': 'Organik',
+    'TOTAL_ORGANIK_CAIR': 'Organik Cair'
+}
+ERDKK_MUSIM_TANAM = ['MT1', 'MT2', 'MT3']
 
-    except Exception as e:
-        print(f"   ⚠️  Error processing row: {e}")
+def erdkk_column(df, col_name):
+    """Kolom df (kolom pertama jika nama ganda), None jika tidak ada"""
+    if col_name not in df.columns:
         return None
+    column = df[col_name]
+    return column.iloc[:, 0] if isinstance(column, pd.DataFrame) else column
+
+def process_erdkk_rows(df, file_name=""):
+    """Proses semua baris data ERDKK sekaligus dengan validasi yang sama seperti per baris"""
+    # Clean NIK, baris tanpa NIK di-skip
+    ktp_column = erdkk_column(df, 'KTP')
+    if ktp_column is None:
+        return pd.DataFrame()
+    
+    nik_series, nik_report = clean_nik_series(ktp_column)
+    print_nik_report(nik_report, file_name)
+    result = pd.DataFrame({'NIK': nik_series}, index=df.index)
+    
+    nama_column = erdkk_column(df, 'Nama Petani')
+    # Sama seperti str(nilai): sel kosong menjadi 'nan'
+    result['NAMA_PETANI'] = '' if nama_column is None else nama_column.fillna('nan').astype(str).str.strip()
+    
+    # Kode kios dan nama kios dari ERDKK
+    kode_column = erdkk_column(df, 'Kode Kios Pengecer')
+    result['KODE_KIOS'] = '' if kode_column is None else clean_kode_kios_series(kode_column)
+    nama_kios_column = erdkk_column(df, 'Nama Kios Pengecer')
+    result['NAMA_KIOS'] = ('' if nama_kios_column is None
+                           else nama_kios_column.astype(str).str.strip().where(nama_kios_column.notna(), ''))
+    
+    # Matriks float semua kolom 'Pupuk X (Kg) MTn' (kolom yang tidak ada bernilai 0)
+    matrix_columns = [f'Pupuk {pupuk} (Kg) {mt}'
+                      for pupuk in ERDKK_PUPUK_COLUMNS.values() for mt in ERDKK_MUSIM_TANAM]
+    values = np.zeros((len(df), len(matrix_columns)))
+    for i, col_name in enumerate(matrix_columns):
+        column = erdkk_column(df, col_name)
+        if column is not None:
+            values[:, i] = pd.to_numeric(column, errors='coerce').to_numpy(dtype=float)
+    values = np.nan_to_num(values, nan=0.0)
+    
+    # Total per jenis pupuk (MT1 + MT2 + MT3)
+    totals = values.reshape(len(df), len(ERDKK_PUPUK_COLUMNS), len(ERDKK_MUSIM_TANAM)).sum(axis=2)
+    pupuk_keys = list(ERDKK_PUPUK_COLUMNS)
+    for i, key in enumerate(pupuk_keys):
+        result[key] = totals[:, i]
+    
+    result['FILE_SOURCE'] = file_name
+    
+    # Skip baris tanpa NIK atau tanpa kuota pupuk
+    pupuk_total = result[pupuk_keys[0]].copy()
+    for key in pupuk_keys[1:]:
+        pupuk_total = pupuk_total + result[key]
+    result = result[result['NIK'].notna() & (pupuk_total > 0)].reset_index(drop=True)
+    
+    # Bulatkan nilai (round() Python, sama seperti sebelumnya)
+    for key in pupuk_keys:
+        result[key] = [round(value, 2) for value in result[key].tolist()]
+    
+    return result
+
+def select_erdkk_columns(columns):
+    """Kolom ERDKK yang dipakai (kata kunci sama dengan pencarian kolom di process_erdkk_file)"""
+    selected = []
+    for col in columns:
+        col_upper = str(col).strip().upper()
+        if ('KTP' in col_upper or 'NIK' in col_upper
+                or ('NAMA' in col_upper and ('PETANI' in col_upper or 'KIOS' in col_upper))
+                or ('KODE' in col_upper and 'KIOS' in col_upper)
+                or col_upper.startswith('PUPUK')):
+            selected.append(col)
+    return selected
 
 def process_erdkk_file(file_path, file_name):
     """Proses satu file ERDKK - SHEET DIPERBAIKI MENJADI Sheet1"""
     try:
         print(f"\n   📖 Memproses ERDKK: {file_name}")
 
-        # Coba beberapa opsi untuk membaca file ERDKK
-        sheet_options = ['Sheet1', 'SHEET1', 'sheet1', 'Worksheet', 'WORKSHEET', 'worksheet']
-        
-        df = None
-        used_sheet = None
-        
-        for sheet_name in sheet_options:
-            try:
-                print(f"   🔍 Mencoba sheet: '{sheet_name}'")
-                df = pd.read_excel(file_path, sheet_name=sheet_name, dtype=str)
-                used_sheet = sheet_name
-                print(f"   ✅ Berhasil membaca dengan sheet: '{sheet_name}'")
-                break
-            except Exception as e:
-                print(f"   ❌ Gagal membaca sheet '{sheet_name}': {e}")
-                continue
-        
-        # Jika masih gagal, coba baca sheet pertama
-        if df is None:
-            try:
-                print(f"   🔍 Mencoba sheet pertama (index 0)")
-                df = pd.read_excel(file_path, sheet_name=0, dtype=str)
-                used_sheet = "sheet pertama (index 0)"
-                print(f"   ✅ Berhasil membaca sheet pertama")
-            except Exception as e:
-                print(f"   ❌ Gagal membaca sheet pertama: {e}")
-                return []
+        # Pilih sheet dari metadata workbook (Sheet1/Worksheet, huruf besar/kecil bebas),
+        # jika tidak ada pakai sheet pertama. Workbook hanya dibuka sekali.
+        try:
+            df, used_sheet, sheet_names = read_excel_sheet(
+                file_path, sheet_candidates=ERDKK_SHEET_CANDIDATES,
+                select_columns=select_erdkk_columns, dtype=str
+            )
+        except Exception as e:
+            print(f"   ❌ Gagal membaca file: {e}")
+            return pd.DataFrame()
         
+        print(f"   📋 Sheet yang tersedia: {sheet_names}")
         print(f"   📊 Sheet yang digunakan: {used_sheet}")
         print(f"   📊 Dimensi data: {df.shape[0]} baris x {df.shape[1]} kolom")
         
@@ -395,21 +339,15 @@ def process_erdkk_file(file_path, file_name):
                     else:
                         print(f"     {col}: (kosong)")
 
-        results = []
-
-        # Proses setiap baris
-        for idx, row in df.iterrows():
-            row_result = process_single_erdkk_row(row, file_name)
-
-            if row_result:
-                results.append(row_result)
+        # Proses semua baris sekaligus
+        results = process_erdkk_rows(df, file_name)
 
         print(f"   ✅ Berhasil: {len(results)} baris data")
         
         # DEBUG: Tampilkan sample data
-        if results and len(results) > 0:
+        if not results.empty:
             print(f"   🔍 Sample data ERDKK (baris pertama):")
-            sample = results[0]
+            sample = results.iloc[0]
             print(f"     NIK: {sample['NIK']}")
             print(f"     Nama: {sample['NAMA_PETANI'][:20]}...")
             print(f"     Kode Kios: '{sample['KODE_KIOS']}'")
@@ -421,17 +359,16 @@ def process_erdkk_file(file_path, file_name):
     except Exception as e:
         print(f"   ❌ Error memproses ERDKK {file_name}: {str(e)}")
         traceback.print_exc()
-        return []
+        return pd.DataFrame()
 
-def pivot_erdkk_data(all_erdkk_rows):
+def pivot_erdkk_data(erdkk_rows_df):
     """Pivot data ERDKK berdasarkan NIK dan KODE_KIOS dengan duplikasi handling"""
-    if not all_erdkk_rows:
+    if erdkk_rows_df is None or erdkk_rows_df.empty:
         return pd.DataFrame()
 
     print("\n📊 Membuat pivot data ERDKK...")
 
-    # Convert to DataFrame
-    df = pd.DataFrame(all_erdkk_rows)
+    df = erdkk_rows_df.copy()
     
     # Debug: Tampilkan duplikasi sebelum pivot
     duplicate_check = df.duplicated(subset=['NIK', 'KODE_KIOS'], keep=False)
@@ -518,164 +455,117 @@ def clean_column_name(col_name):
     
     return col_clean
 
-def process_single_realisasi_row(row, column_mapping, file_name=""):
-    """Proses satu baris data realisasi dengan cleaning yang konsisten"""
-    result = {
-        'NIK': None,
-        'NAMA_PETANI': '',
-        'KODE_KIOS': '',
-        'NAMA_KIOS': '',
-        'KECAMATAN': '',
-        'REALISASI_UREA': 0,
-        'REALISASI_NPK': 0,
-        'REALISASI_SP36': 0,
-        'REALISASI_ZA': 0,
-        'REALISASI_NPK_FORMULA': 0,
-        'REALISASI_ORGANIK': 0,
-        'REALISASI_ORGANIK_CAIR': 0,
-        'FILE_SOURCE': file_name
-    }
+# Kolom hasil pemrosesan realisasi
+REALISASI_PUPUK_KEYS = {
+    'urea': 'REALISASI_UREA',
+    'npk': 'REALISASI_NPK',
+    'sp36': 'REALISASI_SP36',
+    'za': 'REALISASI_ZA',
+    'npk_formula': 'REALISASI_NPK_FORMULA',
+    'organik': 'REALISASI_ORGANIK',
+    'organik_cair': 'REALISASI_ORGANIK_CAIR'
+}
 
-    try:
-        # 1. AMBIL NIK (wajib)
-        nik_col = column_mapping.get('nik_col')
-        if nik_col and nik_col in row:
-            nik_raw = row[nik_col]
-            nik = clean_nik(nik_raw)
-            if not nik:
-                return None  # Baris tanpa NIK di-skip
-            result['NIK'] = nik
-        
-        if not result['NIK']:
-            return None  # Skip jika tidak ada NIK
-        
-        # 2. AMBIL NAMA PETANI
-        nama_col = column_mapping.get('nama_col')
-        if nama_col and nama_col in row:
-            nama_raw = row[nama_col]
-            if pd.notna(nama_raw):
-                result['NAMA_PETANI'] = str(nama_raw).strip()
-        
-        # 3. AMBIL KODE KIOS dengan cleaning yang sama seperti ERDKK
-        kode_kios_col = column_mapping.get('kode_kios_col')
-        if kode_kios_col and kode_kios_col in row:
-            kode_raw = row[kode_kios_col]
-            result['KODE_KIOS'] = clean_kode_kios(kode_raw)
-        
-        # 4. AMBIL NAMA KIOS
-        nama_kios_col = column_mapping.get('nama_kios_col')
-        if nama_kios_col and nama_kios_col in row:
-            nama_kios_raw = row[nama_kios_col]
-            if pd.notna(nama_kios_raw):
-                result['NAMA_KIOS'] = str(nama_kios_raw).strip()
-        
-        # 5. AMBIL KECAMATAN
-        kecamatan_col = column_mapping.get('kecamatan_col')
-        if kecamatan_col and kecamatan_col in row:
-            kecamatan_raw = row[kecamatan_col]
-            if pd.notna(kecamatan_raw):
-                result['KECAMATAN'] = str(kecamatan_raw).strip().upper()
-        
-        # 6. AMBIL DATA PUPUK
-        pupuk_mapping = {
-            'urea': 'REALISASI_UREA',
-            'npk': 'REALISASI_NPK',
-            'sp36': 'REALISASI_SP36',
-            'za': 'REALISASI_ZA',
-            'npk_formula': 'REALISASI_NPK_FORMULA',
-            'organik': 'REALISASI_ORGANIK',
-            'organik_cair': 'REALISASI_ORGANIK_CAIR'
-        }
-        
-        pupuk_cols_dict = column_mapping.get('pupuk_cols', {})
-        
-        for pupuk_type, result_key in pupuk_mapping.items():
-            if pupuk_type in pupuk_cols_dict:
-                col_name = pupuk_cols_dict[pupuk_type]
-                if col_name in row:
-                    raw_value = row[col_name]
-                    
-                    if pd.notna(raw_value):
-                        try:
-                            # Convert ke numeric dengan handling yang kuat
-                            value = pd.to_numeric(raw_value, errors='coerce')
-                            if pd.notna(value):
-                                result[result_key] = float(value)
-                        except:
-                            pass
-        
-        # 7. Cek apakah ada data pupuk yang valid
-        has_pupuk_data = any([
-            result['REALISASI_UREA'] > 0,
-            result['REALISASI_NPK'] > 0,
-            result['REALISASI_SP36'] > 0,
-            result['REALISASI_ZA'] > 0,
-            result['REALISASI_NPK_FORMULA'] > 0,
-            result['REALISASI_ORGANIK'] > 0,
-            result['REALISASI_ORGANIK_CAIR'] > 0
-        ])
-        
-        if not has_pupuk_data:
+def process_realisasi_rows(df, column_mapping, file_name=""):
+    """Proses semua baris data realisasi sekaligus dengan cleaning yang konsisten"""
+    def mapped_column(col_name):
+        if not col_name or col_name not in df.columns:
             return None
-
-        # Bulatkan nilai
-        for key in ['REALISASI_UREA', 'REALISASI_NPK', 'REALISASI_SP36', 'REALISASI_ZA',
-                   'REALISASI_NPK_FORMULA', 'REALISASI_ORGANIK', 'REALISASI_ORGANIK_CAIR']:
-            result[key] = round(result[key], 2)
-
-        return result
-
-    except Exception as e:
-        print(f"   ⚠️  Error processing realisasi row: {e}")
-        return None
+        column = df[col_name]
+        # Nama kolom ganda: pakai kolom pertama
+        return column.iloc[:, 0] if isinstance(column, pd.DataFrame) else column
+
+    def text_column(col_name, upper=False):
+        column = mapped_column(col_name)
+        if column is None:
+            return pd.Series('', index=df.index, dtype=object)
+        text = column.astype(str).str.strip()
+        if upper:
+            text = text.str.upper()
+        return text.where(column.notna(), '')
+
+    # 1. NIK (wajib), baris tanpa NIK di-skip
+    nik_column = mapped_column(column_mapping.get('nik_col'))
+    if nik_column is None:
+        return pd.DataFrame()
+    
+    nik_series, nik_report = clean_nik_series(nik_column)
+    print_nik_report(nik_report, file_name)
+    result = pd.DataFrame({'NIK': nik_series}, index=df.index)
+    
+    # 2-5. Nama petani, kode kios (cleaning sama seperti ERDKK), nama kios, kecamatan
+    result['NAMA_PETANI'] = text_column(column_mapping.get('nama_col'))
+    kode_column = mapped_column(column_mapping.get('kode_kios_col'))
+    result['KODE_KIOS'] = '' if kode_column is None else clean_kode_kios_series(kode_column)
+    result['NAMA_KIOS'] = text_column(column_mapping.get('nama_kios_col'))
+    result['KECAMATAN'] = text_column(column_mapping.get('kecamatan_col'), upper=True)
+    
+    # 6. Data pupuk, semua kolom dikonversi sekaligus
+    pupuk_cols_dict = column_mapping.get('pupuk_cols', {})
+    for pupuk_type, result_key in REALISASI_PUPUK_KEYS.items():
+        column = mapped_column(pupuk_cols_dict.get(pupuk_type))
+        if column is None:
+            result[result_key] = 0.0
+        else:
+            result[result_key] = pd.to_numeric(column, errors='coerce').fillna(0).astype(float)
+    
+    result['FILE_SOURCE'] = file_name
+    
+    # 7. Hanya baris dengan NIK dan data pupuk yang valid
+    pupuk_keys = list(REALISASI_PUPUK_KEYS.values())
+    valid_mask = result['NIK'].notna() & (result[pupuk_keys] > 0).any(axis=1)
+    result = result[valid_mask].reset_index(drop=True)
+    
+    # Bulatkan nilai (round() Python, np.round bisa berbeda di nilai batas seperti 5.555)
+    for key in pupuk_keys:
+        result[key] = [round(value, 2) for value in result[key].tolist()]
+    
+    return result
 
 def process_realisasi_file(file_path, file_name):
     """Proses satu file realisasi dengan mapping manual"""
     try:
         print(f"\n   📖 Memproses Realisasi: {file_name}")
 
-        # Baca file Excel
+        # Baca file Excel bertahap per batch (memori dibatasi satu batch)
         try:
-            df = pd.read_excel(file_path, dtype=str)
+            _, _, batches = open_excel_batches(file_path)
         except Exception as e1:
             try:
-                df = pd.read_excel(file_path, header=1, dtype=str)
+                batches = iter([read_excel_snapshot(file_path, header=1, dtype=str)])
             except Exception as e2:
-                try:
-                    df = pd.read_excel(file_path, dtype=str, engine='openpyxl')
-                except Exception as e3:
-                    print(f"   ❌ Gagal membaca file: {e3}")
-                    return []
-
-        # Clean column names
-        df.columns = [clean_column_name(col) for col in df.columns]
+                print(f"   ❌ Gagal membaca file: {e2}")
+                return pd.DataFrame()
         
         # Gunakan mapping manual
         column_mapping = get_manual_mapping_for_realisasi(file_name)
         
-        results = []
-        processed_count = 0
-        skipped_count = 0
+        result_frames = []
+        total_rows = 0
         
-        # Proses setiap baris
-        for idx, row in df.iterrows():
-            row_result = process_single_realisasi_row(row, column_mapping, file_name)
-
-            if row_result:
-                results.append(row_result)
-                processed_count += 1
-            else:
-                skipped_count += 1
+        for df in batches:
+            # Clean column names
+            df.columns = [clean_column_name(col) for col in df.columns]
+            total_rows += len(df)
+            
+            # Proses semua baris batch sekaligus
+            batch_result = process_realisasi_rows(df, column_mapping, file_name)
+            if not batch_result.empty:
+                result_frames.append(batch_result)
+        
+        results = pd.concat(result_frames, ignore_index=True) if result_frames else pd.DataFrame()
+        processed_count = len(results)
+        skipped_count = total_rows - processed_count
 
         print(f"\n   📊 Statistik pemrosesan:")
-        print(f"      • Total baris dalam file: {len(df)}")
+        print(f"      • Total baris dalam file: {total_rows}")
         print(f"      • Berhasil diproses: {processed_count}")
         print(f"      • Dilewati: {skipped_count}")
         
         # DEBUG: Tampilkan sample data
-        if results and len(results) > 0:
+        if not results.empty:
             print(f"   🔍 Sample data Realisasi (baris pertama):")
-            sample = results[0]
+            sample = results.iloc[0]
             print(f"     NIK: {sample['NIK']}")
             print(f"     Nama: {sample['NAMA_PETANI'][:20]}...")
             print(f"     Kode Kios: '{sample['KODE_KIOS']}'")
@@ -687,17 +577,16 @@ def process_realisasi_file(file_path, file_name):
     except Exception as e:
         print(f"   ❌ Error memproses realisasi {file_name}: {str(e)}")
         traceback.print_exc()
-        return []
+        return pd.DataFrame()
 
-def pivot_realisasi_data(all_realisasi_rows):
+def pivot_realisasi_data(realisasi_rows_df):
     """Pivot data realisasi berdasarkan NIK dan KODE_KIOS dengan duplikasi handling"""
-    if not all_realisasi_rows:
+    if realisasi_rows_df is None or realisasi_rows_df.empty:
         return pd.DataFrame()
 
     print("\n📊 Membuat pivot data realisasi...")
 
-    # Convert to DataFrame
-    df = pd.DataFrame(all_realisasi_rows)
+    df = realisasi_rows_df.copy()
     
     # Debug: Tampilkan duplikasi sebelum pivot
     duplicate_check = df.duplicated(subset=['NIK', 'KODE_KIOS'], keep=False)
@@ -926,46 +815,33 @@ def cleanup_temp_files(file_paths_list):
 # ============================
 # FUNGSI UTAMA - DIPERBAIKI
 # ============================
-def update_or_create_single_sheet(gc, sheet_url, sheet_name, data_df):
-    """Update atau buat hanya satu sheet (Sisa)"""
+def update_or_create_single_sheet(gc, credentials, sheet_url, sheet_name, data_df):
+    """
+    Update atau buat hanya satu sheet (Sisa).
+    Hanya baris (NIK, KODE_KIOS) yang berubah sejak run sebelumnya yang ditulis
+    (lihat incremental_sheet.py).
+    """
     try:
-        spreadsheet = gc.open_by_url(sheet_url)
-        
-        existing_sheets = spreadsheet.worksheets()
-        existing_sheet_names = [ws.title for ws in existing_sheets]
-        
-        print(f"📋 Sheets yang sudah ada: {existing_sheet_names}")
-        
-        # Hapus sheet lama jika ada
-        if sheet_name in existing_sheet_names:
-            try:
-                worksheet = spreadsheet.worksheet(sheet_name)
-                print(f"📝 Sheet '{sheet_name}' sudah ada, menghapus isi...")
-                worksheet.clear()
-            except Exception as e:
-                print(f"⚠️  Gagal mengakses sheet '{sheet_name}': {e}, membuat baru...")
-                worksheet = spreadsheet.add_worksheet(
-                    title=sheet_name, 
-                    rows=max(len(data_df) + 100, 1000), 
-                    cols=len(data_df.columns) + 5
-                )
-        else:
-            print(f"📝 Sheet '{sheet_name}' tidak ada, membuat baru...")
-            worksheet = spreadsheet.add_worksheet(
-                title=sheet_name, 
-                rows=max(len(data_df) + 100, 1000), 
-                cols=len(data_df.columns) + 5
-            )
+        spreadsheet = rate_limited_call(gc.open_by_url, sheet_url)
+        sheets_service = build('sheets', 'v4', credentials=credentials, cache_discovery=False)
         
         print(f"📤 Mengupdate data ke sheet '{sheet_name}'...")
         
         # Update data
-        data_values = [data_df.columns.values.tolist()] + data_df.values.tolist()
-        worksheet.update(data_values)
+        write_sheet_incremental(
+            sheets_service,
+            spreadsheet.id,
+            sheet_name,
+            data_df,
+            key_columns=['NIK', 'KODE_KIOS'],
+            value_input_option='RAW'
+        )
+        print_rate_limit_report()
         
         # Format header
         try:
-            worksheet.format('A1:K1', {
+            worksheet = rate_limited_call(spreadsheet.worksheet, sheet_name)
+            rate_limited_call(worksheet.format, 'A1:K1', {
                 'backgroundColor': {'red': 0.2, 'green': 0.6, 'blue': 0.8},
                 'textFormat': {'bold': True, 'foregroundColor': {'red': 1.0, 'green': 1.0, 'blue': 1.0}}
             })
@@ -1024,21 +900,22 @@ def process_step_by_step():
         else:
             print(f"✅ Download selesai: {len(erdkk_files)} file")
             
-            all_erdkk_rows = []
+            erdkk_frames = []
             processed_files = 0
             
             for file_info in erdkk_files:
-                file_rows = process_erdkk_file(file_info['path'], file_info['name'])
+                file_df = process_erdkk_file(file_info['path'], file_info['name'])
                 
-                if file_rows:
-                    all_erdkk_rows.extend(file_rows)
+                if not file_df.empty:
+                    erdkk_frames.append(file_df)
                     processed_files += 1
             
-            if all_erdkk_rows:
+            if erdkk_frames:
+                all_erdkk_df = pd.concat(erdkk_frames, ignore_index=True)
                 print(f"\n✅ Total file ERDKK diproses: {processed_files}/{len(erdkk_files)}")
-                print(f"✅ Total baris data ERDKK: {len(all_erdkk_rows)}")
+                print(f"✅ Total baris data ERDKK: {len(all_erdkk_df)}")
                 
-                pivoted_erdkk = pivot_erdkk_data(all_erdkk_rows)
+                pivoted_erdkk = pivot_erdkk_data(all_erdkk_df)
                 
                 if not pivoted_erdkk.empty:
                     print(f"✅ Pivot data ERDKK selesai: {len(pivoted_erdkk)} baris")
@@ -1087,21 +964,22 @@ def process_step_by_step():
         else:
             print(f"✅ Download selesai: {len(realisasi_files)} file")
             
-            all_realisasi_rows = []
+            realisasi_frames = []
             processed_files = 0
             
             for file_info in realisasi_files:
-                file_rows = process_realisasi_file(file_info['path'], file_info['name'])
+                file_df = process_realisasi_file(file_info['path'], file_info['name'])
                 
-                if file_rows:
-                    all_realisasi_rows.extend(file_rows)
+                if not file_df.empty:
+                    realisasi_frames.append(file_df)
                     processed_files += 1
             
-            if all_realisasi_rows:
+            if realisasi_frames:
+                all_realisasi_df = pd.concat(realisasi_frames, ignore_index=True)
                 print(f"\n✅ Total file realisasi diproses: {processed_files}/{len(realisasi_files)}")
-                print(f"✅ Total baris data realisasi: {len(all_realisasi_rows)}")
+                print(f"✅ Total baris data realisasi: {len(all_realisasi_df)}")
                 
-                pivoted_realisasi = pivot_realisasi_data(all_realisasi_rows)
+                pivoted_realisasi = pivot_realisasi_data(all_realisasi_df)
                 
                 if not pivoted_realisasi.empty:
                     print(f"✅ Pivot data realisasi selesai: {len(pivoted_realisasi)} baris")
@@ -1140,7 +1018,7 @@ def process_step_by_step():
             print("=" * 60)
             
             print("\n📤 Export data sisa ke Google Sheets...")
-            update_or_create_single_sheet(gc, OUTPUT_SHEET_URL, "Sisa", sisa_df)
+            update_or_create_single_sheet(gc, credentials, OUTPUT_SHEET_URL, "Sisa", sisa_df)
             
             # Tampilkan statistik akhir
             print(f"\n📊 STATISTIK AKHIR:")
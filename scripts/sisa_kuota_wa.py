@@ -1,8 +1,8 @@
 import os
 import json
 import pandas as pd
+import numpy as np
 import gspread
-import re
 from gspread_dataframe import set_with_dataframe
 from google.oauth2.service_account import Credentials
 from datetime import datetime
@@ -10,9 +10,9 @@ import traceback
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-import time
-import random
 from gspread.exceptions import WorksheetNotFound  # Tambahkan import ini
+from nik_cleaner import clean_nik_series, print_nik_report
+from rate_limiter import rate_limited_call, print_rate_limit_report
 
 # ============================
 # KONFIGURASI
@@ -25,6 +25,17 @@ SOURCE_SHEET_NAME = "Sisa"
 TARGET_SPREADSHEET_ID = "1u6owIr34B5c2aA6FcgncMGUv7AqQHHI--8Z9e-aI_mo"
 TARGET_SHEET_NAME = "Sisa versi Wa"
 
+# Kolom sisa pupuk dan nama yang ditampilkan di teks WA (urutan tampil)
+PUPUK_TYPES = {
+    'SISA_UREA': 'Urea',
+    'SISA_NPK': 'NPK',
+    'SISA_SP36': 'SP36',
+    'SISA_ZA': 'ZA',
+    'SISA_NPK_FORMULA': 'NPK Formula',
+    'SISA_ORGANIK': 'Organik',
+    'SISA_ORGANIK_CAIR': 'Organik Cair'
+}
+
 # ============================
 # KONFIGURASI EMAIL (SECRETS)
 # ============================
@@ -40,22 +51,6 @@ EMAIL_CONFIG = {
     "recipient_emails": [email.strip() for email in RECIPIENT_EMAILS.split(",")] if RECIPIENT_EMAILS else []
 }
 
-# ============================
-# FUNGSI BERSIHKAN NIK
-# ============================
-def clean_nik(nik_value):
-    """Membersihkan NIK dari karakter non-angka"""
-    if pd.isna(nik_value) or nik_value is None:
-        return None
-
-    nik_str = str(nik_value)
-    cleaned_nik = re.sub(r'\D', '', nik_str)
-
-    if len(cleaned_nik) != 16:
-        print(f"⚠️  NIK tidak standar: {nik_value} -> {cleaned_nik} (panjang: {len(cleaned_nik)})")
-
-    return cleaned_nik if cleaned_nik else None
-
 # ============================
 # FUNGSI FORMAT PUPUK
 # ============================
@@ -74,56 +69,61 @@ def format_pupuk_value(value):
     except:
         return "0"
 
-# ============================
-# FUNGSI BUAT TEKS WA PER BARIS - TAMPILKAN SEMUA PUPUK
-# ============================
-def create_wa_text(row, index):
-    """Membuat teks WA untuk satu baris data pupuk - TAMPILKAN SEMUA JENIS PUPUK"""
-    try:
-        # Format nama kios
-        nama_kios = str(row.get('NAMA_KIOS', '')).strip()
-        if not nama_kios:
-            nama_kios = "Kios Tanpa Nama"
-        
-        # Daftar semua jenis pupuk dengan nilai default 0
-        pupuk_types = {
-            'SISA_UREA': 'Urea',
-            'SISA_NPK': 'NPK', 
-            'SISA_SP36': 'SP36',
-            'SISA_ZA': 'ZA',
-            'SISA_NPK_FORMULA': 'NPK Formula',
-            'SISA_ORGANIK': 'Organik',
-            'SISA_ORGANIK_CAIR': 'Organik Cair'
-        }
-        
-        # Ambil semua nilai pupuk, format semua
-        pupuk_data = []
-        for col_key, pupuk_name in pupuk_types.items():
-            value = row.get(col_key, 0)
-            formatted_value = format_pupuk_value(value)
-            pupuk_data.append(f"{pupuk_name} {formatted_value} kg")
-        
-        # Gabungkan semua pupuk
-        pupuk_text = ", ".join(pupuk_data)
-        
-        return f"{index}) {nama_kios} - {pupuk_text}"
-    
-    except Exception as e:
-        print(f"❌ Error creating WA text for row {index}: {e}")
-        return f"{index}) Error processing data"
+def format_pupuk_series(values):
+    """
+    Format satu kolom pupuk sekaligus (hasil sama dengan format_pupuk_value):
+    angka bulat tanpa desimal, selain itu maksimal 2 desimal tanpa nol di belakang.
+    """
+    numeric = pd.to_numeric(values, errors='coerce').astype(float)
+    formatted = pd.Series("0", index=values.index, dtype=object)
+
+    # Angka biasa diformat per kolom
+    is_regular = numeric.notna() & np.isfinite(numeric) & (numeric.abs() < 1e15)
+    is_integer = is_regular & (numeric == np.floor(numeric))
+    is_decimal = is_regular & ~is_integer
+    formatted[is_integer] = numeric[is_integer].astype('int64').astype(str)
+    if is_decimal.any():
+        decimal_text = pd.Series(np.char.mod('%.2f', numeric[is_decimal].to_numpy()), index=numeric[is_decimal].index)
+        formatted[is_decimal] = decimal_text.str.rstrip('0').str.rstrip('.')
+
+    # Nilai lain (teks, inf, angka sangat besar) lewat format_pupuk_value
+    is_other = ~is_regular & values.notna()
+    if is_other.any():
+        formatted[is_other] = values[is_other].map(format_pupuk_value)
+
+    return formatted
 
 # ============================
-# FUNGSI BUAT TEKS WA UTAMA
+# FUNGSI BUAT TEKS WA PER NIK - TAMPILKAN SEMUA PUPUK
 # ============================
-def create_complete_wa_text(wa_items):
-    """Membuat teks WA lengkap dengan header"""
-    if not wa_items:
-        return "Sisa kuota anda :\nTidak ada data sisa kuota"
-    
-    header = "Sisa kuota anda :"
-    items_text = "\n".join(wa_items)
-    
-    return f"{header}\n{items_text}"
+def create_wa_texts(df_sorted):
+    """
+    Membuat teks WA lengkap untuk semua NIK sekaligus (TAMPILKAN SEMUA JENIS PUPUK).
+    df_sorted harus sudah diurutkan per NIK; baris dinomori per NIK dengan cumcount.
+    Mengembalikan DataFrame kolom NIK, NAMA_PETANI, DATA.
+    """
+    # Format nama kios
+    nama_kios = df_sorted['NAMA_KIOS'].fillna('nan').astype(str).str.strip()
+    nama_kios = nama_kios.where(nama_kios != '', "Kios Tanpa Nama")
+
+    # Format semua nilai pupuk lalu gabungkan
+    pupuk_text = None
+    for col_key, pupuk_name in PUPUK_TYPES.items():
+        values = df_sorted[col_key] if col_key in df_sorted.columns else pd.Series(0, index=df_sorted.index)
+        item_text = pupuk_name + " " + format_pupuk_series(values) + " kg"
+        pupuk_text = item_text if pupuk_text is None else pupuk_text + ", " + item_text
+
+    nomor = df_sorted.groupby('NIK').cumcount() + 1
+    wa_items = nomor.astype(str) + ") " + nama_kios + " - " + pupuk_text
+
+    data_per_nik = wa_items.groupby(df_sorted['NIK']).agg("\n".join)
+    nama_petani = df_sorted.drop_duplicates('NIK').set_index('NIK')['NAMA_PETANI'].reindex(data_per_nik.index)
+
+    return pd.DataFrame({
+        'NIK': data_per_nik.index.tolist(),
+        'NAMA_PETANI': nama_petani.fillna("").astype(str).str.strip().tolist(),
+        'DATA': ("Sisa kuota anda :\n" + data_per_nik).tolist()
+    }, columns=['NIK', 'NAMA_PETANI', 'DATA'])
 
 # ============================
 # FUNGSI KIRIM EMAIL
@@ -194,18 +194,8 @@ def send_email_notification(subject, message, is_success=True):
 # FUNGSI DENGAN EXPONENTIAL BACKOFF
 # ============================
 def execute_with_backoff(func, *args, max_retries=5, **kwargs):
-    """Menjalankan fungsi dengan exponential backoff untuk menghindari rate limit"""
-    for retry in range(max_retries):
-        try:
-            return func(*args, **kwargs)
-        except Exception as e:
-            if "429" in str(e) and retry < max_retries - 1:
-                wait_time = (2 ** retry) + random.random()
-                print(f"⚠️  Rate limit terdeteksi, retry {retry+1}/{max_retries} dalam {wait_time:.2f} detik...")
-                time.sleep(wait_time)
-            else:
-                raise e
-    return None
+    """Menjalankan fungsi lewat rate limiter bersama (menunggu sesuai quota, retry 429 dengan Retry-After)"""
+    return rate_limited_call(func, *args, max_retries=max_retries, **kwargs)
 
 # ============================
 # FUNGSI PROSES DATA DENGAN ERROR HANDLING
@@ -302,7 +292,8 @@ def process_sisa_kuota_wa():
         # Bersihkan NIK
         print("\n🧹 Membersihkan NIK...")
         df['NIK_ORIGINAL'] = df['NIK'].copy()
-        df['NIK'] = df['NIK'].apply(clean_nik)
+        df['NIK'], nik_report = clean_nik_series(df['NIK'])
+        print_nik_report(nik_report)
         
         # Hapus baris dengan NIK kosong
         initial_count = len(df)
@@ -314,49 +305,12 @@ def process_sisa_kuota_wa():
         # ============================================
         print("\n📊 Membuat rekap data per NIK...")
         
-        output_rows = []
-        
         df_sorted = df.sort_values(['NIK', 'NAMA_KIOS']).reset_index(drop=True)
-        nik_groups = df_sorted.groupby('NIK')
-        total_nik = len(nik_groups)
+        total_nik = df_sorted['NIK'].nunique()
         
         print(f"   • Total NIK unik: {total_nik}")
         
-        for nik_idx, (nik, group) in enumerate(nik_groups, start=1):
-            try:
-                nama_petani = ""
-                if len(group) > 0:
-                    nama_petani = group['NAMA_PETANI'].iloc[0]
-                    if pd.isna(nama_petani):
-                        nama_petani = ""
-                
-                nama_petani = str(nama_petani).strip()
-                
-                wa_items = []
-                for idx, (_, row) in enumerate(group.iterrows(), start=1):
-                    wa_text = create_wa_text(row, idx)
-                    wa_items.append(wa_text)
-                
-                complete_wa_text = create_complete_wa_text(wa_items)
-                
-                output_rows.append({
-                    'NIK': nik,
-                    'NAMA_PETANI': nama_petani,
-                    'DATA': complete_wa_text
-                })
-                
-                if nik_idx % 10 == 0 or nik_idx == total_nik:
-                    print(f"   • Diproses: {nik_idx}/{total_nik} NIK")
-                    
-            except Exception as e:
-                print(f"❌ Error processing NIK {nik}: {e}")
-                output_rows.append({
-                    'NIK': nik,
-                    'NAMA_PETANI': 'ERROR',
-                    'DATA': f'Error processing data for NIK {nik}'
-                })
-        
-        output_df = pd.DataFrame(output_rows, columns=['NIK', 'NAMA_PETANI', 'DATA'])
+        output_df = create_wa_texts(df_sorted)
         print(f"✅ Rekap selesai: {len(output_df)} NIK unik")
         
         # ============================================
@@ -411,21 +365,7 @@ def process_sisa_kuota_wa():
                 row_range = f'A{i+1}:{end_column}{i+1}'
                 row_data = [data_to_write[i]]
                 
-                for retry in range(5):
-                    try:
-                        target_worksheet.update(values=row_data, range_name=row_range)
-                        break
-                    except Exception as inner_e:
-                        if "429" in str(inner_e) and retry < 4:
-                            wait_time = (2 ** retry) + random.random()
-                            print(f"     ⚠️  Rate limit pada baris {i+1}, retry {retry+1} dalam {wait_time:.2f} detik...")
-                            time.sleep(wait_time)
-                        else:
-                            raise inner_e
-                
-                # Jeda kecil antar baris
-                if i % 20 == 0 and i > 0:
-                    time.sleep(1)
+                execute_with_backoff(target_worksheet.update, values=row_data, range_name=row_range)
             
             print(f"✅ Data berhasil ditulis (metode fallback): {len(output_df)} baris")
         
@@ -448,6 +388,7 @@ def process_sisa_kuota_wa():
         
         end_time = datetime.now()
         duration = end_time - start_time
+        print_rate_limit_report()
         
         total_rows = len(df)
         unique_nik = len(output_df)
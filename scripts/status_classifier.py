@@ -0,0 +1,57 @@
+"""
+status_classifier.py
+Klasifikasi kolom STATUS per nilai unik.
+Kolom STATUS hanya berisi beberapa jenis teks status yang berulang di ratusan
+ribu baris, sehingga fungsi klasifikasi (klasifikasikan_status,
+is_status_disetujui_pusat, ...) cukup dijalankan sekali per status unik:
+kolom diubah menjadi categorical, setiap kategori diklasifikasi satu kali,
+lalu hasilnya dipetakan kembali ke semua baris lewat kode kategori.
+
+Hasil klasifikasi disimpan per fungsi selama proses berjalan, sehingga
+status yang sama di file berikutnya tidak diklasifikasi ulang.
+
+Lokasi: verval-pupuk2/scripts/status_classifier.py
+"""
+
+import numpy as np
+import pandas as pd
+
+# Cache hasil klasifikasi: fungsi klasifikasi -> {nilai status: hasil}
+_CLASSIFICATION_CACHE = {}
+
+# Key cache untuk status kosong (NaN/None)
+_MISSING = object()
+
+
+# ============================
+# FUNGSI BANTU
+# ============================
+def classify_value(classifier, status_value):
+    """Klasifikasi satu nilai status dengan cache"""
+    cache = _CLASSIFICATION_CACHE.setdefault(classifier, {})
+    key = _MISSING if pd.isna(status_value) else status_value
+    if key not in cache:
+        cache[key] = classifier(np.nan if key is _MISSING else status_value)
+    return cache[key]
+
+
+# ============================
+# FUNGSI UTAMA
+# ============================
+def classify_status(status_values, classifier):
+    """
+    Pengganti status_values.apply(classifier): classifier hanya dipanggil
+    sekali per status unik (termasuk status kosong).
+    Mengembalikan Series dengan index yang sama dengan status_values.
+    """
+    if isinstance(status_values.dtype, pd.CategoricalDtype):
+        status = status_values
+    else:
+        status = status_values.astype('category')
+
+    # Hasil per kategori, posisi terakhir untuk status kosong (kode -1)
+    labels = [classify_value(classifier, category) for category in status.cat.categories]
+    labels.append(classify_value(classifier, np.nan))
+
+    codes = status.cat.codes.to_numpy()
+    return pd.Series(np.array(labels)[codes], index=status_values.index)
@@ -19,6 +19,10 @@ from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload
 
+from drive_cache import cache_lookup, cache_store, prune_cache
+from excel_snapshot import read_excel_sheet
+from nik_cleaner import clean_nik_series, print_nik_report
+
 # =====================================================
 # KONFIGURASI
 # =====================================================
@@ -42,9 +46,6 @@ SCOPES = [
 def log(msg):
     print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] {msg}")
 
-def clean_nik(series):
-    return series.astype(str).str.replace(r"\D", "", regex=True).str.strip()
-
 def find_column(df, keywords):
     for col in df.columns:
         col_u = col.upper()
@@ -141,47 +142,72 @@ def init_gspread():
 def list_excel_files(drive, folder_id):
     res = drive.files().list(
         q=f"'{folder_id}' in parents and mimeType='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'",
-        fields="files(id,name)"
+        fields="files(id,name,modifiedTime,md5Checksum)"
     ).execute()
     return res.get("files", [])
 
-def download_excel(drive, file_id):
-    request = drive.files().get_media(fileId=file_id)
+def download_excel(drive, file):
+    cached_path = cache_lookup(file)
+    if cached_path:
+        log(f"♻️ {file['name']} tidak berubah, dibaca dari cache")
+        with open(cached_path, "rb") as f:
+            return io.BytesIO(f.read())
+
+    request = drive.files().get_media(fileId=file["id"])
     fh = io.BytesIO()
     downloader = MediaIoBaseDownload(fh, request)
     done = False
     while not done:
         _, done = downloader.next_chunk()
+    cache_store(file, data=fh.getvalue())
     fh.seek(0)
     return fh
 
 # =====================================================
 # LOAD DATA
 # =====================================================
+def select_erdkk_columns(columns):
+    # Hanya NIK/KTP, GAPOKTAN (Kecamatan) dan kolom terakhir (Desa) yang dipakai
+    last = len(columns) - 1
+    return [
+        col for i, col in enumerate(columns)
+        if i == last or any(kw in str(col).upper() for kw in ["KTP", "NIK", "GAPOKTAN"])
+    ]
+
+def select_realisasi_columns(columns):
+    return [col for col in columns if col in ("NIK", "TGL INPUT")]
+
 def load_erdkk(drive):
     frames = []
     for f in list_excel_files(drive, ERDKK_FOLDER_ID):
-        frames.append(pd.read_excel(download_excel(drive, f["id"]), dtype=str))
+        df, _, _ = read_excel_sheet(
+            download_excel(drive, f), select_columns=select_erdkk_columns, dtype=str
+        )
+        frames.append(df)
 
     df = pd.concat(frames, ignore_index=True)
 
     nik_col = find_column(df, ["KTP", "NIK"])
     df.rename(columns={nik_col: "NIK"}, inplace=True)
-    df["NIK"] = clean_nik(df["NIK"])
+    df["NIK"], nik_report = clean_nik_series(df["NIK"])
+    print_nik_report(nik_report, "ERDKK")
     return df
 
 def load_realisasi(drive):
     frames, tgl_inputs = [], []
 
     for f in list_excel_files(drive, REALISASI_FOLDER_ID):
-        df = pd.read_excel(download_excel(drive, f["id"]), dtype=str)
+        df, _, _ = read_excel_sheet(
+            download_excel(drive, f), select_columns=select_realisasi_columns, dtype=str
+        )
         if "TGL INPUT" in df.columns:
             df["TGL INPUT"] = pd.to_datetime(df["TGL INPUT"], errors="coerce")
             tgl_inputs.append(df["TGL INPUT"].max())
         frames.append(df)
 
     df = pd.concat(frames, ignore_index=True)
-    df["NIK"] = clean_nik(df["NIK"])
+    df["NIK"], nik_report = clean_nik_series(df["NIK"])
+    print_nik_report(nik_report, "Realisasi")
 
     latest = max([t for t in tgl_inputs if pd.notna(t)])
     return df, latest
@@ -197,6 +223,7 @@ def main():
 
     erdkk = load_erdkk(drive)
     realisasi, latest_input = load_realisasi(drive)
+    prune_cache()
 
     belum = erdkk[~erdkk["NIK"].isin(set(realisasi["NIK"].dropna()))].copy()
 